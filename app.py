@@ -7,7 +7,9 @@ from loguru import logger
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 
+from cisticola import compression
 from cisticola.base import mapper_registry
+from cisticola.migrations import migrate
 from cisticola.scraper import (
     BitchuteScraper,
     GettrScraper,
@@ -38,7 +40,7 @@ def get_db_session():
 def get_scraper_controller(args):
     engine = create_engine(os.environ["DB"])
 
-    controller = ScraperController()
+    controller = ScraperController(compress_raw_data=args.compress_raw_data)
     controller.connect_to_db(engine)
 
     if args.telethon_session:
@@ -95,6 +97,13 @@ def scrape_channels_old(args):
     controller.scrape_all_channels(fetch_old=True)
 
 
+def scrape_channels_scheduled(args):
+    logger.info("Scraping channels as they become due")
+
+    controller = get_scraper_controller(args)
+    controller.scrape_channels_continuously()
+
+
 def scrape_channel_info(args):
     logger.info("Scraping channel info")
 
@@ -142,11 +151,38 @@ def transform_media(args):
     controller.transform_all_untransformed_media()
 
 
+def train_compression_dictionary(args):
+    engine = create_engine(os.environ["DB"])
+    compression.train_dictionary(engine, args.platform)
+
+
+def compress_raw_data(args):
+    engine = create_engine(os.environ["DB"])
+    compressed = compression.compress_raw_posts(engine, platform=args.platform)
+    logger.info(f"Compressed {compressed} raw posts")
+
+
+def decompress_raw_data(args):
+    engine = create_engine(os.environ["DB"])
+    decompressed = compression.decompress_raw_posts(engine, platform=args.platform)
+    logger.info(f"Decompressed {decompressed} raw posts")
+
+
+def benchmark_compression(args):
+    engine = create_engine(os.environ["DB"])
+    compression.benchmark(engine, args.platform)
+
+
 def init_db():
     engine = create_engine(os.environ["DB"])
     mapper_registry.metadata.create_all(bind=engine)
 
 
+def migrate_db():
+    engine = create_engine(os.environ["DB"])
+    migrate(engine)
+
+
 if __name__ == "__main__":
     logger.remove()
     logger.add(sys.stdout, level="DEBUG", catch=True)
@@ -163,11 +199,30 @@ if __name__ == "__main__":
     parser.add_argument("--chronological", action="store_true")
     parser.add_argument("--telethon_session", type=str)
     parser.add_argument("--min_date", type=str)
+    parser.add_argument(
+        "--compress_raw_data",
+        action="store_true",
+        help="[scrape-channels*] Store the raw data of scraped posts compressed",
+    )
+    parser.add_argument(
+        "--platform",
+        type=str,
+        help="[*compress*] Platform of the raw posts, e.g. Telegram",
+    )
 
     args = parser.parse_args()
 
     if args.command == "init-db":
         init_db()
+    elif args.command == "migrate-db":
+        logger.add(
+            "logs/migrate-db.log",
+            level="DEBUG",
+            rotation="100 MB",
+            retention="2 weeks",
+            compression="zip",
+        )
+        migrate_db()
     elif args.command == "sync-channels":
         logger.add(
             "logs/sync-channels.log",
@@ -195,6 +250,15 @@ if __name__ == "__main__":
             compression="zip",
         )
         scrape_channels_old(args)
+    elif args.command == "scrape-channels-scheduled":
+        logger.add(
+            "logs/scrape-channels-scheduled.log",
+            level="DEBUG",
+            rotation="100 MB",
+            retention="2 weeks",
+            compression="zip",
+        )
+        scrape_channels_scheduled(args)
     elif args.command == "archive-media":
         logger.add(
             "logs/archive-media.log",
@@ -241,5 +305,27 @@ if __name__ == "__main__":
             compression="zip",
         )
         transform_media(args)
+    elif args.command == "train-compression-dictionary":
+        train_compression_dictionary(args)
+    elif args.command == "compress-raw-data":
+        logger.add(
+            "logs/compress-raw-data.log",
+            level="DEBUG",
+            rotation="100 MB",
+            retention="2 weeks",
+            compression="zip",
+        )
+        compress_raw_data(args)
+    elif args.command == "decompress-raw-data":
+        logger.add(
+            "logs/decompress-raw-data.log",
+            level="DEBUG",
+            rotation="100 MB",
+            retention="2 weeks",
+            compression="zip",
+        )
+        decompress_raw_data(args)
+    elif args.command == "benchmark-compression":
+        benchmark_compression(args)
     else:
         logger.error(f"Unrecognized command {args.command}")
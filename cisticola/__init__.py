@@ -1 +1 @@
-from . import base, scraper, transformer
+from . import base, compression, scraper, transformer
@@ -1,6 +1,7 @@
 import io
 import json
 import re
+import string
 import tempfile
 from dataclasses import dataclass, field
 from datetime import datetime
@@ -15,23 +16,87 @@ from langdetect.lang_detect_exception import LangDetectException
 from loguru import logger
 from sqlalchemy import (
     JSON,
+    BigInteger,
     Boolean,
     Column,
     DateTime,
+    Float,
     ForeignKey,
     Index,
     Integer,
+    LargeBinary,
     String,
     Table,
+    Text,
+    case,
+    cast,
+    func,
+    literal,
+    null,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import registry
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.types import TypeDecorator
 
 from .utils import make_request
 
 # Disable decompression bomb check
 PIL.Image.MAX_IMAGE_PIXELS = 1024 * 1024 * 256
 
+#: Host of a URL, after its optional scheme. The same patterns are used in
+#: Python and in Postgres (see :py:func:`normalized_url_expression`), so they
+#: only use syntax that both support.
+URL_HOST_PATTERN = r"^(?:[A-Za-z][A-Za-z0-9+.-]*://)?([^/?#]*)"
+
+#: Path and query of a URL, i.e. what follows its host, without its fragment
+URL_PATH_PATTERN = r"^(?:[A-Za-z][A-Za-z0-9+.-]*://)?[^/?#]*([^#]*)"
+
+_url_host_regex = re.compile(URL_HOST_PATTERN)
+_url_path_regex = re.compile(URL_PATH_PATTERN)
+
+# only ASCII letters are lowercased, like ``translate`` in Postgres and unlike
+# ``lower``, which depends on the collation of the database
+_ascii_lowercase = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def normalize_url(url: str) -> str:
+    """Normalize the URL of a channel, so that URLs of the same channel written
+    differently are the same key: the scheme is ``https``, the host is lowercase
+    (ASCII letters only) and without ``www.``, and the fragment and trailing
+    slashes are removed, e.g. ``"http://www.Gab.com/marc_capt/"`` becomes
+    ``"https://gab.com/marc_capt"``. The path is kept as it is, as it is
+    case-sensitive on some platforms.
+    """
+
+    host = _url_host_regex.match(url).group(1).translate(_ascii_lowercase)
+    if host.startswith("www."):
+        host = host[4:]
+
+    return "https://" + host + _url_path_regex.match(url).group(1).rstrip("/")
+
+
+def normalized_url_expression(url) -> ColumnElement:
+    """SQL expression of :py:func:`normalize_url` applied to the ``url`` column."""
+
+    host = func.regexp_replace(
+        func.translate(
+            func.substring(url, URL_HOST_PATTERN),
+            string.ascii_uppercase,
+            string.ascii_lowercase,
+        ),
+        r"^www\.",
+        "",
+    )
+    path = func.rtrim(func.substring(url, URL_PATH_PATTERN), "/")
+
+    return literal("https://", String) + host + path
+
+
+#: Normalized URL of the channel list of Telegram, which does not identify a
+#: channel
+TELEGRAM_CHANNEL_LIST_URL = normalize_url("https://t.me/s/")
+
 
 @dataclass
 class ScraperResult:
@@ -64,6 +129,11 @@ class ScraperResult:
     #: What date was the media archived? (None if not archived)
     media_archived: Optional[datetime]
 
+    #: ``raw_data`` compressed with zstd, if it is stored compressed (see
+    #: :py:mod:`cisticola.compression`). It is decompressed into ``raw_data``
+    #: when the result is loaded from the database.
+    raw_data_compressed: Optional[bytes] = None
+
 
 @dataclass
 class Channel:
@@ -108,6 +178,25 @@ class Channel:
     def hydrate(self):
         pass
 
+    def identity_keys(self) -> list:
+        """Normalized ``(kind, value)`` pairs that identify the channel on its
+        platform, in order of precedence, e.g. ``[("url", "https://t.me/s/durov"), ("screenname", "durov")]``.
+        URLs are normalized with :py:func:`normalize_url`.
+        """
+
+        keys = []
+
+        if self.url not in (None, ""):
+            url = normalize_url(self.url)
+            if url != TELEGRAM_CHANNEL_LIST_URL:
+                keys.append(("url", url))
+        if self.platform_id not in (None, ""):
+            keys.append(("platform_id", str(self.platform_id)))
+        if self.screenname not in (None, ""):
+            keys.append(("screenname", self.screenname.lower()))
+
+        return keys
+
 
 @dataclass
 class RawChannelInfo:
@@ -472,6 +561,103 @@ class Audio(Media):
     pass
 
 
+#: An escaped NUL character in a JSON document, i.e. ``\\u0000`` preceded by an
+#: even number of backslashes (so not e.g. an escaped backslash followed by a
+#: literal ``u0000``). The preceding backslashes are captured so they can be kept.
+JSON_NUL_PATTERN = r"(?<!\\)((?:\\\\)*)\\u0000"
+
+_json_nul_regex = re.compile(JSON_NUL_PATTERN)
+
+
+def strip_json_nul(value: str) -> str:
+    """Remove escaped NUL characters, which JSONB cannot store, from a JSON
+    document without touching any other escape sequence.
+    """
+
+    if "u0000" not in value:
+        return value
+
+    return _json_nul_regex.sub(r"\1", value)
+
+
+class RawJSON(TypeDecorator):
+    """JSONB column type for raw scraped data.
+
+    Values are written and read as JSON strings (as produced by the scrapers
+    and consumed by the transformers), while the database stores them as JSONB
+    so that individual keys can be indexed, filtered on and projected on the
+    server (see :py:func:`raw_data_projection`). None is stored as SQL null, e.g.
+    for raw posts stored compressed.
+    """
+
+    impl = JSONB(none_as_null=True)
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        impl_processor = self.impl_instance.bind_processor(dialect)
+
+        def process(value):
+            if not isinstance(value, str) and impl_processor is not None:
+                value = impl_processor(value)
+            if isinstance(value, str):
+                value = strip_json_nul(value)
+            return value
+
+        return process
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+    def column_expression(self, colexpr):
+        return cast(colexpr, Text)
+
+
+def raw_data_projection(entity, fields) -> ColumnElement:
+    """Expression that extracts only the specified top-level keys of the
+    ``raw_data`` column on the database server, as a JSON string that can be
+    used in place of ``raw_data``, e.g.
+    ``session.query(ScraperResult.id, raw_data_projection(ScraperResult, ["video_url"]).label("raw_data"))``.
+
+    The keys of raw posts stored compressed (see :py:mod:`cisticola.compression`)
+    cannot be extracted on the server, and the expression is null for them. The
+    ``raw_data_compressed`` column must be selected along with it, and
+    decompressed in Python for these rows.
+
+    Parameters
+    ----------
+    entity:
+        ORM-mapped class or table with ``raw_data`` and ``raw_data_compressed``
+        columns, e.g. ``ScraperResult``
+    fields: list[str]
+        Top-level keys of the raw data to extract
+
+    Returns
+    -------
+    ColumnElement
+        JSON string of the object with the keys of ``fields`` (null for keys
+        missing from the raw data), or null if the raw data is compressed or
+        ``fields`` is empty.
+    """
+
+    columns = entity.c if isinstance(entity, Table) else entity
+
+    if len(fields) == 0:
+        return null()
+
+    projection = func.jsonb_build_object(
+        *(
+            argument
+            for field in fields
+            for argument in (literal(field), columns.raw_data[field])
+        )
+    )
+
+    return case(
+        (columns.raw_data_compressed == None, cast(projection, Text)),
+        else_=null(),
+    )
+
+
 mapper_registry = registry()
 
 raw_posts_table = Table(
@@ -489,10 +675,42 @@ raw_posts_table = Table(
     Column("channel", Integer, ForeignKey("channels.id"), index=True),
     Column("platform_id", String, index=True),
     Column("date", DateTime, index=True),
-    Column("raw_data", String),
+    Column("raw_data", RawJSON),
     Column("date_archived", DateTime, index=True),
     Column("archived_urls", JSON),
     Column("media_archived", DateTime, index=True),
+    Column(
+        "raw_data_compressed",
+        LargeBinary,
+        doc="``raw_data`` compressed with zstd, in which case ``raw_data`` is null.",
+    ),
+)
+
+raw_data_dictionary_table = Table(
+    "raw_data_dictionaries",
+    mapper_registry.metadata,
+    Column(
+        "id",
+        BigInteger,
+        primary_key=True,
+        autoincrement=False,
+        doc="zstd ID of the dictionary, stored in the data compressed with it.",
+    ),
+    Column("platform", String, nullable=False, index=True),
+    Column(
+        "dictionary",
+        LargeBinary,
+        nullable=False,
+        doc="zstd dictionary trained on raw posts of the platform.",
+    ),
+    Column("date_created", DateTime, nullable=False),
+)
+
+# index for the most recent and oldest posts of a channel, and its recent post count
+raw_posts_channel_date_index = Index(
+    "raw_posts_channel_date_idx",
+    raw_posts_table.c.channel,
+    raw_posts_table.c.date,
 )
 
 raw_channel_info_table = Table(
@@ -507,10 +725,16 @@ raw_channel_info_table = Table(
     Column("scraper", String),
     Column("platform", String),
     Column("channel", Integer, ForeignKey("channels.id"), index=True),
-    Column("raw_data", String),
+    Column("raw_data", RawJSON),
     Column("date_archived", DateTime, index=True),
 )
 
+raw_channel_info_name_index = Index(
+    "raw_channel_info_platform_name_idx",
+    raw_channel_info_table.c.platform,
+    raw_channel_info_table.c.raw_data["name"].astext,
+)
+
 channel_info_table = Table(
     "channel_info",
     mapper_registry.metadata,
@@ -576,6 +800,125 @@ channel_table = Table(
     Column("source", String),
 )
 
+# indexes for the channel lookups made while transforming posts
+channels_platform_screenname_index = Index(
+    "channels_platform_lower_screenname_idx",
+    channel_table.c.platform,
+    func.lower(channel_table.c.screenname),
+)
+
+channels_platform_url_index = Index(
+    "channels_platform_normalized_url_idx",
+    channel_table.c.platform,
+    normalized_url_expression(channel_table.c.url),
+)
+
+channels_platform_platform_id_index = Index(
+    "channels_platform_platform_id_idx",
+    channel_table.c.platform,
+    channel_table.c.platform_id,
+)
+
+#: Expressions on the ``channels`` table corresponding to each kind of key
+#: returned by :py:meth:`Channel.identity_keys`
+channel_identity_columns = {
+    "url": normalized_url_expression(channel_table.c.url),
+    "platform_id": channel_table.c.platform_id,
+    "screenname": func.lower(channel_table.c.screenname),
+}
+
+channel_identity_table = Table(
+    "channel_identities",
+    mapper_registry.metadata,
+    Column(
+        "id",
+        Integer,
+        primary_key=True,
+        autoincrement=True,
+        doc="Unique numerical ID of the channel identity key.",
+    ),
+    Column("platform", String, nullable=False),
+    Column(
+        "kind",
+        String,
+        nullable=False,
+        doc='Kind of key, one of ``"url"``, ``"platform_id"`` or ``"screenname"``.',
+    ),
+    Column("value", String, nullable=False, doc="Normalized value of the key."),
+    Column(
+        "channel",
+        Integer,
+        ForeignKey("channels.id"),
+        nullable=False,
+        index=True,
+        doc="Primary key of the ``channels`` table corresponding to the channel identified by the key",
+    ),
+)
+
+channel_identity_key_index = Index(
+    "channel_identities_key_idx",
+    channel_identity_table.c.platform,
+    channel_identity_table.c.kind,
+    channel_identity_table.c.value,
+    unique=True,
+)
+
+profile_cache_table = Table(
+    "profile_cache",
+    mapper_registry.metadata,
+    Column("platform", String, primary_key=True),
+    Column(
+        "username",
+        String,
+        primary_key=True,
+        doc="Lowercase username the profile was requested for.",
+    ),
+    Column(
+        "profile",
+        JSONB(none_as_null=True),
+        doc="Profile returned by the platform, or null if the lookup failed.",
+    ),
+    Column("date_fetched", DateTime, nullable=False),
+)
+
+scrape_cursor_table = Table(
+    "scrape_cursors",
+    mapper_registry.metadata,
+    Column("channel", Integer, ForeignKey("channels.id"), primary_key=True),
+    Column(
+        "scraper",
+        String,
+        primary_key=True,
+        doc='Name of the scraper the cursor belongs to, without version, e.g. ``"BitchuteScraper"``.',
+    ),
+    Column(
+        "cursor",
+        JSONB(none_as_null=True),
+        doc="Scraper-specific pagination state of the channel, e.g. the listing offset a backfill stopped at.",
+    ),
+    Column("date_updated", DateTime, nullable=False),
+)
+
+channel_schedule_table = Table(
+    "channel_schedule",
+    mapper_registry.metadata,
+    Column("channel", Integer, ForeignKey("channels.id"), primary_key=True),
+    Column(
+        "post_rate",
+        Float,
+        nullable=False,
+        doc="Number of posts per day of the channel, estimated from its recent posts.",
+    ),
+    Column("date_scraped", DateTime, nullable=False),
+    Column(
+        "date_due",
+        DateTime,
+        nullable=False,
+        index=True,
+        doc="Date the channel should be scraped again, based on its posting rate.",
+    ),
+)
+
 post_table = Table(
     "posts",
     mapper_registry.metadata,
@@ -621,6 +964,13 @@ posts_forwarded_from_channel_index = Index(
     post_table.c.forwarded_from,
 )
 
+# index for looking up replied-to posts (and threading comments)
+posts_channel_platform_id_index = Index(
+    "posts_channel_platform_id_idx",
+    post_table.c.channel,
+    post_table.c.platform_id,
+)
+
 media_table = Table(
     "media",
     mapper_registry.metadata,
@@ -0,0 +1,428 @@
+"""Optional zstd compression of the ``raw_data`` of raw posts.
+
+Compression is opt-in: raw posts are stored compressed only by a
+:py:class:`cisticola.scraper.ScraperController` created with
+``compress_raw_data=True``, or by :py:func:`compress_raw_posts`. Their
+``raw_data`` is then null and ``raw_data_compressed`` holds the zstd frame,
+compressed with the most recent dictionary trained for the platform (see
+:py:func:`train_dictionary`), if any. Compressed results are decompressed
+transparently when ``ScraperResult`` objects are loaded or refreshed, and
+:py:func:`decompress_raw_posts` restores the plain JSONB column.
+
+Requires the ``zstandard`` package.
+"""
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import bindparam, event, func, insert, select, update
+from sqlalchemy.engine.base import Engine
+from sqlalchemy.orm.attributes import set_committed_value
+
+from cisticola.base import ScraperResult, raw_data_dictionary_table, raw_posts_table
+from cisticola.utils import decode_json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+#: zstd compression level of raw data. Decompression speed does not depend on it.
+COMPRESSION_LEVEL = 12
+
+#: Size in bytes of the dictionaries trained by :py:func:`train_dictionary`
+DICTIONARY_SIZE = 112640
+
+_codecs = {}
+_codecs_lock = threading.Lock()
+
+
+class RawDataCodec:
+    """Compresses and decompresses raw data, using the dictionaries saved in the
+    ``raw_data_dictionaries`` table of a database. Can be shared by threads.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Database the dictionaries are loaded from
+    level: int
+        zstd compression level
+    """
+
+    def __init__(self, engine: Engine, level: int = COMPRESSION_LEVEL):
+        if zstandard is None:
+            raise ImportError("The zstandard package is required to compress raw data")
+
+        self.engine = engine
+        self.level = level
+
+        # dictionaries by zstd ID, and ID of the most recent one of each platform
+        self.dictionaries = {}
+        self.platform_dictionaries = {}
+        self.lock = threading.Lock()
+
+        # zstd (de)compressors cannot be used by several threads at once
+        self.local = threading.local()
+
+        self.load_dictionaries()
+
+    def load_dictionaries(self):
+        """Load all dictionaries from the database."""
+
+        with self.engine.connect() as connection:
+            rows = connection.execute(
+                select(raw_data_dictionary_table).order_by(
+                    raw_data_dictionary_table.c.date_created
+                )
+            ).all()
+
+        with self.lock:
+            for row in rows:
+                self.dictionaries[row.id] = zstandard.ZstdCompressionDict(
+                    row.dictionary
+                )
+                self.platform_dictionaries[row.platform] = row.id
+
+    def _compressor(self, dictionary_id: int):
+        compressors = self.local.__dict__.setdefault("compressors", {})
+
+        if dictionary_id not in compressors:
+            compressors[dictionary_id] = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self.dictionaries.get(dictionary_id)
+            )
+
+        return compressors[dictionary_id]
+
+    def _decompressor(self, dictionary_id: int):
+        decompressors = self.local.__dict__.setdefault("decompressors", {})
+
+        if dictionary_id not in decompressors:
+            if dictionary_id != 0 and dictionary_id not in self.dictionaries:
+                # trained after the dictionaries were loaded
+                self.load_dictionaries()
+
+            decompressors[dictionary_id] = zstandard.ZstdDecompressor(
+                dict_data=self.dictionaries.get(dictionary_id)
+            )
+
+        return decompressors[dictionary_id]
+
+    def compress(self, platform: str, raw_data: str) -> bytes:
+        """Compress the raw data of a post of a platform."""
+
+        dictionary_id = self.platform_dictionaries.get(platform, 0)
+
+        return self._compressor(dictionary_id).compress(raw_data.encode("utf-8"))
+
+    def decompress(self, compressed: bytes) -> str:
+        """Decompress raw data compressed by :py:meth:`compress`."""
+
+        dictionary_id = zstandard.get_frame_parameters(compressed).dict_id
+
+        return self._decompressor(dictionary_id).decompress(compressed).decode("utf-8")
+
+    def compress_result(self, result: ScraperResult):
+        """Move the ``raw_data`` of a ScraperResult to ``raw_data_compressed``."""
+
+        if result.raw_data is not None:
+            result.raw_data_compressed = self.compress(result.platform, result.raw_data)
+            result.raw_data = None
+
+
+def get_codec(engine: Engine) -> RawDataCodec:
+    """Return the RawDataCodec of a database, created on first use."""
+
+    with _codecs_lock:
+        if engine not in _codecs:
+            _codecs[engine] = RawDataCodec(engine)
+
+        return _codecs[engine]
+
+
+@event.listens_for(ScraperResult, "load")
+def _decompress_raw_data(result: ScraperResult, context):
+    compressed = result.__dict__.get("raw_data_compressed")
+
+    if compressed is not None and result.__dict__.get("raw_data") is None:
+        codec = get_codec(context.session.get_bind())
+        set_committed_value(result, "raw_data", codec.decompress(compressed))
+
+
+@event.listens_for(ScraperResult, "refresh")
+def _decompress_refreshed_raw_data(result: ScraperResult, context, attrs):
+    # expired results, e.g. after a commit, are reloaded without a "load" event
+    _decompress_raw_data(result, context)
+
+
+def _sample_raw_data(engine: Engine, platform: str, sample_size: int) -> List[str]:
+    with engine.connect() as connection:
+        return list(
+            connection.execute(
+                select(raw_posts_table.c.raw_data)
+                .where(raw_posts_table.c.platform == platform)
+                .where(raw_posts_table.c.raw_data != None)
+                .order_by(raw_posts_table.c.id.desc())
+                .limit(sample_size)
+            ).scalars()
+        )
+
+
+def train_dictionary(
+    engine: Engine,
+    platform: str,
+    sample_size: int = 10000,
+    dictionary_size: int = DICTIONARY_SIZE,
+) -> int:
+    """Train a zstd dictionary on the most recent uncompressed raw posts of a
+    platform, and save it. Raw posts of the platform compressed afterwards use
+    it, while those compressed before keep using the dictionary they were
+    compressed with.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Database to sample raw posts from and save the dictionary to
+    platform: str
+        Platform of the raw posts, e.g. ``"Telegram"``
+    sample_size: int
+        Number of raw posts to train the dictionary on
+    dictionary_size: int
+        Maximum size of the dictionary in bytes
+
+    Returns
+    -------
+    int
+        zstd ID of the new dictionary
+    """
+
+    if zstandard is None:
+        raise ImportError("The zstandard package is required to compress raw data")
+
+    samples = [
+        raw_data.encode("utf-8")
+        for raw_data in _sample_raw_data(engine, platform, sample_size)
+    ]
+
+    logger.info(f"Training dictionary on {len(samples)} raw posts from {platform}")
+
+    dictionary = zstandard.train_dictionary(dictionary_size, samples)
+
+    with engine.begin() as connection:
+        connection.execute(
+            insert(raw_data_dictionary_table).values(
+                id=dictionary.dict_id(),
+                platform=platform,
+                dictionary=dictionary.as_bytes(),
+                date_created=datetime.now(timezone.utc),
+            )
+        )
+
+    with _codecs_lock:
+        _codecs.pop(engine, None)
+
+    logger.info(f"Saved dictionary {dictionary.dict_id()} for {platform}")
+
+    return dictionary.dict_id()
+
+
+def _rewrite_raw_posts(
+    engine: Engine, condition, convert, platform: Optional[str], batch_size: int
+) -> int:
+    """Rewrite the raw posts matching ``condition`` in batches, each committed on
+    its own, with the column values returned by ``convert`` for each row."""
+
+    table = raw_posts_table
+    last_id = 0
+    rewritten = 0
+
+    while True:
+        with engine.begin() as connection:
+            query = (
+                select(
+                    table.c.id,
+                    table.c.platform,
+                    table.c.raw_data,
+                    table.c.raw_data_compressed,
+                )
+                .where(table.c.id > last_id)
+                .where(condition)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            )
+            if platform is not None:
+                query = query.where(table.c.platform == platform)
+
+            rows = connection.execute(query).all()
+
+            if len(rows) == 0:
+                return rewritten
+
+            connection.execute(
+                update(table)
+                .where(table.c.id == bindparam("row_id"))
+                .values(
+                    raw_data=bindparam("new_raw_data"),
+                    raw_data_compressed=bindparam("new_raw_data_compressed"),
+                ),
+                [dict(row_id=row.id, **convert(row)) for row in rows],
+            )
+
+        last_id = rows[-1].id
+        rewritten += len(rows)
+
+        logger.info(f"Rewrote {rewritten} raw posts")
+
+
+def compress_raw_posts(
+    engine: Engine, platform: Optional[str] = None, batch_size: int = 1000
+) -> int:
+    """Compress the ``raw_data`` of raw posts already in the database. Can be
+    interrupted and resumed, and undone with :py:func:`decompress_raw_posts`.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Database to compress raw posts in
+    platform: str or None
+        Only compress raw posts of this platform
+    batch_size: int
+        Number of raw posts compressed in each transaction
+
+    Returns
+    -------
+    int
+        Number of raw posts compressed
+    """
+
+    codec = get_codec(engine)
+
+    return _rewrite_raw_posts(
+        engine,
+        raw_posts_table.c.raw_data != None,
+        lambda row: dict(
+            new_raw_data=None,
+            new_raw_data_compressed=codec.compress(row.platform, row.raw_data),
+        ),
+        platform,
+        batch_size,
+    )
+
+
+def decompress_raw_posts(
+    engine: Engine, platform: Optional[str] = None, batch_size: int = 1000
+) -> int:
+    """Store the ``raw_data`` of compressed raw posts uncompressed again.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Database to decompress raw posts in
+    platform: str or None
+        Only decompress raw posts of this platform
+    batch_size: int
+        Number of raw posts decompressed in each transaction
+
+    Returns
+    -------
+    int
+        Number of raw posts decompressed
+    """
+
+    codec = get_codec(engine)
+
+    return _rewrite_raw_posts(
+        engine,
+        raw_posts_table.c.raw_data_compressed != None,
+        lambda row: dict(
+            new_raw_data=codec.decompress(row.raw_data_compressed),
+            new_raw_data_compressed=None,
+        ),
+        platform,
+        batch_size,
+    )
+
+
+def benchmark(engine: Engine, platform: str, sample_size: int = 2000) -> Dict:
+    """Compare the storage size and decoding time of the most recent raw posts
+    of a platform stored as they are now, as a plain string (the column type
+    before JSONB) and compressed with zstd. Half of the sample is used to train
+    a dictionary, which is not saved, and the other half is measured.
+
+    Parameters
+    ----------
+    engine: sqlalchemy.engine.Engine
+        Database to sample raw posts from
+    platform: str
+        Platform of the raw posts, e.g. ``"Telegram"``
+    sample_size: int
+        Number of raw posts to sample
+
+    Returns
+    -------
+    dict
+        Total sizes in bytes of the measured raw posts (``"plain"``,
+        ``"stored"``, i.e. the size of the JSONB values after Postgres
+        compression, ``"zstd"`` and ``"zstd_dictionary"``) and their decoding
+        throughput in MB/s of plain JSON (``"decode_plain"`` and
+        ``"decode_zstd_dictionary"``).
+    """
+
+    if zstandard is None:
+        raise ImportError("The zstandard package is required to compress raw data")
+
+    table = raw_posts_table
+
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(table.c.raw_data, func.pg_column_size(table.c.raw_data))
+            .where(table.c.platform == platform)
+            .where(table.c.raw_data != None)
+            .order_by(table.c.id.desc())
+            .limit(sample_size)
+        ).all()
+
+    training = [row[0].encode("utf-8") for row in rows[::2]]
+    measured = [row[0].encode("utf-8") for row in rows[1::2]]
+    stored = sum(row[1] for row in rows[1::2])
+
+    dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, training)
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+    dictionary_compressor = zstandard.ZstdCompressor(
+        level=COMPRESSION_LEVEL, dict_data=dictionary
+    )
+    decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+
+    compressed = [dictionary_compressor.compress(data) for data in measured]
+    plain = sum(len(data) for data in measured)
+
+    start = time.perf_counter()
+    for data in measured:
+        decode_json(data)
+    decode_plain = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in compressed:
+        decode_json(decompressor.decompress(data))
+    decode_compressed = time.perf_counter() - start
+
+    results = dict(
+        plain=plain,
+        stored=stored,
+        zstd=sum(len(compressor.compress(data)) for data in measured),
+        zstd_dictionary=sum(len(data) for data in compressed),
+        decode_plain=plain / decode_plain / 1e6,
+        decode_zstd_dictionary=plain / decode_compressed / 1e6,
+    )
+
+    logger.info(
+        f"{len(measured)} raw posts from {platform}: {results['plain']} bytes as plain strings, "
+        f"{results['stored']} bytes stored, {results['zstd']} bytes with zstd, "
+        f"{results['zstd_dictionary']} bytes with zstd and a dictionary; decoded at "
+        f"{results['decode_plain']:.0f} MB/s plain, "
+        f"{results['decode_zstd_dictionary']:.0f} MB/s compressed"
+    )
+
+    return results
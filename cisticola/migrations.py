@@ -0,0 +1,160 @@
+from loguru import logger
+from sqlalchemy import and_, delete, func, literal, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine.base import Connection, Engine
+
+from cisticola.base import (
+    JSON_NUL_PATTERN,
+    TELEGRAM_CHANNEL_LIST_URL,
+    channel_identity_columns,
+    channel_identity_table,
+    channel_table,
+    mapper_registry,
+    normalized_url_expression,
+    raw_channel_info_table,
+    raw_posts_table,
+)
+
+
+def _column_type(connection: Connection, table: str, column: str) -> str:
+    """Return the Postgres data type of a column, e.g. ``"character varying"``."""
+
+    return connection.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column},
+    ).scalar()
+
+
+def convert_raw_data_to_jsonb(connection: Connection):
+    """Convert the ``raw_data`` columns of the ``raw_posts`` and ``raw_channel_info``
+    tables from strings to JSONB.
+
+    This rewrites both tables, so it can take a long time on a large database.
+    """
+
+    for table in (raw_posts_table, raw_channel_info_table):
+        if _column_type(connection, table.name, "raw_data") == "jsonb":
+            continue
+
+        logger.info(f"Converting {table.name}.raw_data to JSONB")
+
+        # JSONB cannot store NUL characters, see :py:func:`cisticola.base.strip_json_nul`
+        connection.execute(
+            text(
+                f"ALTER TABLE {table.name} ALTER COLUMN raw_data TYPE JSONB "
+                "USING regexp_replace(raw_data, :pattern, :replacement, 'g')::jsonb"
+            ),
+            {"pattern": JSON_NUL_PATTERN, "replacement": "\\1"},
+        )
+
+
+def add_raw_data_compressed_column(connection: Connection):
+    """Add the ``raw_data_compressed`` column (see :py:mod:`cisticola.compression`)
+    to the ``raw_posts`` table."""
+
+    connection.exec_driver_sql(
+        "ALTER TABLE raw_posts ADD COLUMN IF NOT EXISTS raw_data_compressed BYTEA"
+    )
+
+
+def drop_raw_data_gin_index(connection: Connection):
+    """Drop the GIN index on the whole ``raw_posts.raw_data`` document created
+    by a previous version of cisticola. Nothing filters raw posts on paths
+    inside ``raw_data``, so it only slowed down inserts and took up space. Keys
+    that are filtered on get expression indexes instead (e.g.
+    ``raw_channel_info_platform_name_idx``).
+    """
+
+    logger.info("Dropping index raw_posts_raw_data_idx if it exists")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS raw_posts_raw_data_idx")
+
+
+def create_missing_indexes(connection: Connection):
+    """Create indexes defined in :py:mod:`cisticola.base` that do not exist yet
+    on tables created by a previous version of cisticola.
+    """
+
+    for table in mapper_registry.metadata.sorted_tables:
+        for index in table.indexes:
+            logger.debug(f"Creating index {index.name} if it does not exist")
+            index.create(bind=connection, checkfirst=True)
+
+
+def populate_channel_identities(connection: Connection):
+    """Add the identity keys (see :py:meth:`cisticola.base.Channel.identity_keys`)
+    of all existing channels to the ``channel_identities`` table. If several
+    channels share a key, it is assigned to the one with the lowest ID. URL keys
+    registered before URLs were normalized are replaced by normalized ones.
+    """
+
+    identities = channel_identity_table.c
+    connection.execute(
+        delete(channel_identity_table).where(
+            (identities.kind == "url")
+            & (identities.value != normalized_url_expression(identities.value))
+        )
+    )
+
+    for kind, column in channel_identity_columns.items():
+        logger.info(f"Populating channel identities of kind {kind}")
+
+        conditions = [
+            channel_table.c.platform != None,
+            column != None,
+            column != "",
+        ]
+        if kind == "url":
+            # URLs are checked before they are normalized, like in identity_keys
+            conditions += [
+                channel_table.c.url != "",
+                column != TELEGRAM_CHANNEL_LIST_URL,
+            ]
+
+        query = (
+            select(
+                channel_table.c.platform,
+                literal(kind),
+                column,
+                func.min(channel_table.c.id),
+            )
+            .where(and_(*conditions))
+            .group_by(channel_table.c.platform, column)
+        )
+
+        connection.execute(
+            pg_insert(channel_identity_table)
+            .from_select(["platform", "kind", "value", "channel"], query)
+            .on_conflict_do_nothing()
+        )
+
+
+#: Migrations applied by :py:func:`migrate`, in order. Each one takes a
+#: connection and must be safe to run on an already migrated database.
+MIGRATIONS = [
+    convert_raw_data_to_jsonb,
+    add_raw_data_compressed_column,
+    drop_raw_data_gin_index,
+    create_missing_indexes,
+    populate_channel_identities,
+]
+
+
+def migrate(engine: Engine):
+    """Bring a database created by a previous version of cisticola up to date
+    with the schema defined in :py:mod:`cisticola.base`. ``create_all`` only
+    creates missing tables, so changes to existing tables are applied here.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        Instance of SQLAlchemy Engine object to migrate
+    """
+
+    mapper_registry.metadata.create_all(bind=engine)
+
+    with engine.begin() as connection:
+        for migration in MIGRATIONS:
+            migration(connection)
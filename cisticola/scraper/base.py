@@ -1,6 +1,7 @@
 import os
 import tempfile
-from datetime import datetime, timezone
+import time
+from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from pathlib import Path
 from typing import Generator, List, Optional, Tuple
@@ -10,13 +11,35 @@ import boto3
 import ffmpeg
 import yt_dlp
 from loguru import logger
-from sqlalchemy import nullsfirst
+from sqlalchemy import nullsfirst, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm.session import close_all_sessions
 from sqlalchemy.sql.expression import func
 
-from cisticola.base import Channel, RawChannelInfo, ScraperResult, mapper_registry
-from cisticola.utils import make_request
+from cisticola.base import (
+    Channel,
+    RawChannelInfo,
+    ScraperResult,
+    channel_schedule_table,
+    mapper_registry,
+    scrape_cursor_table,
+)
+from cisticola.compression import get_codec
+from cisticola.utils import log_connection_stats, make_request
+
+#: Window of recent posts used to estimate the posting rate of channels
+SCHEDULE_WINDOW = timedelta(days=30)
+
+#: Number of new posts expected from each scheduled scrape of a channel, which
+#: sets the interval between scrapes given its posting rate
+SCHEDULE_POSTS_PER_SCRAPE = 10
+
+#: Shortest interval between scheduled scrapes of a channel
+SCHEDULE_MIN_INTERVAL = timedelta(hours=1)
+
+#: Longest interval between scheduled scrapes of a channel, e.g. a dormant one
+SCHEDULE_MAX_INTERVAL = timedelta(days=7)
 
 
 class Scraper:
@@ -31,6 +54,10 @@ class Scraper:
     )
     cookiefilename = "cookiefile.txt"
 
+    #: sessionmaker of the database, set by the ScraperController the scraper is
+    #: registered with, and used to persist cursors (see :py:meth:`save_cursor`)
+    db_session = None
+
     def __init__(self):
         # Initialize client to transfer files to the storage archive
         self.s3_client = boto3.client(
@@ -308,7 +335,10 @@ class Scraper:
 
     @logger.catch
     def get_posts(
-        self, channel: Channel, since: Optional[ScraperResult] = None
+        self,
+        channel: Channel,
+        since: Optional[ScraperResult] = None,
+        until: Optional[ScraperResult] = None,
     ) -> Generator[ScraperResult, None, None]:
         """Scrape all posts from the specified Channel.
 
@@ -319,6 +349,12 @@ class Scraper:
         since: ScraperResult or None
             Most recently scraped ScraperResult from a previous scrape, or
             ``None`` if scraper has not run before.
+        until: ScraperResult or None
+            Oldest scraped ScraperResult from previous scrapes. If specified,
+            only posts older than it are scraped, to backfill the channel.
+            Scrapers may scrape a limited number of posts at once, and resume
+            from a saved cursor (see :py:meth:`save_cursor`) on the next
+            call.
 
         Yields
         ------
@@ -328,15 +364,112 @@ class Scraper:
 
         raise NotImplementedError
 
+    def get_posts_of_channels(
+        self,
+        jobs: List[Tuple[Channel, Optional[ScraperResult], Optional[ScraperResult]]],
+    ) -> Generator[Tuple[Channel, Generator[ScraperResult, None, None]], None, None]:
+        """Scrape posts from several channels, see :py:meth:`get_posts`. By
+        default the channels are scraped one after the other, scrapers can
+        override this to scrape several channels at once.
+
+        Parameters
+        ----------
+        jobs: list[tuple]
+            ``(channel, since, until)`` tuples of the channels to scrape, with
+            the ``since`` and ``until`` arguments of :py:meth:`get_posts`.
+
+        Yields
+        ------
+        tuple
+            Channel, and the ScraperResults scraped from it, in the order of
+            ``jobs``. The ScraperResults of each channel should be consumed
+            before getting the next channel.
+        """
+
+        for channel, since, until in jobs:
+            yield channel, self.get_posts(channel, since=since, until=until)
+
+    def get_cursor(self, channel: Channel) -> Optional[dict]:
+        """Load the pagination state of a channel saved by :py:meth:`save_cursor`.
+
+        Parameters
+        ----------
+        channel: Channel
+            Channel being scraped.
+
+        Returns
+        -------
+        dict or None
+            Saved cursor, or ``None`` if there is none or the scraper is not
+            connected to a database.
+        """
+
+        if self.db_session is None:
+            return None
+
+        with self.db_session() as session:
+            return session.execute(
+                select(scrape_cursor_table.c.cursor).where(
+                    (scrape_cursor_table.c.channel == channel.id)
+                    & (scrape_cursor_table.c.scraper == self.__version__.split(" ")[0])
+                )
+            ).scalar()
+
+    def save_cursor(self, channel: Channel, cursor: Optional[dict]):
+        """Persist the pagination state of a channel in the ``scrape_cursors``
+        table, so that a later scrape, e.g. after a crash, can resume from it.
+        Cursors are kept per scraper, regardless of its version.
+
+        Parameters
+        ----------
+        channel: Channel
+            Channel being scraped.
+        cursor: dict or None
+            JSON-serializable, scraper-specific pagination state.
+        """
+
+        if self.db_session is None:
+            return
+
+        values = dict(cursor=cursor, date_updated=datetime.now(timezone.utc))
+
+        with self.db_session() as session:
+            session.execute(
+                pg_insert(scrape_cursor_table)
+                .values(
+                    channel=channel.id,
+                    scraper=self.__version__.split(" ")[0],
+                    **values,
+                )
+                .on_conflict_do_update(
+                    index_elements=["channel", "scraper"], set_=values
+                )
+            )
+            session.commit()
+
 
 class ScraperController:
     """Registers scrapers, uses them to generate ScraperResults. Synchronizes
     everything with database via ORM."""
 
-    def __init__(self):
+    def __init__(self, compress_raw_data: bool = False):
+        """
+        Parameters
+        ----------
+        compress_raw_data: bool
+            If ``True``, the ``raw_data`` of scraped posts is stored compressed
+            (see :py:mod:`cisticola.compression`).
+        """
         self.scrapers = []
+
+        # registered scrapers by major version, e.g. ``"GettrScraper 0"``
+        self.scrapers_by_major_version = {}
+
         self.session = None
 
+        self.compress_raw_data = compress_raw_data
+        self.codec = None
+
     def register_scraper(self, scraper: Scraper):
         """Add a single Scraper instance to the list of available Scrapers.
 
@@ -346,6 +479,10 @@ class ScraperController:
             Instance of platform-specific scraper to be controlled by the ScraperController
         """
         self.scrapers.append(scraper)
+        scraper.db_session = self.session
+        self.scrapers_by_major_version.setdefault(
+            scraper.__version__.split(".")[0], scraper
+        )
 
     def register_scrapers(self, scrapers: List[Scraper]):
         """Add a a list of Scraper instances to the list of available Scrapers.
@@ -356,11 +493,13 @@ class ScraperController:
             List of instances of platform-specific scrapers to be controlled by the ScraperController
 
         """
-        self.scrapers.extend(scrapers)
+        for scraper in scrapers:
+            self.register_scraper(scraper)
 
     def remove_all_scrapers(self):
         """Reset the ScraperController so that it doesn't control any scrapers"""
         self.scrapers = []
+        self.scrapers_by_major_version = {}
 
     def scrape_all_channels(self, fetch_old: bool = False):
         """Scrape posts from all channels in the database, that satisfy a researcher-specified criteria
@@ -368,7 +507,8 @@ class ScraperController:
         Parameters
         ----------
         fetch_old: bool
-            If ``True``, scrape all posts from channels, regardless of when channel was last scraped.
+            If ``True``, scrape posts older than the oldest previously scraped post of each channel
+            (see the ``until`` argument of :py:meth:`Scraper.get_posts`).
             If ``False``, scrape only posts that are more recent than the previous scrape of each channel.
         """
         if self.session is None:
@@ -377,21 +517,148 @@ class ScraperController:
 
         session = self.session()
 
+        channels = session.query(Channel).filter(self._scrapeable_channels()).all()
+
+        session.close()
+
+        return self.scrape_channels(channels, fetch_old=fetch_old)
+
+    @staticmethod
+    def _scrapeable_channels():
+        """Filter on the channels scraped by :py:meth:`scrape_all_channels`,
+        :py:meth:`scrape_all_channel_info` and :py:meth:`scrape_due_channels`."""
+
         # TODO there should be a better/more generic way of selecting scrapeable channels
+        return (
+            (Channel.source == "researcher")
+            | (Channel.source == "snowball_it")
+            | (Channel.source == "snowball_complete")
+            | (Channel.source == "linked_channel")
+        )
+
+    def scrape_due_channels(self, limit: Optional[int] = None) -> int:
+        """Scrape the channels whose next scrape is due (see
+        :py:meth:`schedule_channel`), starting with channels that were never
+        scheduled, then the most overdue ones.
+
+        Parameters
+        ----------
+        limit: int or None
+            Maximum number of channels to scrape
+
+        Returns
+        -------
+        int
+            Number of channels scraped
+        """
+        if self.session is None:
+            logger.error("No DB session")
+            return 0
+
+        session = self.session()
+
         channels = (
             session.query(Channel)
+            .filter(self._scrapeable_channels())
+            .outerjoin(
+                channel_schedule_table,
+                Channel.id == channel_schedule_table.c.channel,
+            )
             .filter(
-                (Channel.source == "researcher")
-                | (Channel.source == "snowball_it")
-                | (Channel.source == "snowball_complete")
-                | (Channel.source == "linked_channel")
+                (channel_schedule_table.c.date_due == None)
+                | (
+                    channel_schedule_table.c.date_due
+                    <= datetime.now(timezone.utc).replace(tzinfo=None)
+                )
             )
+            .order_by(nullsfirst(channel_schedule_table.c.date_due.asc()))
+            .limit(limit)
             .all()
         )
 
         session.close()
 
-        return self.scrape_channels(channels, fetch_old=fetch_old)
+        logger.info(f"Found {len(channels)} channels due to be scraped")
+
+        if len(channels) > 0:
+            self.scrape_channels(channels)
+
+        return len(channels)
+
+    def scrape_channels_continuously(
+        self, limit: Optional[int] = 100, poll_interval: float = 60
+    ):
+        """Keep scraping channels as their scrapes become due, see
+        :py:meth:`scrape_due_channels`.
+
+        Parameters
+        ----------
+        limit: int or None
+            Maximum number of channels scraped at once, before checking again
+            which channels are due
+        poll_interval: float
+            Seconds to wait for channels to become due when none are
+        """
+
+        while True:
+            if self.scrape_due_channels(limit=limit) == 0:
+                time.sleep(poll_interval)
+
+    def schedule_channel(
+        self, session, channel: Channel, interval: Optional[timedelta] = None
+    ):
+        """Estimate the posting rate of a channel from its posts in the last
+        ``SCHEDULE_WINDOW``, and schedule its next scrape so that about
+        ``SCHEDULE_POSTS_PER_SCRAPE`` new posts are expected by then, between
+        ``SCHEDULE_MIN_INTERVAL`` and ``SCHEDULE_MAX_INTERVAL`` from now.
+
+        Parameters
+        ----------
+        session: sqlalchemy.orm.Session
+            SQLAlchemy Session that interfaces with the database
+        channel: Channel
+            Channel that was just scraped
+        interval: datetime.timedelta or None
+            If specified, schedule the next scrape this long from now instead,
+            e.g. for channels that no registered scraper can handle.
+        """
+
+        # the date columns are naive UTC, Postgres would convert an aware value
+        # to the time zone of the session before comparing
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+        count = (
+            session.query(func.count(ScraperResult.id))
+            .where(ScraperResult.channel == channel.id)
+            .where(ScraperResult.date >= now - SCHEDULE_WINDOW)
+            .scalar()
+        )
+
+        if interval is None:
+            if count == 0:
+                interval = SCHEDULE_MAX_INTERVAL
+            else:
+                interval = SCHEDULE_WINDOW * (SCHEDULE_POSTS_PER_SCRAPE / count)
+                interval = min(
+                    SCHEDULE_MAX_INTERVAL, max(SCHEDULE_MIN_INTERVAL, interval)
+                )
+
+        values = dict(
+            post_rate=count / (SCHEDULE_WINDOW / timedelta(days=1)),
+            date_scraped=now,
+            date_due=now + interval,
+        )
+
+        session.execute(
+            pg_insert(channel_schedule_table)
+            .values(channel=channel.id, **values)
+            .on_conflict_do_update(index_elements=["channel"], set_=values)
+        )
+        session.commit()
+
+        logger.debug(
+            f"{channel} posts {values['post_rate']:.2f} times a day, next scrape in {interval}"
+        )
 
     def scrape_all_channel_info(self):
         """Scrape profile information from all channels in the database."""
@@ -413,12 +680,7 @@ class ScraperController:
         )
         channels = (
             session.query(Channel)
-            .filter(
-                (Channel.source == "researcher")
-                | (Channel.source == "snowball_it")
-                | (Channel.source == "snowball_complete")
-                | (Channel.source == "linked_channel")
-            )
+            .filter(self._scrapeable_channels())
             .outerjoin(
                 most_recently_archived, Channel.id == most_recently_archived.c.channel
             )
@@ -437,7 +699,8 @@ class ScraperController:
         channels: list[Channel]
             List of Channel instances to be scraped
         fetch_old: bool
-            If ``True``, scrape all posts from channels, regardless of when channel was last scraped.
+            If ``True``, scrape posts older than the oldest previously scraped post of each channel
+            (see the ``until`` argument of :py:meth:`Scraper.get_posts`).
             If ``False``, scrape only posts that are more recent than the previous scrape of each channel.
         """
 
@@ -447,6 +710,10 @@ class ScraperController:
 
         session = self.session()
 
+        # channels handled by each scraper, with the ``since`` and ``until``
+        # arguments to scrape them with
+        jobs = {}
+
         # If any channels are not already in the database, add them
         for channel in channels:
             platform_id = None
@@ -473,12 +740,11 @@ class ScraperController:
                 if scraper.can_handle(channel):
                     logger.debug(f"{scraper} is handling {channel}")
                     handled = True
-                    added = 0
+                    since = None
+                    until = None
 
-                    if fetch_old and channel.platform == "Telegram":
-                        # get oldest post (currently only for Telegram)
-                        # TODO fix this so that it doesn't have an explicit check on channel.platform (should be generic)
-                        # TODO implement until on all scrapers
+                    if fetch_old:
+                        # get oldest post
                         rows = (
                             session.query(ScraperResult)
                             .where(ScraperResult.channel == channel.id)
@@ -489,10 +755,6 @@ class ScraperController:
 
                         if len(rows) > 0:
                             until = rows[0]
-                        else:
-                            until = None
-
-                        posts = scraper.get_posts(channel, until=until)
 
                     else:
                         # get most recent post
@@ -509,25 +771,42 @@ class ScraperController:
 
                         if len(rows) > 0:
                             since = rows[0]
-                        else:
-                            since = None
 
-                        posts = scraper.get_posts(channel, since=since)
-
-                    for post in posts:
-                        session.add(post)
-                        session.commit()
-                        added += 1
-
-                    session.commit()
-                    logger.info(f"{scraper} found {added} new posts from {channel}")
+                    jobs.setdefault(scraper, []).append((channel, since, until))
                     break
 
             if not handled:
                 logger.warning(f"No handler found for Channel {channel}")
 
+                # so that it does not stay due, and keep being selected first by
+                # ``scrape_due_channels``
+                if not fetch_old:
+                    self.schedule_channel(
+                        session, channel, interval=SCHEDULE_MAX_INTERVAL
+                    )
+
+        for scraper, scraper_jobs in jobs.items():
+            for channel, posts in scraper.get_posts_of_channels(scraper_jobs):
+                added = 0
+
+                for post in posts:
+                    if self.codec is not None:
+                        self.codec.compress_result(post)
+
+                    session.add(post)
+                    session.commit()
+                    added += 1
+
+                session.commit()
+                logger.info(f"{scraper} found {added} new posts from {channel}")
+
+                if not fetch_old:
+                    self.schedule_channel(session, channel)
+
         session.close()
 
+        log_connection_stats()
+
     def archive_unarchived_media_batch(self, session=None, chronological=False):
         """Archive previously unarchived media URLs from a batch of raw_post rows.
 
@@ -564,36 +843,31 @@ class ScraperController:
         logger.info(f"Found {len(posts)} posts without media. Archiving now")
 
         for post in posts:
-            handled = False
+            # compare major versions
+            scraper = None
+            if post.scraper is not None:
+                scraper = self.scrapers_by_major_version.get(post.scraper.split(".")[0])
 
-            for scraper in self.scrapers:
-                # compare major versions
-                if (
-                    post.scraper is not None
-                    and scraper.__version__.split(".")[0] == post.scraper.split(".")[0]
-                ):
-                    handled = True
-                    logger.debug(f"{scraper} is archiving media for ID {post.id}")
-                    post = scraper.archive_files(post)
-
-                    if post:
-                        session.query(ScraperResult).where(
-                            ScraperResult.id == post.id
-                        ).update(
-                            {
-                                "archived_urls": post.archived_urls,
-                                "media_archived": post.media_archived,
-                            }
-                        )
-                        session.commit()
+            if scraper is None:
+                logger.warning(f"No handler found for post scraped with {post.scraper}")
+                continue
 
-                    break
+            logger.debug(f"{scraper} is archiving media for ID {post.id}")
+            post = scraper.archive_files(post)
 
-            if not handled:
-                logger.warning(f"No handler found for post scraped with {post.scraper}")
+            if post:
+                session.query(ScraperResult).where(ScraperResult.id == post.id).update(
+                    {
+                        "archived_urls": post.archived_urls,
+                        "media_archived": post.media_archived,
+                    }
+                )
+                session.commit()
 
         session.commit()
 
+        log_connection_stats()
+
     @logger.catch(reraise=True)
     def archive_unarchived_media(self, chronological=False):
         """Archive previously unarchived media URLs from all raw_post rows.
@@ -659,6 +933,8 @@ class ScraperController:
 
         session.close()
 
+        log_connection_stats()
+
     def connect_to_db(self, engine):
         """Connect the specified SQLAlchemy engine to the controller.
 
@@ -675,6 +951,12 @@ class ScraperController:
         self.engine = engine
         self.session.configure(bind=self.engine)
 
+        if self.compress_raw_data:
+            self.codec = get_codec(engine)
+
+        for scraper in self.scrapers:
+            scraper.db_session = self.session
+
     def reset_db(self):
         """Drop all data from the connected SQLAlchemy database."""
 
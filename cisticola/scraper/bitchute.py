@@ -1,17 +1,24 @@
 import json
 import re
-import time
+import threading
 from datetime import datetime, timezone
-from html.parser import HTMLParser
 from typing import Generator, Optional
 
 import dateparser
 import requests
 from bs4 import BeautifulSoup
 from loguru import logger
+from requests.adapters import HTTPAdapter
 
 from cisticola.base import Channel, RawChannelInfo, ScraperResult
 from cisticola.scraper.base import Scraper
+from cisticola.utils import (
+    HTTP_CONCURRENCY,
+    HTTP_POOL_SIZE,
+    html_to_text,
+    map_concurrently,
+    send_request,
+)
 
 
 class BitchuteScraper(Scraper):
@@ -20,6 +27,23 @@ class BitchuteScraper(Scraper):
 
     __version__ = "BitchuteScraper 0.0.1"
 
+    #: Number of video detail pages fetched at once, ``1`` to fetch them
+    #: sequentially
+    concurrency = HTTP_CONCURRENCY
+
+    #: Maximum number of videos scraped from a channel by an incremental scrape
+    max_videos = 100
+
+    #: Maximum number of older videos scraped from a channel by each backfill
+    #: (with ``until``), which resumes at the listing offset of the previous one
+    max_backfill_videos = 1000
+
+    def __init__(self):
+        super().__init__()
+
+        # shared by all channels, see BitchuteClient
+        self.client = BitchuteClient(self.headers)
+
     def get_username_from_url(self, url):
         username = url.split("bitchute.com/channel/")[-1].strip("/")
 
@@ -27,22 +51,48 @@ class BitchuteScraper(Scraper):
 
     @logger.catch
     def get_posts(
-        self, channel: Channel, since: Optional[ScraperResult] = None
+        self,
+        channel: Channel,
+        since: Optional[ScraperResult] = None,
+        until: Optional[ScraperResult] = None,
     ) -> Generator[ScraperResult, None, None]:
-        session = requests.Session()
-        session.headers.update(self.headers)
-        request = session.get("https://www.bitchute.com/search")
-        csrftoken = (
-            BeautifulSoup(request.text, "html.parser")
-            .findAll("input", {"name": "csrfmiddlewaretoken"})[0]
-            .get("value")
-        )
-        time.sleep(0.25)
-
         detail = "comments"
 
         username = self.get_username_from_url(channel.url)
-        scraper = get_videos_user(session, username, csrftoken, detail)
+
+        if until is not None:
+            # resume the listing where the previous backfill stopped. Videos
+            # posted since then shift the listing, they are skipped by comparing
+            # with ``until``
+            cursor = self.get_cursor(channel)
+            offset = 0 if cursor is None else cursor["offset"]
+            offset = max(0, offset - LISTING_OFFSET_SLACK)
+
+            logger.info(
+                f"Only getting videos older than {until.platform_id}, from listing offset {offset}"
+            )
+
+            scraper = get_videos_user(
+                self.client,
+                username,
+                detail,
+                until_id=until.platform_id,
+                until_timestamp=until.date.timestamp(),
+                offset=offset,
+                max_items=self.max_backfill_videos,
+                on_page=lambda offset: self.save_cursor(channel, {"offset": offset}),
+                concurrency=self.concurrency,
+            )
+        else:
+            scraper = get_videos_user(
+                self.client,
+                username,
+                detail,
+                since_id=None if since is None else since.platform_id,
+                since_timestamp=None if since is None else since.date.timestamp(),
+                max_items=self.max_videos,
+                concurrency=self.concurrency,
+            )
 
         for post in scraper:
             if (
@@ -80,8 +130,10 @@ class BitchuteScraper(Scraper):
     def get_profile(self, channel: Channel) -> RawChannelInfo:
         base_url = channel.url
 
-        session = requests.session()
-        response = session.get(base_url)
+        # the CSRF token and cookies of the channel page are kept apart from
+        # those of the listing session
+        session = self.client.detail_session
+        response = send_request("GET", base_url, session=session)
         soup = BeautifulSoup(response.content, "html.parser")
 
         canonical_url = soup.find("link", {"id": "canonical"})["href"]
@@ -99,7 +151,13 @@ class BitchuteScraper(Scraper):
         headers = {"Referer": base_url}
         data = {"csrftoken": csrftoken, "csrfmiddlewaretoken": csrfmiddlewaretoken}
 
-        response = session.post(canonical_url + "counts/", data=data, headers=headers)
+        response = send_request(
+            "POST",
+            canonical_url + "counts/",
+            session=session,
+            data=data,
+            headers=headers,
+        )
         counts = json.loads(response.text)
 
         owner_soup = soup.find("p", {"class": "owner"})
@@ -137,6 +195,111 @@ class BitchuteScraper(Scraper):
         )
 
 
+class CSRFTokenError(RuntimeError):
+    """Raised when BitChute rejects the CSRF token of a request."""
+
+
+class BitchuteClient:
+    """
+    Long-lived HTTP client for BitChute, shared by all channels scraped by a
+    BitchuteScraper
+
+    Channel listings are requested with a single session, whose CSRF token is
+    only fetched again when BitChute rejects it. Video detail pages are
+    requested with a separate session per thread, so that they reuse their
+    connections from one video to the next, including when they are fetched
+    concurrently, without interfering with the CSRF token of the listing
+    session. Channel pages and their counts use the same per-thread session.
+
+    :param dict headers:  Headers to send with listing requests
+    """
+
+    def __init__(self, headers=None):
+        self.session = self._new_session(headers)
+        self.csrftoken = None
+        self._local = threading.local()
+
+    @staticmethod
+    def _new_session(headers=None):
+        session = requests.Session()
+        if headers is not None:
+            session.headers.update(headers)
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        return session
+
+    @property
+    def detail_session(self):
+        """Session for video detail pages of the current thread"""
+        if not hasattr(self._local, "session"):
+            self._local.session = self._new_session()
+
+        return self._local.session
+
+    def get_csrftoken(self, refresh=False):
+        """
+        Get the CSRF token of the listing session
+
+        :param bool refresh:  Fetch a new token, even if one is cached
+
+        :return str:  CSRF token
+        """
+        if self.csrftoken is None or refresh:
+            request = send_request(
+                "GET", "https://www.bitchute.com/search", session=self.session
+            )
+            self.csrftoken = (
+                BeautifulSoup(request.text, "html.parser")
+                .findAll("input", {"name": "csrfmiddlewaretoken"})[0]
+                .get("value")
+            )
+
+        return self.csrftoken
+
+    def post(self, url, headers=None, data=None):
+        """
+        POST to BitChute with the CSRF token of the listing session, fetching
+        a new token once if the current one was rejected
+
+        :param str url:  URL to post to
+        :param dict headers:  Headers to pass with the request
+        :param dict data:  Data to send with the request, besides the token
+
+        :return:  Decoded JSON response
+        """
+        data = {} if data is None else data
+
+        try:
+            return request_from_bitchute(
+                self.session,
+                "POST",
+                url,
+                headers=headers,
+                data={**data, "csrfmiddlewaretoken": self.get_csrftoken()},
+            )
+        except CSRFTokenError:
+            logger.info("BitChute rejected the CSRF token, fetching a new one")
+
+        return request_from_bitchute(
+            self.session,
+            "POST",
+            url,
+            headers=headers,
+            data={**data, "csrfmiddlewaretoken": self.get_csrftoken(refresh=True)},
+        )
+
+
+#: Seconds by which a video's listing date can precede its exact publication date
+LISTING_DATE_MARGIN = 24 * 60 * 60
+
+#: Number of listing entries before the saved offset at which a backfill starts,
+#: in case videos before it were deleted since
+LISTING_OFFSET_SLACK = 25
+
+
 def strip_tags(html, convert_newlines=True):
     r"""
     Strip HTML from a string
@@ -154,23 +317,12 @@ def strip_tags(html, convert_newlines=True):
         html = html.replace("<br>", "\n").replace("</p>", "</p>\n")
         html = deduplicate_newlines.sub("\n", html)
 
-    class HTMLStripper(HTMLParser):
-        def __init__(self):
-            super().__init__()
-            self.reset()
-            self.strict = False
-            self.convert_charrefs = True
-            self.fed = []
-
-        def handle_data(self, data):
-            self.fed.append(data)
-
-        def get_data(self):
-            return "".join(self.fed)
+    # listing texts are usually plain text already, which is returned as is
+    # rather than parsed
+    if "<" not in html and "&" not in html:
+        return html
 
-    stripper = HTMLStripper()
-    stripper.feed(html)
-    return stripper.get_data()
+    return html_to_text(html)
 
 
 def request_from_bitchute(session, method, url, headers=None, data=None):
@@ -188,32 +340,40 @@ def request_from_bitchute(session, method, url, headers=None, data=None):
 
     :return:  Requests response
     """
-    retries = 0
-    response = None
-    while retries < 3:
-        try:
-            if method.lower() == "post":
-                request = session.post(url, headers=headers, data=data)
-            elif method.lower() == "get":
-                request = session.get(url, headers=headers, params=data)
-            else:
-                raise NotImplemented()
+    if method.lower() == "post":
+        kwargs = {"data": data}
+    elif method.lower() == "get":
+        kwargs = {"params": data}
+    else:
+        raise NotImplementedError()
 
-            if request.status_code >= 300:
-                raise ValueError(
-                    "Response %i from BitChute for URL %s, need to retry"
-                    % (request.status_code, url)
-                )
+    try:
+        request = send_request(
+            method,
+            url,
+            session=session,
+            max_retries=2,
+            break_codes=range(200, 300),
+            headers=headers,
+            **kwargs,
+        )
+    except requests.RequestException as e:
+        raise RuntimeError() from e
 
-            response = request.json()
-            return response
+    if request.status_code == 403:
+        raise CSRFTokenError(
+            "Response %i from BitChute for URL %s" % (request.status_code, url)
+        )
 
-        except (ConnectionResetError, requests.RequestException, ValueError) as e:
-            retries += 1
-            time.sleep(retries * 2)
+    if request.status_code >= 300:
+        raise RuntimeError(
+            "Response %i from BitChute for URL %s" % (request.status_code, url)
+        )
 
-        except json.JSONDecodeError as e:
-            raise RuntimeError()
+    try:
+        response = request.json()
+    except ValueError as e:
+        raise RuntimeError() from e
 
     if not response:
         raise RuntimeError()
@@ -221,7 +381,7 @@ def request_from_bitchute(session, method, url, headers=None, data=None):
     return response
 
 
-def append_details(video, detail):
+def append_details(video, detail, session=None):
     """
     Append extra metadata to video data
 
@@ -229,6 +389,8 @@ def append_details(video, detail):
 
     :param dict video:  Video details as scraped so far
     :param str detail:  Detail level. If 'comments', also scrape video comments.
+    :param session:  HTTP Session to use, a new one is created if None. It
+        should not be the session of the channel listing.
 
     :return dict:  Tuple, first item: updated video data, second: list of comments
     """
@@ -247,9 +409,14 @@ def append_details(video, detail):
 
     try:
         # to get more details per video, we need to request the actual video detail page
-        # start a new session, to not interfere with the CSRF token from the search session
-        video_session = requests.session()
-        video_page = video_session.get(video["url"])
+        # use a separate session, to not interfere with the CSRF token from the search session
+        video_session = requests.session() if session is None else session
+        video_page = send_request(
+            "GET",
+            video["url"],
+            session=video_session,
+            break_codes=range(200, 500),
+        )
 
         if (
             '<h1 class="page-title">Video Restricted</h1>' in video_page.text
@@ -325,11 +492,12 @@ def append_details(video, detail):
 
         # we need *two more requests* to get the comment count and like/dislike counts
         # this seems to be because bitchute uses a third-party comment widget
-        video_session.headers = {"Referer": video["url"], "Origin": video["url"]}
+        headers = {"Referer": video["url"], "Origin": video["url"]}
         counts = request_from_bitchute(
             video_session,
             "POST",
             "https://www.bitchute.com/video/%s/counts/" % video["id"],
+            headers=headers,
             data={"csrfmiddlewaretoken": video_csfrtoken},
         )
 
@@ -356,6 +524,7 @@ def append_details(video, detail):
                     video_session,
                     "POST",
                     url + "/api/get_comments/",
+                    headers=headers,
                     data={"cf_auth": comment_csrf, "commentCount": 0},
                 )
 
@@ -401,6 +570,7 @@ def append_details(video, detail):
                 video_session,
                 "POST",
                 "https://commentfreely.bitchute.com/api/get_comment_count/",
+                headers=headers,
                 data={
                     "csrfmiddlewaretoken": video_csfrtoken,
                     "cf_thread": "bc_" + video["id"],
@@ -442,91 +612,150 @@ def append_details(video, detail):
     if published:
         video["timestamp"] = int(published.timestamp())
 
-    # may need to be increased? bitchute doesn't seem particularly strict
-    time.sleep(0.25)
     return (video, comments)
 
 
-def get_videos_user(session, user, csrftoken, detail):
+def get_videos_user(
+    client,
+    user,
+    detail,
+    since_id=None,
+    since_timestamp=None,
+    until_id=None,
+    until_timestamp=None,
+    offset=0,
+    max_items=100,
+    on_page=None,
+    concurrency=HTTP_CONCURRENCY,
+):
     """
     Scrape videos for given BitChute user
 
-    :param session:  HTTP Session to use
+    Listing entries are checked against ``since_id`` and ``since_timestamp``
+    before fetching their detail pages, so that an incremental scrape of a
+    channel without new videos only requests the first listing page. The
+    listing only shows the day a video was published, so videos less than
+    ``LISTING_DATE_MARGIN`` seconds older than ``since_timestamp`` are still
+    fetched, to be compared with their exact publication date.
+
+    With ``until_id`` and ``until_timestamp``, only videos older than a
+    previously scraped video are scraped, to backfill a channel. Listing
+    entries are skipped until that video is reached.
+
+    :param BitchuteClient client:  BitChute client to use
     :param str user:  Username to scrape videos for
-    :param str csrftoken:  CSRF token to use for requests
     :param str detail:  Detail level to scrape, basic/detail/comments
+    :param str since_id:  ID of a previously scraped video to stop at
+    :param float since_timestamp:  Timestamp to stop at
+    :param str until_id:  ID of a previously scraped video to start after
+    :param float until_timestamp:  Timestamp to start before
+    :param int offset:  Listing offset to start at
+    :param int max_items:  Maximum number of videos to scrape
+    :param on_page:  Function called with the listing offset to continue from
+        once the videos of each listing page have been consumed
+    :param int concurrency:  Number of video detail pages to fetch at once
 
     :return:  Video data dictionaries, as a generator
     """
-    max_items = 100
     num_items = 0
-    offset = 0
+    skipping = until_id is not None or until_timestamp is not None
 
     base_url = "https://www.bitchute.com/channel/%s/" % user
     url = base_url + "extend/"
 
-    container = session.get(base_url)
+    container = send_request("GET", base_url, session=client.session)
     container_soup = BeautifulSoup(container.text, "html.parser")
     headers = {"Referer": base_url, "Origin": "https://www.bitchute.com/"}
 
-    while True:
+    while num_items < max_items:
         post_data = {
-            "csrfmiddlewaretoken": csrftoken,
             "name": "",
             "offset": str(offset),
         }
 
-        response = request_from_bitchute(
-            session, "POST", url, headers=headers, data=post_data
-        )
+        response = client.post(url, headers=headers, data=post_data)
 
         soup = BeautifulSoup(response["html"], "html.parser")
         videos = soup.select(".channel-videos-container")
-        comments = []
 
-        if len(videos) == 0 or num_items >= max_items:
+        if len(videos) == 0:
             break
 
+        page_videos = []
+        seen = False
+
         for video_element in videos:
             if num_items >= max_items:
                 break
-            else:
-                num_items += 1
 
             offset += 1
 
             link = video_element.select_one(".channel-videos-title a")
-            video = {
-                "id": link["href"].split("/")[-2],
-                "thread_id": link["href"].split("/")[-2],
-                "subject": link.text,
-                "body": strip_tags(
-                    video_element.select_one(".channel-videos-text").text
-                ),
-                "author": container_soup.select_one(".details .name a").text,
-                "author_id": container_soup.select_one(".details .name a")[
-                    "href"
-                ].split("/")[2],
-                "timestamp": int(
-                    dateparser.parse(
-                        video_element.select_one(
-                            ".channel-videos-details.text-right.hidden-xs"
-                        ).text
-                    ).timestamp()
-                ),
-                "url": "https://www.bitchute.com" + link["href"],
-                "views": video_element.select_one(".video-views").text.strip(),
-                "length": video_element.select_one(".video-duration").text.strip(),
-                "thumbnail_image": video_element.select_one(
-                    ".channel-videos-image img"
-                )["src"],
-            }
-
-            if detail != "basic":
-                video, comments = append_details(video, detail)
-                if not video:
-                    # unrecoverable error while scraping details
-                    return
+            timestamp = int(
+                dateparser.parse(
+                    video_element.select_one(
+                        ".channel-videos-details.text-right.hidden-xs"
+                    ).text
+                ).timestamp()
+            )
+
+            if skipping:
+                if link["href"].split("/")[-2] == until_id:
+                    skipping = False
+                    continue
+                elif until_timestamp is None or timestamp > until_timestamp:
+                    continue
+
+            num_items += 1
+
+            if link["href"].split("/")[-2] == since_id or (
+                since_timestamp is not None
+                and timestamp < since_timestamp - LISTING_DATE_MARGIN
+            ):
+                seen = True
+                break
+
+            page_videos.append(
+                {
+                    "id": link["href"].split("/")[-2],
+                    "thread_id": link["href"].split("/")[-2],
+                    "subject": link.text,
+                    "body": strip_tags(
+                        video_element.select_one(".channel-videos-text").text
+                    ),
+                    "author": container_soup.select_one(".details .name a").text,
+                    "author_id": container_soup.select_one(".details .name a")[
+                        "href"
+                    ].split("/")[2],
+                    "timestamp": timestamp,
+                    "url": "https://www.bitchute.com" + link["href"],
+                    "views": video_element.select_one(".video-views").text.strip(),
+                    "length": video_element.select_one(".video-duration").text.strip(),
+                    "thumbnail_image": video_element.select_one(
+                        ".channel-videos-image img"
+                    )["src"],
+                }
+            )
+
+        if detail == "basic":
+            details = [(video, []) for video in page_videos]
+        else:
+            # the detail pages of the videos of a listing page are fetched concurrently
+            # the detail session is looked up in the worker thread running each call
+            details = map_concurrently(
+                lambda video: append_details(video, detail, client.detail_session),
+                page_videos,
+                concurrency,
+            )
+
+        for video, comments in details:
+            if not video:
+                # unrecoverable error while scraping details
+                return
+
+            if until_timestamp is not None and video["timestamp"] >= until_timestamp:
+                # listing date was on the same day as ``until``
+                continue
 
             yield video
             for comment in comments:
@@ -534,6 +763,12 @@ def get_videos_user(session, user, csrftoken, detail):
                 # before the video, which is weird
                 yield comment
 
+        if on_page is not None:
+            on_page(offset)
+
+        if seen:
+            break
+
 
 def decode_cfemail(cfemail):
     """https://stackoverflow.com/questions/36911296/scraping-of-protected-email"""
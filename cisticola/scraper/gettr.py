@@ -1,13 +1,56 @@
 import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Generator, Optional
+from typing import Generator, List, Optional, Tuple
 from urllib.parse import urlparse
 
+import requests
 from gogettr import PublicClient
+from gogettr.api import USER_AGENT, ApiClient, GettrApiError
+from gogettr.utils import merge
 from loguru import logger
 
 from cisticola.base import Channel, RawChannelInfo, ScraperResult
 from cisticola.scraper.base import Scraper
+from cisticola.utils import HTTP_CONCURRENCY, send_request
+
+#: Number of posts per page of the Gettr API
+PAGE_SIZE = 20
+
+
+class GettrApiClient(ApiClient):
+    """gogettr API client that makes its requests with
+    :py:func:`cisticola.utils.send_request`, so that they reuse pooled
+    connections and follow the rate limit and retry policy shared by all
+    scrapers."""
+
+    def get(
+        self, url: str, params: dict = None, retries: int = 3, key: str = "result"
+    ) -> dict:
+        try:
+            r = send_request(
+                "GET",
+                self.api_base_url + url,
+                max_retries=retries - 1,
+                break_codes=range(200, 500),
+                params=params,
+                timeout=10,
+                headers={"User-Agent": USER_AGENT},
+            )
+        except requests.RequestException as e:
+            raise GettrApiError({"error": str(e)}) from e
+
+        try:
+            data = r.json()
+        except ValueError:
+            raise GettrApiError({"status_code": r.status_code})
+
+        if key not in data:
+            raise GettrApiError(data)
+
+        return data[key]
 
 
 class GettrScraper(Scraper):
@@ -15,6 +58,28 @@ class GettrScraper(Scraper):
 
     __version__ = "GettrScraper 0.0.1"
 
+    #: Number of users whose posts are fetched at once by
+    #: :py:meth:`get_posts_of_channels`, ``1`` to fetch them sequentially
+    concurrency = HTTP_CONCURRENCY
+
+    #: Number of fetched pages of a user waiting to be consumed, see
+    #: :py:meth:`get_posts_of_channels`
+    max_buffered_pages = 5
+
+    #: Maximum number of older posts scraped from a channel by each backfill
+    #: (with ``until``), which resumes at the offset of the previous one
+    max_backfill_posts = 1000
+
+    def __init__(self):
+        super().__init__()
+
+        # shared by all channels
+        self.client = PublicClient()
+        self.client.api_client = GettrApiClient()
+
+        # threads fetching the posts of several users at once, created on first use
+        self.executor = None
+
     def get_username_from_url(self, url):
         username = url.split("gettr.com/user/")[1]
         if len(username.split("/")) > 1:
@@ -22,48 +87,261 @@ class GettrScraper(Scraper):
 
         return username
 
+    def get_pages(
+        self,
+        username: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        offset: int = 0,
+    ) -> Generator[Tuple[int, List[dict]], None, None]:
+        """Fetch the posts of a user from the Gettr API, newest first, like
+        ``PublicClient.user_activity`` but starting at an offset, so that
+        backfills can resume where they stopped.
+
+        Parameters
+        ----------
+        username: str
+            Lowercase username of the user
+        since: datetime or None
+            Stop at the first post published at or before this date.
+        until: datetime or None
+            Skip posts published at or after this date, and stop after
+            ``max_backfill_posts`` posts.
+        offset: int
+            Offset of the first post to fetch
+
+        Yields
+        ------
+        tuple
+            Offset of the next page, and posts of the current page.
+        """
+
+        num_posts = 0
+
+        for data in self.client.api_client.get_paginated(
+            f"/u/user/{username}/posts",
+            params={
+                "max": PAGE_SIZE,
+                "dir": "fwd",
+                "incl": "posts|stats|userinfo|shared|liked",
+                "fp": "f_uo",
+            },
+            offset_start=offset,
+            offset_step=PAGE_SIZE,
+        ):
+            offset += PAGE_SIZE
+            done = len(data["data"]["list"]) == 0
+            posts = []
+
+            for event in data["data"]["list"]:
+                id = event["activity"]["tgt_id"]
+
+                # information about posts is spread across three objects
+                post = merge(
+                    event, data["aux"]["post"].get(id), data["aux"]["s_pst"].get(id)
+                )
+                date = datetime.fromtimestamp(post["cdate"] * 0.001)
+
+                if since is not None and date <= since:
+                    done = True
+                    break
+
+                if until is not None and date >= until:
+                    continue
+
+                posts.append(post)
+
+            num_posts += len(posts)
+
+            yield offset, posts
+
+            if done or (until is not None and num_posts >= self.max_backfill_posts):
+                return
+
+    def _start_offset(
+        self, channel: Channel, until: Optional[ScraperResult] = None
+    ) -> int:
+        """Offset to start scraping a channel at, see :py:meth:`get_posts`."""
+
+        if until is None:
+            return 0
+
+        # posts published since the previous backfill shift the offsets, they
+        # are skipped by comparing with ``until``
+        cursor = self.get_cursor(channel)
+        offset = 0 if cursor is None else max(0, cursor["offset"] - PAGE_SIZE)
+
+        logger.info(
+            f"Only getting posts older than {until.platform_id}, from offset {offset}"
+        )
+
+        return offset
+
+    def _scraper_results(
+        self, channel: Channel, pages, save_cursor: bool
+    ) -> Generator[ScraperResult, None, None]:
+        for offset, posts in pages:
+            for post in posts:
+                archived_urls = {}
+
+                if "imgs" in post:
+                    for img in post["imgs"]:
+                        url = "https://media.gettr.com/" + img
+                        archived_urls[url] = None
+
+                if "main" in post:
+                    url = "https://media.gettr.com/" + post["main"]
+                    archived_urls[url] = None
+
+                if "ovid" in post:
+                    url = "https://media.gettr.com/" + post["ovid"]
+                    archived_urls[url] = None
+
+                yield ScraperResult(
+                    scraper=self.__version__,
+                    platform="Gettr",
+                    channel=channel.id,
+                    platform_id=post["_id"],
+                    date=datetime.fromtimestamp(post["cdate"] / 1000.0),
+                    date_archived=datetime.now(timezone.utc),
+                    raw_data=json.dumps(post),
+                    archived_urls=archived_urls,
+                    media_archived=None,
+                )
+
+            # saved once the posts of the page have been consumed (and stored)
+            if save_cursor:
+                self.save_cursor(channel, {"offset": offset})
+
     @logger.catch
     def get_posts(
-        self, channel: Channel, since: Optional[ScraperResult] = None
+        self,
+        channel: Channel,
+        since: Optional[ScraperResult] = None,
+        until: Optional[ScraperResult] = None,
     ) -> Generator[ScraperResult, None, None]:
-        client = PublicClient()
         username = self.get_username_from_url(channel.url).lower()
-        scraper = client.user_activity(username=username, type="posts")
+        pages = self.get_pages(
+            username,
+            since=None if since is None else since.date,
+            until=None if until is None else until.date,
+            offset=self._start_offset(channel, until),
+        )
 
-        for post in scraper:
-            if (
-                since is not None
-                and datetime.fromtimestamp(post["cdate"] * 0.001) <= since.date
-            ):
-                break
+        yield from self._scraper_results(channel, pages, save_cursor=until is not None)
 
-            archived_urls = {}
+    def get_posts_of_channels(
+        self,
+        jobs: List[Tuple[Channel, Optional[ScraperResult], Optional[ScraperResult]]],
+    ) -> Generator[Tuple[Channel, Generator[ScraperResult, None, None]], None, None]:
+        """Scrape posts from several channels, fetching the posts of up to
+        ``concurrency`` users at once, see
+        :py:meth:`cisticola.scraper.Scraper.get_posts_of_channels`.
 
-            if "imgs" in post:
-                for img in post["imgs"]:
-                    url = "https://media.gettr.com/" + img
-                    archived_urls[url] = None
+        Pages are handed over as soon as they are fetched, and fetching the
+        posts of a user pauses while ``max_buffered_pages`` of its pages are
+        waiting to be consumed. If fetching fails, the pages fetched before
+        are still yielded (and the cursor of a backfill saved for them). Other
+        errors are logged, and end the posts of the channel they occurred in.
+        """
 
-            if "main" in post:
-                url = "https://media.gettr.com/" + post["main"]
-                archived_urls[url] = None
-
-            if "ovid" in post:
-                url = "https://media.gettr.com/" + post["ovid"]
-                archived_urls[url] = None
-
-            yield ScraperResult(
-                scraper=self.__version__,
-                platform="Gettr",
-                channel=channel.id,
-                platform_id=post["_id"],
-                date=datetime.fromtimestamp(post["cdate"] / 1000.0),
-                date_archived=datetime.now(timezone.utc),
-                raw_data=json.dumps(post),
-                archived_urls=archived_urls,
-                media_archived=None,
+        if self.concurrency <= 1:
+            yield from super().get_posts_of_channels(jobs)
+            return
+
+        streams = []
+
+        try:
+            for channel, since, until in jobs:
+                # arguments are read on this thread, as they may be loaded lazily
+                # from the database session of the caller
+                try:
+                    arguments = (
+                        self.get_username_from_url(channel.url).lower(),
+                        None if since is None else since.date,
+                        None if until is None else until.date,
+                        self._start_offset(channel, until),
+                    )
+                except Exception:
+                    # like :py:meth:`get_posts`, no posts are found for the channel
+                    logger.exception(f"Could not start scraping {channel}")
+                    streams.append((channel, until, None, None, None))
+                    continue
+
+                pages = queue.Queue(maxsize=self.max_buffered_pages)
+                stop = threading.Event()
+                future = self._get_executor().submit(
+                    self._fetch_pages, arguments, pages, stop
+                )
+                streams.append((channel, until, pages, stop, future))
+
+            for channel, until, pages, stop, future in streams:
+                if future is None:
+                    yield channel, iter(())
+                    continue
+
+                yield channel, self._channel_results(
+                    channel,
+                    self._consume_pages(pages, stop),
+                    save_cursor=until is not None,
+                )
+        finally:
+            # the caller stopped early, don't fetch any further
+            for channel, until, pages, stop, future in streams:
+                if future is not None:
+                    stop.set()
+                    future.cancel()
+
+    @logger.catch
+    def _channel_results(
+        self, channel: Channel, pages, save_cursor: bool
+    ) -> Generator[ScraperResult, None, None]:
+        # errors are logged like in :py:meth:`get_posts`, so that they only end
+        # the posts of this channel and not the scraping of the other channels
+        yield from self._scraper_results(channel, pages, save_cursor)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # threads are kept alive, so that their pooled sessions are reused
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.concurrency, thread_name_prefix="gettr"
             )
 
+        return self.executor
+
+    def _fetch_pages(self, arguments: tuple, pages: queue.Queue, stop: threading.Event):
+        """Put the pages of :py:meth:`get_pages` into ``pages``, followed by
+        ``None``, until ``stop`` is set."""
+
+        def put(page) -> bool:
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for page in self.get_pages(*arguments):
+                if not put(page):
+                    return
+        except Exception:
+            logger.exception(f"Could not get all posts of Gettr user {arguments[0]}")
+
+        put(None)
+
+    @staticmethod
+    def _consume_pages(pages: queue.Queue, stop: threading.Event):
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                yield page
+        finally:
+            stop.set()
+
     def can_handle(self, channel):
         if (
             channel.platform == "Gettr"
@@ -78,9 +356,8 @@ class GettrScraper(Scraper):
 
     @logger.catch
     def get_profile(self, channel: Channel) -> RawChannelInfo:
-        client = PublicClient()
         username = self.get_username_from_url(channel.url)
-        profile = client.user_info(username)
+        profile = self.client.user_info(username)
 
         return RawChannelInfo(
             scraper=self.__version__,
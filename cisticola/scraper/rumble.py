@@ -9,6 +9,7 @@ from loguru import logger
 
 from cisticola.base import Channel, RawChannelInfo, ScraperResult
 from cisticola.scraper import Scraper, make_request
+from cisticola.utils import HTTP_CONCURRENCY, html_to_text, map_concurrently
 
 BASE_URL = "https://rumble.com"
 
@@ -23,18 +24,47 @@ class RumbleScraper(Scraper):
     )
     cookiefilename = "cookiefile.txt"
 
+    #: Number of videos of a listing page processed at once, ``1`` to process
+    #: them sequentially
+    concurrency = HTTP_CONCURRENCY
+
+    #: Maximum number of older videos scraped from a channel by each backfill
+    #: (with ``until``), which resumes at the listing page of the previous one
+    max_backfill_videos = 1000
+
     @logger.catch
     def get_posts(
-        self, channel: Channel, since: Optional[ScraperResult] = None
+        self,
+        channel: Channel,
+        since: Optional[ScraperResult] = None,
+        until: Optional[ScraperResult] = None,
     ) -> Generator[ScraperResult, None, None]:
-        scraper = get_channel_videos(channel.url)
+        if until is not None:
+            # resume the listing where the previous backfill stopped, videos
+            # posted since then are skipped by comparing with ``until``
+            cursor = self.get_cursor(channel)
+            page = 1 if cursor is None else max(1, cursor["page"] - 1)
+
+            logger.info(
+                f"Only getting videos older than {until.date}, from listing page {page}"
+            )
 
-        for post in scraper:
-            if since is not None and post["datetime"].replace(
-                tzinfo=timezone.utc
-            ) <= since.date.replace(tzinfo=timezone.utc):
-                break
+            scraper = get_channel_videos(
+                channel.url,
+                until=until.date,
+                page=page,
+                max_videos=self.max_backfill_videos,
+                on_page=lambda page: self.save_cursor(channel, {"page": page}),
+                concurrency=self.concurrency,
+            )
+        else:
+            scraper = get_channel_videos(
+                channel.url,
+                since=None if since is None else since.date,
+                concurrency=self.concurrency,
+            )
 
+        for post in scraper:
             url = post["media_url"]
 
             archived_urls = {url: None}
@@ -84,12 +114,11 @@ class RumbleScraper(Scraper):
         )
 
 
-def get_media_url(url):
-    r = make_request(url=url)
-    soup = BeautifulSoup(r.content, features="html.parser")
+def get_embed_url(content):
+    """Return the embed URL of a video from the ld+json metadata of its page."""
 
     script = json.loads(
-        "".join(soup.find("script", {"type": "application/ld+json"}).text)
+        html_to_text(content, select="//script[@type='application/ld+json']")
     )
     media_url = script[0]["embedUrl"]
 
@@ -119,9 +148,11 @@ def process_video(video):
 
     video_link = BASE_URL + video.find("a", href=True)["href"]
     r = make_request(url=video_link)
-    soup = BeautifulSoup(r.content, features="html.parser")
-
-    content_div = soup.find("div", {"class": "container content media-description"})
+    content = html_to_text(
+        r.content,
+        select="//div[@class='container content media-description']",
+        separator="\n",
+    )
 
     info = {
         "title": video.find("h3").text,
@@ -129,23 +160,65 @@ def process_video(video):
         "link": video_link,
         "views": views,
         "rumbles": rumbles,
-        "content": "" if content_div is None else content_div.get_text("\n"),
+        "content": "" if content is None else content,
         "duration": video.find("span", {"class": "video-item--duration"})["data-value"],
         "datetime": datetime.fromisoformat(video.find("time")["datetime"]),
         "author_id": author_id,
         "author_name": author_name,
     }
 
-    info["media_url"] = get_media_url(info["link"])
+    # the video page was already fetched, so the embed URL is read from it
+    info["media_url"] = get_embed_url(r.content)
 
     return info
 
 
-def get_channel_videos(url):
-    page = 1
+def get_channel_videos(
+    url,
+    since=None,
+    until=None,
+    page=1,
+    max_videos=None,
+    on_page=None,
+    concurrency=HTTP_CONCURRENCY,
+):
+    """Scrape the videos of a Rumble channel, newest first.
+
+    Parameters
+    ----------
+    url : str
+        URL of the channel
+    since : datetime or None
+        Stop at the first video published at or before this date, which is
+        read from the listing before fetching the video page.
+    until : datetime or None
+        Skip videos published at or after this date, to backfill the channel.
+    page : int
+        Listing page to start at
+    max_videos : int or None
+        Maximum number of videos to scrape, the remaining videos of the last
+        listing page are scraped too.
+    on_page : callable or None
+        Function called with the number of the next listing page once the
+        videos of each listing page have been consumed
+    concurrency : int
+        Number of video pages fetched at once
+
+    Yields
+    ------
+    dict
+        Video information, see :py:func:`process_video`
+    """
+
     channel_url = f"{url}?page="
+    num_videos = 0
 
-    while True:
+    if since is not None:
+        since = since.replace(tzinfo=timezone.utc)
+    if until is not None:
+        until = until.replace(tzinfo=timezone.utc)
+
+    while max_videos is None or num_videos < max_videos:
         url = channel_url + str(page)
         r = make_request(url=url, break_codes=[404])
 
@@ -156,11 +229,36 @@ def get_channel_videos(url):
 
         video_list = soup.find_all("li", {"class": "video-listing-entry"})
 
+        new_videos = []
+        seen = False
         for video in video_list:
-            yield process_video(video)
+            date = listing_date(video)
+            if since is not None and date <= since:
+                seen = True
+                break
+            if until is None or date < until:
+                new_videos.append(video)
+
+        # the video pages of a listing page are fetched concurrently
+        yield from map_concurrently(process_video, new_videos, concurrency)
+        num_videos += len(new_videos)
 
         page += 1
 
+        if on_page is not None:
+            on_page(page)
+
+        if seen:
+            break
+
+
+def listing_date(video):
+    """Return the publication date of a video entry of a channel listing."""
+
+    return datetime.fromisoformat(video.find("time")["datetime"]).replace(
+        tzinfo=timezone.utc
+    )
+
 
 def get_channel_profile(url):
     channel_url = f"{url}"
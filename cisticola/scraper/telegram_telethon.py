@@ -13,6 +13,7 @@ from telethon.tl.functions.channels import GetFullChannelRequest
 
 from cisticola.base import Channel, RawChannelInfo, ScraperResult
 from cisticola.scraper.base import Scraper
+from cisticola.utils import decode_json, strip_redundant_telethon_data
 
 MEDIA_TYPES = ["photo", "video", "document", "webpage"]
 
@@ -23,6 +24,11 @@ class TelegramTelethonScraper(Scraper):
     __version__ = "TelegramTelethonScraper 0.0.4"
     client = None
 
+    #: If ``True``, expiring file references and inline thumbnails are left out
+    #: of the raw data of newly scraped posts and profiles (see
+    #: :py:func:`cisticola.utils.strip_redundant_telethon_data`)
+    strip_redundant_data = False
+
     def __init__(self, telethon_session_name=None):
         super().__init__()
 
@@ -72,7 +78,7 @@ class TelegramTelethonScraper(Scraper):
             key = list(result.archived_urls.keys())[0]
 
             if result.archived_urls[key] is None:
-                raw = json.loads(result.raw_data)
+                raw = decode_json(result.raw_data, fields=("peer_id", "id"))
 
                 message = self.client.get_messages(
                     raw["peer_id"]["channel_id"], ids=[raw["id"]]
@@ -194,7 +200,7 @@ class TelegramTelethonScraper(Scraper):
                 platform_id=post_url,
                 date=post.date.replace(tzinfo=timezone.utc),
                 date_archived=datetime.now(timezone.utc),
-                raw_data=json.dumps(post.to_dict(), default=str),
+                raw_data=json.dumps(self._to_dict(post), default=str),
                 archived_urls=archived_urls,
                 media_archived=media_archived,
             )
@@ -215,18 +221,26 @@ class TelegramTelethonScraper(Scraper):
                 platform_id=post_url,
                 date=post.date.replace(tzinfo=timezone.utc),
                 date_archived=datetime.now(timezone.utc),
-                raw_data=json.dumps(post.to_dict(), default=str),
+                raw_data=json.dumps(self._to_dict(post), default=str),
                 archived_urls=archived_urls,
                 media_archived=media_archived,
             )
             for p in self.get_posts(channel, since=since, until=new_until):
                 yield p
 
+    def _to_dict(self, tlobject) -> dict:
+        data = tlobject.to_dict()
+
+        if self.strip_redundant_data:
+            data = strip_redundant_telethon_data(data)
+
+        return data
+
     @logger.catch
     def get_profile(self, channel: Channel) -> RawChannelInfo:
         username = TelegramTelethonScraper.get_channel_identifier(channel)
         full_channel = self.client(GetFullChannelRequest(channel=username))
-        profile = full_channel.to_dict()
+        profile = self._to_dict(full_channel)
 
         return RawChannelInfo(
             scraper=self.__version__,
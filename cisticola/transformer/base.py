@@ -1,10 +1,32 @@
+import json
+import queue
+import sys
+import threading
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Callable, List
+from types import SimpleNamespace
+from typing import Callable, List, Optional
 
 from loguru import logger
-from sqlalchemy import String, cast
+from sqlalchemy import (
+    String,
+    case,
+    cast,
+    column,
+    exists,
+    false,
+    func,
+    insert,
+    literal,
+    or_,
+    select,
+    true,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.engine.base import Engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.orm import Bundle, Session, sessionmaker
 
 from cisticola.base import (
     Audio,
@@ -16,8 +38,40 @@ from cisticola.base import (
     RawChannelInfo,
     ScraperResult,
     Video,
+    channel_identity_columns,
+    channel_identity_table,
+    channel_table,
     mapper_registry,
+    post_table,
+    raw_data_projection,
 )
+from cisticola.compression import get_codec
+from cisticola.utils import decode_json
+
+#: Number of times :py:meth:`ETLController.upsert_channel` looks a channel up
+#: again after another process claimed its identity keys, before giving up
+CHANNEL_INSERT_ATTEMPTS = 5
+
+
+@dataclass
+class TransformContext:
+    """Database access shared by a Transformer while it transforms a batch of
+    ScraperResults.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+        SQLAlchemy Session that interfaces with the database
+    insert : Callable
+        A function that either inserts the object into a database or finds an object with the
+        relevant unique constraints if applicable.
+    flush_posts : Callable
+        A function that saves all outstanding posts to the database.
+    """
+
+    session: Session
+    insert: Callable
+    flush_posts: Callable
 
 
 class Transformer:
@@ -25,12 +79,21 @@ class Transformer:
 
     __version__ = "Transformer 0.0.0"
 
+    #: Top-level keys of the raw data used by ``transform_media``. Only these are
+    #: fetched by :py:meth:`ETLController.transform_all_untransformed_media`.
+    media_fields = ()
+
+    #: Name of the scraper whose results the Transformer handles, e.g. ``"GettrScraper"``.
+    #: Used by the ETLController to dispatch results without calling ``can_handle``.
+    scraper_name = None
+
     def __init__(self):
         pass
 
     def can_handle(self, data: ScraperResult) -> bool:
         """Specifies whether or not a Transformer is capable of handling a particular
-        piece of scraped data.
+        piece of scraped data. By default, this compares the name of the scraper
+        that generated ``data`` with ``scraper_name``.
 
         Parameters
         ----------
@@ -43,7 +106,10 @@ class Transformer:
             ``True`` if it can be handled by this Transformer, false otherwise.
         """
 
-        raise NotImplementedError
+        if self.scraper_name is None:
+            raise NotImplementedError
+
+        return data.scraper.split(" ")[0] == self.scraper_name
 
     def transform(
         self,
@@ -67,13 +133,31 @@ class Transformer:
 
         raise NotImplementedError
 
+    def transform_batch(self, results: List[ScraperResult], ctx: TransformContext):
+        """Transform a batch of ScraperResults, all of which can be handled by this
+        Transformer. Transformers can override this to look up the channels and
+        posts referenced by the whole batch at once, instead of item by item.
+        By default, each result is passed to ``transform`` in order.
+
+        Parameters
+        ----------
+        results : List[ScraperResult]
+            The ScraperResult objects to process.
+        ctx : TransformContext
+            Session and insert functions to use while transforming the batch.
+        """
+
+        for data in results:
+            self.transform(data, ctx.insert, ctx.session, ctx.flush_posts)
+
     def transform_media(self, data: ScraperResult, transformed: Post, insert: Callable):
         """Transform a post's media attachment to standard form and insert into database.
 
         Parameters
         ----------
         data: cisticola.base.ScraperResult
-            Raw post data of post that media file was attached to
+            Raw post data of post that media file was attached to. Its ``raw_data``
+            may only contain the keys listed in ``media_fields``.
         transformed: cisticola.base.Post
             Transformed post data of post that media file was attached to
         insert: Callable
@@ -116,11 +200,39 @@ class ETLController:
     for analysis by using Transformer objects that have been registered with the controller.
     """
 
-    posts_to_insert = []
-
-    def __init__(self):
+    def __init__(self, max_buffered_posts: int = 1000):
+        """
+        Parameters
+        ----------
+        max_buffered_posts : int
+            Number of posts held in ``posts_to_insert`` before they are automatically
+            saved to the database.
+        """
         self.transformers = []
 
+        # registered transformers by name of the scraper they handle, and a cache
+        # of the transformer handling each scraper version string
+        self.transformers_by_scraper = {}
+        self.transformer_cache = {}
+
+        # posts waiting to be saved in bulk, see ``flush_posts``
+        self.posts_to_insert = []
+        self.posts_lock = threading.Lock()
+        # held while a batch taken from ``posts_to_insert`` is being saved (or
+        # handed to the post writer), so that a flush waits for posts that
+        # another thread took from the buffer before it
+        self.flush_lock = threading.Lock()
+        self.max_buffered_posts = max_buffered_posts
+
+        # map of (platform, kind, value) channel identity keys to channel IDs
+        self.channel_identities = {}
+
+        # while a post writer thread is running, posts to be saved by it, and
+        # the exception it raised, if any
+        self.posts_queue = None
+        self.post_writer = None
+        self.post_writer_error = None
+
     def register_transformer(self, transformer: Transformer):
         """Add a single Transformer instance to the list of available Transformers.
 
@@ -132,6 +244,49 @@ class ETLController:
 
         self.transformers.append(transformer)
 
+        if transformer.scraper_name is not None:
+            self.transformers_by_scraper.setdefault(
+                transformer.scraper_name, transformer
+            )
+
+        self.transformer_cache = {}
+
+    def get_transformer(self, data) -> Optional[Transformer]:
+        """Find the registered Transformer that can handle a piece of scraped data.
+        The lookup is done once per distinct scraper version string, so
+        dispatching a result is a dict lookup.
+
+        Parameters
+        ----------
+        data : ScraperResult or RawChannelInfo
+            Scraped data to be transformed
+
+        Returns
+        -------
+        Transformer or None
+            Transformer that can handle ``data``, or None if there is none.
+        """
+        if data.scraper is None or data.platform is None:
+            return None
+
+        if data.scraper not in self.transformer_cache:
+            transformer = self.transformers_by_scraper.get(data.scraper.split(" ")[0])
+
+            if transformer is None:
+                # transformers that implement their own ``can_handle``
+                transformer = next(
+                    (
+                        t
+                        for t in self.transformers
+                        if t.scraper_name is None and t.can_handle(data)
+                    ),
+                    None,
+                )
+
+            self.transformer_cache[data.scraper] = transformer
+
+        return self.transformer_cache[data.scraper]
+
     def register_transformers(self, transformers):
         """Add a a list of Transformer instances to the list of available Transformers.
 
@@ -158,18 +313,135 @@ class ETLController:
         self.session = sessionmaker(expire_on_commit=False)
         self.session.configure(bind=engine)
 
-    # MAY4 can try adding some new functions for batching post inserts
-    def flush_posts(self, session):
+    def flush_posts(self, session, wait: bool = True) -> List[Post]:
         """Save all outstanding posts to the database. For efficiency, instead of saving posts one at a time, the ETLController maintains a list of posts (``posts_to_insert``) and saves them in bulk.
 
+        The posts are inserted with a single multi-row ``INSERT ... RETURNING id``
+        and their ``id`` attributes are set. The buffer can be filled from
+        multiple threads, each flushing with its own session.
+
+        If a post writer is running (see ``start_post_writer``), ``session`` is
+        committed, since the posts can reference channels added in it, and the
+        posts are handed to the writer thread.
+
         Parameters
         ----------
         session: sqlalchemy.orm.Session
             SQLAlchemy Session that interfaces with the database
+        wait: bool
+            If a post writer is running, whether to wait until it has saved all
+            outstanding posts, e.g. because they are about to be looked up.
+
+        Returns
+        -------
+        list[cisticola.base.Post]
+            Posts that were saved (or handed to the post writer), with their primary key IDs
+            if they have been saved.
         """
-        session.bulk_save_objects(self.posts_to_insert)
-        # logger.info(f"Bulk saved {len(self.posts_to_insert)} posts")
-        self.posts_to_insert = []
+        posts_queue = self.posts_queue
+
+        with self.flush_lock:
+            with self.posts_lock:
+                posts = self.posts_to_insert
+                self.posts_to_insert = []
+
+            if posts_queue is not None:
+                session.commit()
+
+                if len(posts) > 0:
+                    posts_queue.put(posts)
+            elif len(posts) > 0:
+                self.save_posts(posts, session)
+
+        if posts_queue is not None:
+            if wait:
+                posts_queue.join()
+
+            if self.post_writer_error is not None:
+                raise self.post_writer_error
+
+        return posts
+
+    def save_posts(self, posts: List[Post], session):
+        """Insert posts with a single multi-row ``INSERT ... RETURNING id`` and set
+        their ``id`` attributes.
+
+        Parameters
+        ----------
+        posts: list[cisticola.base.Post]
+            Posts to be saved
+        session: sqlalchemy.orm.Session
+            SQLAlchemy Session that interfaces with the database
+        """
+        columns = [c.name for c in post_table.c if c.name != "id"]
+        ids = session.scalars(
+            insert(post_table).returning(post_table.c.id, sort_by_parameter_order=True),
+            [{column: getattr(post, column) for column in columns} for post in posts],
+        ).all()
+
+        for post, post_id in zip(posts, ids):
+            post.id = post_id
+
+        logger.trace(f"Bulk saved {len(posts)} posts")
+
+    def start_post_writer(self, max_queued_batches: int = 2):
+        """Start a thread that saves posts handed to it by ``flush_posts`` with
+        its own session, so that posts are written while the next ones are
+        transformed.
+
+        Parameters
+        ----------
+        max_queued_batches: int
+            Number of batches of posts waiting to be saved before ``flush_posts``
+            blocks.
+        """
+        self.posts_queue = queue.Queue(maxsize=max_queued_batches)
+        self.post_writer_error = None
+        self.post_writer = threading.Thread(
+            target=self._write_posts, args=(self.posts_queue,), daemon=True
+        )
+        self.post_writer.start()
+
+    def stop_post_writer(self):
+        """Wait until the post writer has saved all posts handed to it, and stop it.
+        Raises the error of the writer, if it failed and no other exception is
+        being handled."""
+
+        if self.post_writer is None:
+            return
+
+        self.posts_queue.put(None)
+        self.post_writer.join()
+
+        self.posts_queue = None
+        self.post_writer = None
+
+        # when stopped while an exception is raised (e.g. from a ``finally``
+        # block), that exception is kept, and the error of the writer is only
+        # logged by the writer
+        if self.post_writer_error is not None and sys.exc_info()[1] is None:
+            raise self.post_writer_error
+
+    def _write_posts(self, posts_queue: queue.Queue):
+        session = self.session()
+
+        while True:
+            posts = posts_queue.get()
+
+            try:
+                if posts is None:
+                    return
+
+                # after an error, posts are discarded until the writer is stopped
+                if self.post_writer_error is None:
+                    self.save_posts(posts, session)
+                    session.commit()
+            except Exception as e:
+                logger.error(f"Post writer failed to save {len(posts)} posts: {e}")
+                session.rollback()
+                self.post_writer_error = e
+            finally:
+                posts_queue.task_done()
 
     def insert_post(self, obj, session, hydrate: bool = True, flush: bool = False):
         """Insert an object into the connected database.
@@ -183,8 +455,8 @@ class ETLController:
         hydrate: bool
             If ``True``, additional data fields are extracted from the object and populated in the given database table
         flush: bool
-            If ``True``, the object is returned with additional populated data fields (such as a primary key ID).
-            If ``False``, the object is added to ``posts_to_insert`` and nothing is returned
+            If ``True``, the object and all other outstanding posts are saved, and the object is returned with additional populated data fields (such as a primary key ID).
+            If ``False``, the object is added to ``posts_to_insert`` (which is saved once it holds ``max_buffered_posts`` posts) and nothing is returned
 
         Returns
         -------
@@ -193,17 +465,17 @@ class ETLController:
         if hydrate and type(obj) != Video:
             obj.hydrate()
 
-        if flush:
-            self.flush_posts(session=session)
+        with self.posts_lock:
+            self.posts_to_insert.append(obj)
+            full = len(self.posts_to_insert) >= self.max_buffered_posts
 
-            session.add(obj)
-            session.flush()
+        if flush or full:
+            self.flush_posts(session=session, wait=flush)
 
+        if flush:
             logger.trace(f"Inserted new object {obj}")
-
             return obj
         else:
-            self.posts_to_insert.append(obj)
             return None
 
     def insert_or_select(self, obj, session, hydrate: bool = True):
@@ -226,33 +498,8 @@ class ETLController:
 
         instance = None
 
-        # This is using some adhoc unique constraints that might be worth formalizing at some point
         if type(obj) == Channel:
-            instance = (
-                session.query(Channel)
-                .filter(
-                    (
-                        (
-                            (Channel.url == obj.url)
-                            & (Channel.url != "")
-                            & (Channel.url is not None)
-                            & (Channel.url != "https://t.me/s/")
-                        )
-                        | (
-                            (Channel.platform_id == str(obj.platform_id))
-                            & (Channel.platform_id != "")
-                            & (Channel.platform_id is not None)
-                        )
-                        | (
-                            (Channel.screenname == obj.screenname)
-                            & (Channel.screenname != "")
-                            & (Channel.screenname is not None)
-                        )
-                    )
-                    & (Channel.platform == obj.platform)
-                )
-                .first()
-            )
+            return self.upsert_channel(obj, session)
 
         elif type(obj) == Post:
             # attempt to add to current batch
@@ -285,29 +532,6 @@ class ETLController:
 
         if instance:
             logger.info(f"Found matching DB entry for {obj}: {instance}")
-
-            if type(obj) == Channel:
-                if (
-                    obj.source != instance.source
-                    and obj.source == "linked_channel"
-                    and instance.source != "researcher"
-                    and (instance.source is None or instance.source[:4] != "snow")
-                ):
-                    logger.info("Updating source to linked channel")
-                    instance.source = obj.source
-                    instance.notes = obj.notes
-                    instance.category = obj.category
-                    instance.country = obj.country
-                    instance.influencer = obj.influencer
-
-                    session.flush()
-                    session.commit()
-
-                if instance.platform_id is None or instance.platform_id == "":
-                    instance.platform_id = obj.platform_id
-                    session.flush()
-                    session.commit()
-
             return instance
 
         # Don't hydrate videos, because they can be quite large and this is time consuming
@@ -321,6 +545,319 @@ class ETLController:
 
         return obj
 
+    def upsert_channel(self, obj: Channel, session: Session) -> Channel:
+        """Insert a channel into the database, or update the existing channel
+        with the same identity (see :py:meth:`select_channel`).
+
+        An existing channel is updated when ``obj`` is a ``linked_channel`` and
+        the existing channel was not added by a researcher or by snowballing,
+        or when the existing channel has no platform ID yet. A new channel is
+        inserted in the same statement as all of its identity keys, using
+        ``INSERT ... ON CONFLICT DO NOTHING``. If another process claimed any of
+        the keys concurrently, the statement is rolled back and the channel of
+        that process is updated instead, so that concurrent ETL processes never
+        insert the same channel twice.
+
+        Channels are inserted and updated in short transactions of their own,
+        committed right away rather than with the batch transformed in
+        ``session``, so that concurrent processes never hold locks on each
+        other's channels and identity keys for the length of a batch.
+
+        Parameters
+        ----------
+        obj: cisticola.base.Channel
+            Channel to insert
+        session: sqlalchemy.orm.Session
+            SQLAlchemy Session that interfaces with the database
+
+        Returns
+        -------
+        cisticola.base.Channel
+            Existing or inserted channel, with its ``id``.
+
+        Raises
+        ------
+        RuntimeError
+            If the keys of the channel were claimed concurrently
+            ``CHANNEL_INSERT_ATTEMPTS`` times without the channel that claimed
+            them being found.
+        """
+        for attempt in range(1, CHANNEL_INSERT_ATTEMPTS + 1):
+            instance = self.select_channel(obj, session)
+
+            if instance is not None:
+                return self._update_channel(instance, obj, session)
+
+            keys = sorted(obj.identity_keys())
+
+            if obj.platform is None or len(keys) == 0:
+                session.add(obj)
+                session.flush()
+
+                logger.trace(f"Inserted new object {obj}")
+                return obj
+
+            # the statement claims the keys in sorted order, so that concurrent
+            # statements claiming shared keys wait for each other instead of
+            # deadlocking, and it is committed before any other key is claimed
+            with session.get_bind().connect() as connection:
+                claimed = connection.execute(
+                    self._insert_channel_statement(obj, keys)
+                ).all()
+
+                if len(claimed) == len(keys):
+                    connection.commit()
+                    break
+
+                # another process claimed some of the keys, its channel is
+                # selected (or the keys are claimed again if it rolled back)
+                connection.rollback()
+
+            logger.debug(
+                f"Identity keys of {obj} were claimed concurrently (attempt {attempt}/{CHANNEL_INSERT_ATTEMPTS})"
+            )
+        else:
+            logger.error(
+                f"Could not insert or select {obj} after {CHANNEL_INSERT_ATTEMPTS} attempts"
+            )
+            raise RuntimeError(
+                f"Identity keys of {obj} were claimed concurrently {CHANNEL_INSERT_ATTEMPTS} times"
+            )
+
+        obj.id = claimed[0].channel
+        for kind, value, channel_id in claimed:
+            self.channel_identities[(obj.platform, kind, value)] = channel_id
+
+        logger.trace(f"Inserted new object {obj}")
+        return obj
+
+    def _insert_channel_statement(self, obj: Channel, keys: list):
+        """Statement inserting the identity ``keys`` of ``obj`` that are not
+        claimed yet, and ``obj`` itself if any of them is inserted, returning
+        the inserted keys."""
+
+        # the keys and the channel are inserted in one statement, as foreign
+        # keys are only checked at its end
+        new_id = select(
+            func.nextval(
+                func.pg_get_serial_sequence(channel_table.name, channel_table.c.id.name)
+            ).label("id")
+        ).cte("new_id")
+        new_keys = values(
+            column("kind", String), column("value", String), name="new_keys"
+        ).data(keys)
+
+        identities = channel_identity_table.c
+        claimed = (
+            pg_insert(channel_identity_table)
+            .from_select(
+                ["platform", "kind", "value", "channel"],
+                select(
+                    literal(obj.platform, String),
+                    new_keys.c.kind,
+                    new_keys.c.value,
+                    new_id.c.id,
+                )
+                .select_from(new_keys.join(new_id, true()))
+                .order_by(new_keys.c.kind, new_keys.c.value),
+            )
+            .on_conflict_do_nothing(
+                index_elements=[identities.platform, identities.kind, identities.value]
+            )
+            .returning(identities.kind, identities.value, identities.channel)
+            .cte("claimed")
+        )
+
+        columns = [c for c in channel_table.c if c.name != "id"]
+        inserted_channel = (
+            insert(channel_table)
+            .from_select(
+                ["id"] + [c.name for c in columns],
+                select(
+                    new_id.c.id,
+                    *[literal(self._channel_value(obj, c), c.type) for c in columns],
+                ).where(exists(select(claimed.c.channel))),
+            )
+            .cte("inserted_channel")
+        )
+
+        return select(claimed.c.kind, claimed.c.value, claimed.c.channel).add_cte(
+            inserted_channel
+        )
+
+    def _update_channel(self, instance: Channel, obj: Channel, session: Session):
+        """Apply :py:meth:`_channel_update` of ``obj`` to the existing channel
+        ``instance`` and register its identity keys."""
+
+        logger.info(f"Found matching DB entry for {obj}: {instance}")
+
+        values, condition = self._channel_update(obj)
+        if values:
+            # committed right away, like inserted channels (see upsert_channel)
+            with session.get_bind().begin() as connection:
+                updated = connection.execute(
+                    update(channel_table)
+                    .where((channel_table.c.id == instance.id) & condition)
+                    .values(values)
+                )
+            if updated.rowcount > 0:
+                logger.info(f"Updated {instance} from {obj}")
+                session.expire(instance)
+
+        self.register_channel_identities(instance, session)
+        return instance
+
+    @staticmethod
+    def _channel_value(obj: Channel, column):
+        value = getattr(obj, column.name)
+        if column.name == "platform_id" and value is not None:
+            value = str(value)
+        return value
+
+    def _channel_update(self, obj: Channel):
+        """Column values and condition of the update applied to an existing
+        channel with the same identity as ``obj``. Values are only changed where
+        the condition is true, i.e. the precedence rules for channel sources.
+        """
+        c = channel_table.c
+        values = {}
+        conditions = []
+
+        if obj.source == "linked_channel":
+            # don't overwrite channels added by researchers or by snowballing
+            source_condition = func.coalesce(c.source, "").notin_(
+                ["linked_channel", "researcher"]
+            ) & (func.left(func.coalesce(c.source, ""), 4) != "snow")
+            conditions.append(source_condition)
+
+            for column in (c.source, c.notes, c.category, c.country, c.influencer):
+                values[column] = case(
+                    (
+                        source_condition,
+                        literal(self._channel_value(obj, column), column.type),
+                    ),
+                    else_=column,
+                )
+
+        if obj.platform_id not in (None, ""):
+            platform_id_condition = (c.platform_id == None) | (c.platform_id == "")
+            conditions.append(platform_id_condition)
+
+            values[c.platform_id] = case(
+                (
+                    platform_id_condition,
+                    literal(
+                        self._channel_value(obj, c.platform_id), c.platform_id.type
+                    ),
+                ),
+                else_=c.platform_id,
+            )
+
+        return values, or_(false(), *conditions)
+
+    def select_channel(self, obj: Channel, session: Session):
+        """Find the existing channel in the database that has the same identity
+        (URL, platform ID or screenname on the same platform) as ``obj``.
+
+        Keys are looked up in order of precedence, first in the identity map
+        of this ETLController, then in the ``channel_identities`` table, and
+        finally in the ``channels`` table for channels that were added outside
+        of the ETL and have no registered identity keys yet.
+
+        Parameters
+        ----------
+        obj: cisticola.base.Channel
+            Channel to look up
+        session: sqlalchemy.orm.Session
+            SQLAlchemy Session that interfaces with the database
+
+        Returns
+        -------
+        Existing Channel from the database, or None.
+        """
+        if obj.platform is None:
+            return None
+
+        keys = [(obj.platform, kind, value) for kind, value in obj.identity_keys()]
+
+        for key in keys:
+            if key in self.channel_identities:
+                return session.get(Channel, self.channel_identities[key])
+
+        for key in keys:
+            platform, kind, value = key
+            instance = (
+                session.query(Channel)
+                .join(
+                    channel_identity_table,
+                    Channel.id == channel_identity_table.c.channel,
+                )
+                .filter(
+                    (channel_identity_table.c.platform == platform)
+                    & (channel_identity_table.c.kind == kind)
+                    & (channel_identity_table.c.value == value)
+                )
+                .first()
+            )
+
+            if instance is not None:
+                self.channel_identities[key] = instance.id
+                return instance
+
+        for platform, kind, value in keys:
+            instance = (
+                session.query(Channel)
+                .filter(
+                    (Channel.platform == platform)
+                    & (channel_identity_columns[kind] == value)
+                )
+                .first()
+            )
+
+            if instance is not None:
+                return instance
+
+        return None
+
+    def register_channel_identities(self, channel: Channel, session: Session):
+        """Add the identity keys of a channel to the ``channel_identities`` table
+        and to the identity map of this ETLController. Keys that already
+        identify another channel are left unchanged.
+
+        Parameters
+        ----------
+        channel: cisticola.base.Channel
+            Channel that has been inserted into the database
+        session: sqlalchemy.orm.Session
+            SQLAlchemy Session that interfaces with the database
+        """
+        if channel.platform is None:
+            return
+
+        rows = [
+            dict(platform=channel.platform, kind=kind, value=value, channel=channel.id)
+            for kind, value in channel.identity_keys()
+            if (channel.platform, kind, value) not in self.channel_identities
+        ]
+
+        if len(rows) == 0:
+            return
+
+        # committed right away, like the keys of inserted channels (see
+        # upsert_channel)
+        with session.get_bind().begin() as connection:
+            inserted = connection.execute(
+                pg_insert(channel_identity_table)
+                .values(rows)
+                .on_conflict_do_nothing()
+                .returning(
+                    channel_identity_table.c.kind, channel_identity_table.c.value
+                )
+            ).all()
+
+        for kind, value in inserted:
+            self.channel_identities[(channel.platform, kind, value)] = channel.id
+
     @logger.catch(reraise=True)
     def transform_results(self, results: List[ScraperResult], hydrate: bool = True):
         """Transform raw ScraperResults objects into Post objects and
@@ -339,32 +876,32 @@ class ETLController:
 
         session = self.session()
 
+        ctx = TransformContext(
+            session=session,
+            insert=lambda obj: self.insert_or_select(obj, session, hydrate),
+            flush_posts=lambda: self.flush_posts(session),
+        )
+
+        # group results by transformer, keeping the order of results within each group
+        batches = {}
+
         for result in results:
-            if result.scraper is not None and result.platform is not None:
-                for transformer in self.transformers:
-                    handled = False
-
-                    if transformer.can_handle(result):
-                        logger.trace(
-                            f"{transformer} is handling result {result.id} ({result.date})"
-                        )
-                        handled = True
-
-                        transformer.transform(
-                            result,
-                            lambda obj: self.insert_or_select(obj, session, hydrate),
-                            session,
-                            lambda: self.flush_posts(session),
-                        )
-
-                        break
-
-                if not handled:
-                    logger.warning(
-                        f"No Transformer could handle ID {result.id} with platform {result.platform} ({result.date})"
-                    )
-
-        self.flush_posts(session)
+            transformer = self.get_transformer(result)
+
+            if transformer is None:
+                logger.warning(
+                    f"No Transformer could handle ID {result.id} with platform {result.platform} ({result.date})"
+                )
+                continue
+
+            batches.setdefault(transformer, []).append(result)
+
+        for transformer, batch in batches.items():
+            logger.trace(f"{transformer} is handling {len(batch)} results")
+
+            transformer.transform_batch(batch, ctx)
+
+        self.flush_posts(session, wait=False)
         session.commit()
 
     @logger.catch(reraise=True)
@@ -386,41 +923,89 @@ class ETLController:
             logger.error("No DB session")
             return
 
-        session = self.session()
-
         BATCH_SIZE = 5000
-        batch = []
 
-        logger.info(f"Fetching first untransformed post batch of {BATCH_SIZE}")
+        # batches are read, transformed and written in three overlapping stages:
+        # a reader thread streams batches of untransformed results into a
+        # bounded queue, they are transformed (and hydrated) in this thread,
+        # and the resulting posts are saved by the post writer thread
+        batches = queue.Queue(maxsize=2)
+        stop = threading.Event()
+
+        reader = threading.Thread(
+            target=self._read_untransformed,
+            args=(batches, stop, min_date, BATCH_SIZE),
+            daemon=True,
+        )
+        reader.start()
+        self.start_post_writer()
 
-        batch = (
-            session.query(ScraperResult)
-            .join(Post, isouter=True)
-            .where(ScraperResult.date > min_date)
-            .where(Post.raw_id == None)
-            .order_by(ScraperResult.date.asc())
-            .limit(BATCH_SIZE)
-        ).all()
+        try:
+            while True:
+                batch = batches.get()
 
-        while len(batch) > 0:
-            logger.info(f"Found {len(batch)} items to ETL")
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
 
-            self.transform_results(batch, hydrate=hydrate)
+                logger.info(f"Found {len(batch)} items to ETL")
 
-            logger.info(
-                f"Fetching untransformed posts batch of {BATCH_SIZE}, offset {max(batch, key=lambda v: v.date).date}"
-            )
+                self.transform_results(batch, hydrate=hydrate)
+        finally:
+            stop.set()
+            self.stop_post_writer()
+
+    def _read_untransformed(
+        self,
+        batches: queue.Queue,
+        stop: threading.Event,
+        min_date: datetime,
+        batch_size: int,
+    ):
+        """Stream all untransformed ScraperResults, oldest first, into ``batches``
+        using a server-side cursor. The end of the results is marked with None,
+        and a failure with the raised exception.
+        """
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        session = self.session()
+
+        try:
+            logger.info(f"Streaming untransformed posts in batches of {batch_size}")
 
-            batch = (
-                session.query(ScraperResult)
+            query = (
+                select(ScraperResult)
                 .join(Post, isouter=True)
                 .where(ScraperResult.date > min_date)
                 .where(Post.raw_id == None)
-                .where(ScraperResult.id != batch[-1].id)
-                .where(ScraperResult.date >= batch[-1].date)
                 .order_by(ScraperResult.date.asc())
-                .limit(BATCH_SIZE)
-            ).all()
+                .execution_options(yield_per=batch_size)
+            )
+
+            for partition in session.scalars(query).partitions():
+                batch = list(partition)
+
+                # the results are only read by the other threads
+                for result in batch:
+                    session.expunge(result)
+
+                if not put(batch):
+                    return
+
+            put(None)
+        except Exception as e:
+            put(e)
+        finally:
+            session.close()
 
     @logger.catch(reraise=True)
     def transform_info(self, results: List[ChannelInfo]):
@@ -439,31 +1024,26 @@ class ETLController:
 
         for data in results:
             result = data.RawChannelInfo
+            transformer = self.get_transformer(result)
 
-            if result.scraper is not None and result.platform is not None:
-                handled = False
-
-                for transformer in self.transformers:
-                    if transformer.can_handle(result):
-                        logger.trace(
-                            f"{transformer} is handling raw info result {result.id} ({result.date_archived})"
-                        )
-                        handled = True
+            if transformer is None:
+                logger.warning(
+                    f"No Transformer could handle raw channel info ID {result.id} with platform {result.platform} ({result.date_archived})"
+                )
+                continue
 
-                        transformer.transform_info(
-                            result,
-                            lambda obj: self.insert_or_select(obj, session, False),
-                            session,
-                            channel=data.Channel,
-                        )
+            logger.trace(
+                f"{transformer} is handling raw info result {result.id} ({result.date_archived})"
+            )
 
-                        session.commit()
-                        break
+            transformer.transform_info(
+                result,
+                lambda obj: self.insert_or_select(obj, session, False),
+                session,
+                channel=data.Channel,
+            )
 
-                    if not handled:
-                        logger.warning(
-                            f"No Transformer could handle raw channel info ID {result.id} with platform {result.platform} ({result.date_archived})"
-                        )
+            session.commit()
 
     @logger.catch(reraise=True)
     def transform_all_untransformed_info(self):
@@ -477,32 +1057,34 @@ class ETLController:
         session = self.session()
 
         BATCH_SIZE = 10000
-        offset = 0
-        batch = []
 
+        # rows are streamed from a server-side cursor, instead of paging with an
+        # offset through results that change as they are transformed
         query = (
-            session.query(RawChannelInfo, Channel)
+            select(RawChannelInfo, Channel)
             .select_from(RawChannelInfo)
             .join(ChannelInfo, isouter=True)
             .join(Channel, RawChannelInfo.channel == Channel.id)
             .where(ChannelInfo.id == None)
             .order_by(RawChannelInfo.date_archived.asc())
+            .execution_options(yield_per=BATCH_SIZE)
         )
 
-        while len(batch) > 0 or offset == 0:
-            logger.info(
-                f"Fetching untransformed info batch of {BATCH_SIZE}, offset {offset}"
-            )
+        logger.info(f"Streaming untransformed info in batches of {BATCH_SIZE}")
 
-            batch = query.slice(offset, offset + BATCH_SIZE).all()
-            offset += BATCH_SIZE
+        processed = 0
+
+        for batch in session.execute(query).partitions():
+            processed += len(batch)
 
             logger.info(
-                f"Found {len(batch)} info items to ETL ({offset} already processed)"
+                f"Found {len(batch)} info items to ETL ({processed} already processed)"
             )
 
             self.transform_info(batch)
 
+        session.close()
+
     @logger.catch(reraise=True)
     def transform_media(self, results: List, hydrate: bool = True):
         """Transform raw ScraperResults objects into Post objects and
@@ -510,8 +1092,9 @@ class ETLController:
 
         Parameters
         ----------
-        results : List[ScraperResult]
-            A list of ScraperResult objects to be transformed
+        results : List
+            Rows with ``ScraperResult`` and ``Post`` attributes, holding the raw
+            post (or the columns of it that are needed) and the transformed post
         hydrate : bool
             Whether or not to fully hydrate transformed media. Default ``True``.
         """
@@ -523,29 +1106,40 @@ class ETLController:
 
         for total_result in results:
             result = total_result.ScraperResult
-            if result.scraper is not None and result.platform is not None:
-                for transformer in self.transformers:
-                    handled = False
-
-                    if transformer.can_handle(result):
-                        logger.trace(
-                            f"{transformer} is handling result {result.id} ({result.date})"
-                        )
-                        handled = True
-
-                        transformer.transform_media(
-                            result,
-                            total_result.Post,
-                            lambda obj: self.insert_or_select(obj, session, hydrate),
-                        )
-
-                        session.commit()
-                        break
-
-                if not handled:
-                    logger.warning(
-                        f"No Transformer could handle ID {result.id} with platform {result.platform} ({result.date})"
-                    )
+            transformer = self.get_transformer(result)
+
+            if transformer is None:
+                logger.warning(
+                    f"No Transformer could handle ID {result.id} with platform {result.platform} ({result.date})"
+                )
+                continue
+
+            if (
+                result.raw_data is None
+                and getattr(result, "raw_data_compressed", None) is not None
+            ):
+                # the keys of compressed raw data cannot be projected on the server
+                raw = decode_json(
+                    get_codec(session.get_bind()).decompress(
+                        result.raw_data_compressed
+                    ),
+                    fields=transformer.media_fields,
+                )
+                result = SimpleNamespace(
+                    **dict(result._asdict(), raw_data=json.dumps(raw))
+                )
+
+            logger.trace(
+                f"{transformer} is handling result {result.id} ({result.date})"
+            )
+
+            transformer.transform_media(
+                result,
+                total_result.Post,
+                lambda obj: self.insert_or_select(obj, session, hydrate),
+            )
+
+            session.commit()
 
     @logger.catch(reraise=True)
     def transform_all_untransformed_media(self, hydrate=True):
@@ -566,10 +1160,33 @@ class ETLController:
 
         BATCH_SIZE = 50000
 
-        logger.info(f"Fetching first untransformed post media batch of {BATCH_SIZE}")
+        # only the columns used by ``transform_media`` are fetched, including the
+        # keys of raw_data that the registered transformers need
+        media_fields = sorted(
+            {
+                field
+                for transformer in self.transformers
+                for field in transformer.media_fields
+            }
+        )
+        raw_data = raw_data_projection(ScraperResult, media_fields)
 
-        batch = (
-            session.query(ScraperResult, Post)
+        query = (
+            select(
+                Bundle(
+                    "ScraperResult",
+                    ScraperResult.id,
+                    ScraperResult.scraper,
+                    ScraperResult.platform,
+                    ScraperResult.date,
+                    ScraperResult.date_archived,
+                    ScraperResult.archived_urls,
+                    raw_data.label("raw_data"),
+                    ScraperResult.raw_data_compressed,
+                ),
+                Bundle("Post", Post.id),
+            )
+            .select_from(ScraperResult)
             .join(Post)
             .join(Media, isouter=True)
             .filter(
@@ -578,31 +1195,16 @@ class ETLController:
                 & (Media.id == None)
             )
             .order_by(ScraperResult.date.desc())
-            .limit(BATCH_SIZE)
-        ).all()
+            .execution_options(yield_per=BATCH_SIZE)
+        )
 
-        while len(batch) > 0:
+        logger.info(f"Streaming untransformed post media in batches of {BATCH_SIZE}")
+
+        # rows are streamed from a server-side cursor, so memory use only
+        # depends on the batch size
+        for batch in session.execute(query).partitions():
             logger.info(f"Found {len(batch)} items to ETL")
 
             self.transform_media(batch, hydrate=hydrate)
 
-            logger.info(
-                f"Fetching untransformed post media batch of {BATCH_SIZE}, offset {min(batch, key=lambda v: v.ScraperResult.date).ScraperResult.date}"
-            )
-
-            batch = (
-                session.query(ScraperResult, Post)
-                .join(Post)
-                .join(Media, isouter=True)
-                .where(
-                    ScraperResult.date
-                    <= min(batch, key=lambda v: v.ScraperResult.date).ScraperResult.date
-                )
-                .filter(
-                    (ScraperResult.media_archived != None)
-                    & (cast(ScraperResult.archived_urls, String) != "{}")
-                    & (Media.id == None)
-                )
-                .order_by(ScraperResult.date.desc())
-                .limit(BATCH_SIZE)
-            ).all()
+        session.close()
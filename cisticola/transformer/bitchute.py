@@ -1,29 +1,39 @@
-import json
 from datetime import datetime, timezone
-from typing import Callable
+from typing import Callable, List, Tuple
 
-from bs4 import BeautifulSoup
 from dateutil.relativedelta import relativedelta
+from sqlalchemy import Integer, String, column, func, select, update, values
 from sqlalchemy.orm import Session
 
-from cisticola.base import ChannelInfo, Post, RawChannelInfo, ScraperResult, Video
-from cisticola.transformer.base import Transformer
+from cisticola.base import (
+    ChannelInfo,
+    Post,
+    RawChannelInfo,
+    ScraperResult,
+    Video,
+    post_table,
+)
+from cisticola.transformer.base import TransformContext, Transformer
+from cisticola.utils import decode_json, html_to_text
+
+# the teaser and show more/less toggles of a video description, which duplicate
+# its text
+DESCRIPTION_TOGGLES = (
+    "(//div[contains(concat(' ', normalize-space(@class), ' '), ' teaser ')])[1]",
+    "(//span[contains(concat(' ', normalize-space(@class), ' '), ' more ')])[1]",
+    "(//span[@class='less hidden'])[1]",
+)
 
 
 class BitchuteTransformer(Transformer):
     """A Bitchute specific ScraperResult, with a method ETL/transforming"""
 
     __version__ = "BitchuteTransformer 0.0.2"
-
-    def can_handle(self, data: ScraperResult) -> bool:
-        scraper = data.scraper.split(" ")
-        if scraper[0] == "BitchuteScraper":
-            return True
-
-        return False
+    scraper_name = "BitchuteScraper"
+    media_fields = ("video_url",)
 
     def transform_media(self, data: ScraperResult, transformed: Post, insert: Callable):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data, fields=("video_url",))
 
         orig = raw["video_url"]
         new = data.archived_urls[orig]
@@ -46,7 +56,7 @@ class BitchuteTransformer(Transformer):
     def transform_info(
         self, data: RawChannelInfo, insert: Callable, session, channel=None
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data)
 
         transformed = ChannelInfo(
             raw_channel_info_id=data.id,
@@ -77,43 +87,38 @@ class BitchuteTransformer(Transformer):
         session: Session,
         flush_posts: Callable,
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data)
 
         if raw["category"] == "comment":
-            if raw["parent_id"] is None:
-                reply_to_id = raw["thread_id"]
-            else:
-                reply_to_id = raw["parent_id"]
-            flush_posts()
-            post = (
-                session.query(Post)
-                .filter_by(channel=data.channel, platform_id=reply_to_id)
-                .first()
-            )
-            if post is None:
-                if raw["parent_id"] is not None:
-                    # this block is for comments whose parent_ids correspond to deleted comments
-                    post = (
-                        session.query(Post)
-                        .filter_by(channel=data.channel, platform_id=raw["thread_id"])
-                        .first()
-                    )
-                    if post is None:
-                        reply_to = -1
-                    else:
-                        reply_to = post.id
-                else:
-                    reply_to = -1
-            else:
-                reply_to = post.id
-            content = raw["body"].strip()
+            reply_to = self._get_reply_to(data, raw, session, flush_posts)
         else:
             reply_to = -1
-            soup = BeautifulSoup(raw["body"], features="html.parser")
-            soup.find("div", {"class": "teaser"}).decompose()
-            soup.find("span", {"class": "more"}).decompose()
-            soup.find("span", {"class": "less hidden"}).decompose()
-            content = soup.text.strip()
+
+        self._transform(data, raw, insert, reply_to)
+
+    def transform_batch(self, results: List[ScraperResult], ctx: TransformContext):
+        comments = []
+
+        for data in results:
+            raw = decode_json(data.raw_data)
+            transformed = self._transform(data, raw, ctx.insert, reply_to=-1)
+
+            if raw["category"] == "comment":
+                comments.append((transformed, raw["parent_id"], raw["thread_id"]))
+
+        if comments:
+            # comments are threaded once the whole batch is saved, so that replies
+            # to posts of the same batch are found
+            ctx.flush_posts()
+            self._thread_comments(comments, ctx.session)
+
+    def _transform(
+        self, data: ScraperResult, raw: dict, insert: Callable, reply_to: int
+    ) -> Post:
+        if raw["category"] == "comment":
+            content = raw["body"].strip()
+        else:
+            content = html_to_text(raw["body"], remove=DESCRIPTION_TOGGLES).strip()
 
         transformed = Post(
             raw_id=data.id,
@@ -139,7 +144,100 @@ class BitchuteTransformer(Transformer):
             video_duration=_parse_duration_str(raw["length"]),
         )
 
-        transformed = insert(transformed)
+        insert(transformed)
+
+        return transformed
+
+    @staticmethod
+    def _thread_comments(comments: List[Tuple[Post, str, str]], session: Session):
+        """Set ``reply_to`` of saved comments with a single UPDATE. A comment replies
+        to its parent comment, or to its thread (video) if it has no parent or the
+        parent was deleted, or -1 if neither is found.
+
+        Parameters
+        ----------
+        comments : list of tuple
+            ``(post, parent_id, thread_id)`` of each comment, where ``post`` has
+            been saved to the database.
+        """
+
+        rows = values(
+            column("id", Integer),
+            column("parent_id", String),
+            column("thread_id", String),
+            name="comments",
+        ).data(
+            [
+                (
+                    post.id,
+                    None if parent_id is None else str(parent_id),
+                    None if thread_id is None else str(thread_id),
+                )
+                for post, parent_id, thread_id in comments
+            ]
+        )
+
+        replied = post_table.alias("replied")
+
+        def replied_id(platform_id):
+            return (
+                select(replied.c.id)
+                .where(
+                    (replied.c.channel == post_table.c.channel)
+                    & (replied.c.platform_id == platform_id)
+                )
+                .order_by(replied.c.id)
+                .limit(1)
+                .scalar_subquery()
+            )
+
+        session.execute(
+            update(post_table)
+            .where(post_table.c.id == rows.c.id)
+            .values(
+                reply_to=func.coalesce(
+                    replied_id(rows.c.parent_id), replied_id(rows.c.thread_id), -1
+                )
+            )
+        )
+
+    def _get_reply_to(
+        self,
+        data: ScraperResult,
+        raw: dict,
+        session: Session,
+        flush_posts: Callable,
+    ) -> int:
+        """Find the ID of the post that a comment replies to, or -1 if it cannot be found."""
+
+        if raw["parent_id"] is None:
+            reply_to_id = raw["thread_id"]
+        else:
+            reply_to_id = raw["parent_id"]
+
+        # the post could be batched but not yet saved to the DB
+        flush_posts()
+        post = (
+            session.query(Post)
+            .filter_by(channel=data.channel, platform_id=reply_to_id)
+            .first()
+        )
+        if post is None:
+            if raw["parent_id"] is not None:
+                # this block is for comments whose parent_ids correspond to deleted comments
+                post = (
+                    session.query(Post)
+                    .filter_by(channel=data.channel, platform_id=raw["thread_id"])
+                    .first()
+                )
+                if post is None:
+                    return -1
+                else:
+                    return post.id
+            else:
+                return -1
+        else:
+            return post.id
 
 
 def parse_created(created: str, date_archived: datetime) -> datetime:
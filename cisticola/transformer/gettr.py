@@ -1,32 +1,79 @@
-import json
-from datetime import datetime, timezone
-from typing import Callable
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterable, List, Optional
 
 from gogettr import PublicClient
 from gogettr.api import GettrApiError
-from sqlalchemy import func
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
 
-from cisticola.base import Channel, ChannelInfo, Post, RawChannelInfo, ScraperResult
-from cisticola.transformer.base import Transformer
+from cisticola.base import (
+    Channel,
+    ChannelInfo,
+    Post,
+    RawChannelInfo,
+    ScraperResult,
+    profile_cache_table,
+)
+from cisticola.transformer.base import TransformContext, Transformer
+from cisticola.utils import decode_json
 
 
 class GettrTransformer(Transformer):
     """A Gettr specific ScraperResult, with a method ETL/transforming"""
 
     __version__ = "GettrTransformer 0.0.1"
+    scraper_name = "GettrScraper"
 
-    def can_handle(self, data: ScraperResult) -> bool:
-        scraper = data.scraper.split(" ")
-        if scraper[0] == "GettrScraper":
-            return True
+    # top-level keys of the raw Gettr post used by ``transform``
+    post_fields = (
+        "_id",
+        "activity",
+        "txt",
+        "uid",
+        "receiver_id",
+        "utgs",
+        "htgs",
+        "prevsrc",
+        "lkbpst",
+        "shbpst",
+        "vfpst",
+    )
 
-        return False
+    def __init__(
+        self,
+        profile_ttl: timedelta = timedelta(days=30),
+        profile_error_ttl: timedelta = timedelta(days=1),
+    ):
+        """
+        Parameters
+        ----------
+        profile_ttl : datetime.timedelta
+            How long Gettr profiles saved in the ``profile_cache`` table are used
+            before they are requested again.
+        profile_error_ttl : datetime.timedelta
+            How long failed profile lookups saved in the ``profile_cache`` table
+            are used before they are retried. Gettr's errors do not tell
+            transient failures from unknown users apart, so this is short.
+        """
+        super().__init__()
+
+        self.profile_ttl = profile_ttl
+        self.profile_error_ttl = profile_error_ttl
+
+        # map of lowercase usernames to channel IDs
+        self.channels_by_username = {}
+
+        # map of lowercase usernames to profiles, None if the lookup failed
+        self.profiles = {}
+
+        # created on the first profile request and reused afterwards
+        self.client = None
 
     def transform_info(
         self, data: RawChannelInfo, insert: Callable, session, channel=None
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data)
 
         transformed = ChannelInfo(
             raw_channel_info_id=data.id,
@@ -50,7 +97,66 @@ class GettrTransformer(Transformer):
 
         transformed = insert(transformed)
 
+    def _load_profiles(self, usernames: Iterable[str], session):
+        """Load the profiles of (lowercase) usernames that were requested less than
+        ``profile_ttl`` ago, or whose lookup failed less than ``profile_error_ttl``
+        ago, from the ``profile_cache`` table."""
+
+        now = datetime.now(timezone.utc)
+        c = profile_cache_table.c
+
+        rows = session.execute(
+            select(c.username, c.profile).where(
+                (c.platform == "Gettr")
+                & (c.username.in_(usernames))
+                & (
+                    ((c.profile != None) & (c.date_fetched >= now - self.profile_ttl))
+                    | (
+                        (c.profile == None)
+                        & (c.date_fetched >= now - self.profile_error_ttl)
+                    )
+                )
+            )
+        )
+
+        for username, profile in rows:
+            self.profiles[username] = profile
+
+    def _get_profile(self, username: str, session) -> Optional[dict]:
+        """Get the profile of a (lowercase) username, from the cache if possible.
+        Returns None if Gettr returned an error for the username."""
+
+        if username not in self.profiles:
+            self._load_profiles([username], session)
+
+        if username not in self.profiles:
+            if self.client is None:
+                self.client = PublicClient()
+
+            try:
+                profile = self.client.user_info(username)
+            except GettrApiError:
+                profile = None
+
+            self.profiles[username] = profile
+
+            values = dict(profile=profile, date_fetched=datetime.now(timezone.utc))
+            session.execute(
+                pg_insert(profile_cache_table)
+                .values(platform="Gettr", username=username, **values)
+                .on_conflict_do_update(
+                    index_elements=["platform", "username"], set_=values
+                )
+            )
+
+        return self.profiles[username]
+
     def _get_channel_id(self, username: str, category: str, insert: Callable, session):
+        key = username.lower()
+
+        if key in self.channels_by_username:
+            return self.channels_by_username[key]
+
         channel = (
             session.query(Channel)
             .where(
@@ -61,9 +167,9 @@ class GettrTransformer(Transformer):
         )
 
         if channel is None:
-            try:
-                client = PublicClient()
-                profile = client.user_info(username.lower())
+            profile = self._get_profile(key, session)
+
+            if profile is not None:
                 screenname = profile.get("_id")
                 channel = Channel(
                     name=profile.get("nickname"),
@@ -74,7 +180,7 @@ class GettrTransformer(Transformer):
                     category=category,
                     source=self.__version__,
                 )
-            except GettrApiError:
+            else:
                 channel = Channel(
                     name=None,
                     platform_id=None,
@@ -88,6 +194,8 @@ class GettrTransformer(Transformer):
 
             channel = insert(channel)
 
+        self.channels_by_username[key] = channel.id
+
         return channel.id
 
     def transform(
@@ -97,8 +205,46 @@ class GettrTransformer(Transformer):
         session: Session,
         flush_posts: Callable,
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data, fields=self.post_fields)
+
+        self._transform(data, raw, insert, session)
+
+    def transform_batch(self, results: List[ScraperResult], ctx: TransformContext):
+        raws = [decode_json(data.raw_data, fields=self.post_fields) for data in results]
+
+        # resolve all forwarded and mentioned users of the batch at once, first
+        # from the channels table, then from the profile cache
+        usernames = {
+            username.lower() for raw in raws for username in _referenced_users(raw)
+        }
+        usernames -= self.channels_by_username.keys()
+
+        if usernames:
+            for channel_id, screenname in (
+                ctx.session.query(Channel.id, Channel.screenname)
+                .where(
+                    (func.lower(Channel.screenname).in_(usernames))
+                    & (Channel.platform == "Gettr")
+                )
+                .order_by(Channel.id)
+            ):
+                self.channels_by_username.setdefault(screenname.lower(), channel_id)
+
+        usernames -= self.channels_by_username.keys() | self.profiles.keys()
 
+        if usernames:
+            self._load_profiles(usernames, ctx.session)
+
+        for data, raw in zip(results, raws):
+            self._transform(data, raw, ctx.insert, ctx.session)
+
+    def _transform(
+        self,
+        data: ScraperResult,
+        raw: dict,
+        insert: Callable,
+        session: Session,
+    ):
         if raw["activity"]["action"] == "shares_pst":
             forwarded_from = self._get_channel_id(
                 username=str(raw["activity"]["uid"]),
@@ -147,3 +293,14 @@ class GettrTransformer(Transformer):
         # media = self.process_media(raw, transformed.id, data)
         # for m in media:
         #     insert(m)
+
+
+def _referenced_users(raw_post) -> List[str]:
+    """Return the usernames of the users forwarded and mentioned by a Gettr post."""
+
+    usernames = list(raw_post.get("utgs", []))
+
+    if raw_post["activity"]["action"] == "shares_pst":
+        usernames.append(str(raw_post["activity"]["uid"]))
+
+    return usernames
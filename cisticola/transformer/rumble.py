@@ -1,49 +1,41 @@
-import json
 from datetime import datetime, timezone
 from typing import Callable, Optional
 
 import dateutil.parser
-from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from cisticola.base import ChannelInfo, Post, RawChannelInfo, ScraperResult
 from cisticola.transformer.base import Transformer
+from cisticola.utils import decode_json
 
 
 class RumbleTransformer(Transformer):
     """A Rumble specific ScraperResult, with a method ETL/transforming"""
 
     __version__ = "RumbleTransformer 0.0.1"
-
-    def can_handle(self, data: ScraperResult) -> bool:
-        scraper = data.scraper.split(" ")
-        if scraper[0] == "RumbleScraper":
-            return True
-
-        return False
+    scraper_name = "RumbleScraper"
 
     def transform_info(
         self, data: RawChannelInfo, insert: Callable, session, channel=None
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data)
 
         if "id" not in raw:
             # The first version of the Rumble ChannelInfo scraper didn't return
             # the platform_id, so this is a workaround.
-            channel = (
-                session.query(RawChannelInfo)
+            # the key is projected on the server, using the
+            # (platform, raw_data ->> 'name') index
+            platform_id = (
+                session.query(RawChannelInfo.raw_data["id"].astext)
                 .filter(
-                    text("raw_channel_info.raw_data::jsonb ->> 'name'=:name"),
-                    RawChannelInfo.platform == "Rumble",
+                    (RawChannelInfo.platform == "Rumble")
+                    & (RawChannelInfo.raw_data["name"].astext == raw["name"])
+                    & (RawChannelInfo.raw_data["id"].astext != None)
                 )
-                .params(name=raw["name"])
                 .order_by(RawChannelInfo.date_archived.desc())
-                .first()
+                .limit(1)
+                .scalar()
             )
-            if channel is None:
-                platform_id = None
-            else:
-                platform_id = json.loads(channel.raw_data)["id"]
         else:
             platform_id = raw["id"]
 
@@ -69,6 +61,8 @@ class RumbleTransformer(Transformer):
 
         transformed = insert(transformed)
 
+    # Rumble posts don't reference other channels or posts, so there is nothing
+    # to look up per batch and the default ``transform_batch`` is used
     def transform(
         self,
         data: ScraperResult,
@@ -76,7 +70,7 @@ class RumbleTransformer(Transformer):
         session: Session,
         flush_posts: Callable,
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data)
 
         transformed = Post(
             raw_id=data.id,
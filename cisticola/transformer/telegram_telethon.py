@@ -1,14 +1,11 @@
-import json
 import os
 from datetime import datetime, timezone
-from itertools import takewhile
-from typing import Callable
+from typing import Callable, List
 
 import dateutil.parser
-import requests
 from bs4 import BeautifulSoup
 from loguru import logger
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
 from sqlalchemy.orm import Session
 from telethon.errors.rpcerrorlist import ChannelInvalidError, ChannelPrivateError
 from telethon.helpers import add_surrogate, del_surrogate
@@ -16,11 +13,13 @@ from telethon.sync import TelegramClient
 from telethon.tl import types
 
 from cisticola.base import Channel, ChannelInfo, Post, RawChannelInfo, ScraperResult
-from cisticola.transformer.base import Transformer
+from cisticola.transformer.base import TransformContext, Transformer
+from cisticola.utils import decode_json, get_session
 
 
 class TelegramTelethonTransformer(Transformer):
     __version__ = "TelegramTelethonTransformer 0.0.4"
+    scraper_name = "TelegramTelethonScraper"
 
     # TODO cache
     # cache channels for which we cannot get the name from the web interface
@@ -36,12 +35,21 @@ class TelegramTelethonTransformer(Transformer):
 
     get_screenname_cache = {}
 
-    def can_handle(self, data: ScraperResult) -> bool:
-        scraper = data.scraper.split(" ")
-        if scraper[0] == "TelegramTelethonScraper":
-            return True
-
-        return False
+    # top-level keys of the raw Telethon message used by ``transform``, the rest
+    # of the (potentially large) dump is not decoded
+    post_fields = (
+        "_",
+        "id",
+        "date",
+        "message",
+        "entities",
+        "fwd_from",
+        "reply_to",
+        "peer_id",
+        "from_id",
+        "forwards",
+        "views",
+    )
 
     def __init__(self, telethon_session_name=None):
         super().__init__()
@@ -94,7 +102,7 @@ class TelegramTelethonTransformer(Transformer):
             return ""
 
         logger.info(f"Finding channel from URL {url}")
-        r = requests.get(url)
+        r = get_session(url).get(url)
 
         if r.url != url:
             self.bad_channels[orig_screenname] = True
@@ -138,7 +146,7 @@ class TelegramTelethonTransformer(Transformer):
     def transform_info(
         self, data: RawChannelInfo, insert: Callable, session, channel=None
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data)
 
         chat_raw = raw["chats"][0]
 
@@ -202,28 +210,109 @@ class TelegramTelethonTransformer(Transformer):
         session: Session,
         flush_posts: Callable,
     ):
-        raw = json.loads(data.raw_data)
+        raw = decode_json(data.raw_data, fields=self.post_fields)
+
+        self._transform(data, raw, insert, session, flush_posts)
+
+    def transform_batch(self, results: List[ScraperResult], ctx: TransformContext):
+        raws = [decode_json(data.raw_data, fields=self.post_fields) for data in results]
+
+        self._preload(results, raws, ctx.session)
+
+        for data, raw in zip(results, raws):
+            self._transform(data, raw, ctx.insert, ctx.session, ctx.flush_posts)
+
+    def _preload(self, results: List[ScraperResult], raws: List[dict], session):
+        """Fill the channel and post caches with the channels and replied-to posts
+        referenced by a batch of messages, using one query per cache. References
+        that are not found (e.g. replies to posts in the same batch) are looked
+        up by ``_transform`` as before.
+        """
+
+        messages = [
+            (data, raw) for data, raw in zip(results, raws) if raw["_"] == "Message"
+        ]
+
+        channel_ids = {int(data.channel) for data, _ in messages}
+        channel_ids -= self.channels_cache_by_id.keys()
+
+        if channel_ids:
+            for channel in session.query(Channel).filter(Channel.id.in_(channel_ids)):
+                self.channels_cache_by_id[channel.id] = channel
+
+        forwarded_ids = {_forwarded_channel_id(raw) for _, raw in messages}
+        forwarded_ids -= {None, *self.channels_cache_by_platformid.keys()}
+
+        if forwarded_ids:
+            for channel in (
+                session.query(Channel)
+                .filter(
+                    (Channel.platform == "Telegram")
+                    & (Channel.platform_id.in_(forwarded_ids))
+                )
+                .order_by(Channel.id)
+            ):
+                self.channels_cache_by_platformid.setdefault(
+                    channel.platform_id, channel
+                )
+
+        screennames = {
+            screenname.lower()
+            for _, raw in messages
+            for screenname in _mentioned_screennames(raw)
+        }
+        screennames -= self.channels_cache_by_screenname.keys()
+
+        if screennames:
+            for channel in (
+                session.query(Channel)
+                .filter(
+                    (Channel.platform == "Telegram")
+                    & (func.lower(Channel.screenname).in_(screennames))
+                )
+                .order_by(Channel.id)
+            ):
+                self.channels_cache_by_screenname.setdefault(
+                    channel.screenname.lower(), channel
+                )
 
+        replies = {
+            (data.channel, str(raw["reply_to"]["reply_to_msg_id"]))
+            for data, raw in messages
+            if raw["reply_to"]
+        }
+        replies -= self.posts_cache.keys()
+
+        if replies:
+            for post_id, channel, platform_id in (
+                session.query(Post.id, Post.channel, Post.platform_id)
+                .filter(tuple_(Post.channel, Post.platform_id).in_(replies))
+                .order_by(Post.id)
+            ):
+                self.posts_cache.setdefault((channel, platform_id), post_id)
+
+    def _transform(
+        self,
+        data: ScraperResult,
+        raw: dict,
+        insert: Callable,
+        session: Session,
+        flush_posts: Callable,
+    ):
         if raw["_"] != "Message":
             logger.warning(f"Cannot convert type {raw['_']} to post")
             return
 
         fwd_from = None
+        forwarded_id = _forwarded_channel_id(raw)
 
-        if (
-            raw["fwd_from"]
-            and raw["fwd_from"]["from_id"]
-            and "channel_id" in raw["fwd_from"]["from_id"]
-        ):
+        if forwarded_id is not None:
             # use cache to look up channel instead of a DB request if possible
-            if (
-                str(raw["fwd_from"]["from_id"]["channel_id"])
-                not in self.channels_cache_by_platformid
-            ):
+            if forwarded_id not in self.channels_cache_by_platformid:
                 channel = (
                     session.query(Channel)
                     .filter_by(
-                        platform_id=str(raw["fwd_from"]["from_id"]["channel_id"]),
+                        platform_id=forwarded_id,
                         platform="Telegram",
                     )
                     .first()
@@ -260,13 +349,9 @@ class TelegramTelethonTransformer(Transformer):
                     channel = insert(channel)
                     logger.info(f"Added {channel}")
 
-                self.channels_cache_by_platformid[
-                    str(raw["fwd_from"]["from_id"]["channel_id"])
-                ] = channel
+                self.channels_cache_by_platformid[forwarded_id] = channel
 
-            fwd_from = self.channels_cache_by_platformid[
-                str(raw["fwd_from"]["from_id"]["channel_id"])
-            ].id
+            fwd_from = self.channels_cache_by_platformid[forwarded_id].id
 
         reply_to = None
         if raw["reply_to"]:
@@ -293,25 +378,15 @@ class TelegramTelethonTransformer(Transformer):
 
         mentions = []
 
-        for mention_entity in [
-            entity
-            for entity in raw["entities"]
-            if entity["_"] == "MessageEntityMention"
-        ]:
-            offset = mention_entity["offset"]
-            length = mention_entity["length"]
-
-            screenname = (
-                add_surrogate(raw["message"])[offset : offset + length]
-                .strip("@")
-                .strip()
-            )
-
+        for screenname in _mentioned_screennames(raw):
             # use cache rather than a DB request if possible
             if screenname.lower() not in self.channels_cache_by_screenname:
                 channel = (
                     session.query(Channel)
-                    .filter(func.lower(Channel.screenname) == func.lower(screenname))
+                    .filter(
+                        (Channel.platform == "Telegram")
+                        & (func.lower(Channel.screenname) == func.lower(screenname))
+                    )
                     .first()
                 )
 
@@ -381,48 +456,79 @@ class TelegramTelethonTransformer(Transformer):
         insert(transformed)
 
 
+def _forwarded_channel_id(raw_post):
+    """Return the ID of the channel a message was forwarded from, as a string,
+    or None if it was not forwarded from a channel."""
+
+    fwd_from = raw_post["fwd_from"]
+
+    if fwd_from and fwd_from["from_id"] and "channel_id" in fwd_from["from_id"]:
+        return str(fwd_from["from_id"]["channel_id"])
+
+    return None
+
+
+def _mentioned_screennames(raw_post):
+    """Return the screennames of the ``MessageEntityMention`` entities of a message."""
+
+    content = add_surrogate(raw_post["message"])
+    screennames = []
+
+    for entity in raw_post["entities"]:
+        if entity["_"] == "MessageEntityMention":
+            offset = entity["offset"]
+            length = entity["length"]
+
+            screennames.append(content[offset : offset + length].strip("@").strip())
+
+    return screennames
+
+
 def stripped(s):
-    """https://stackoverflow.com/a/29933716"""
+    """Return the leading and trailing whitespace of ``s``, concatenated."""
 
-    lstripped = "".join(takewhile(str.isspace, s))
-    rstripped = "".join(reversed(tuple(takewhile(str.isspace, reversed(s)))))
+    lstripped = s[: len(s) - len(s.lstrip())]
+    rstripped = s[len(s.rstrip()) :]
 
     return lstripped + rstripped
 
 
 def add_markdown_links(raw_post):
     """This function is necessary because Telethon's markdown.unparse doesn't
-    correctly handle trailing whitespace or multi-line links"""
+    correctly handle trailing whitespace or multi-line links.
+
+    The content is built in a single pass over the ``MessageEntityTextUrl``
+    entities, so the cost is linear in the length of the message rather than
+    in the number of links times the length. Entities are expected in the
+    order Telegram provides them (sorted by offset); a link overlapping an
+    already converted link is left as plain text.
+    """
 
-    global_offset = 0
-    transformed_content = add_surrogate(raw_post["message"])
-    links = [
-        entity
-        for entity in raw_post["entities"]
-        if entity["_"] == "MessageEntityTextUrl"
-    ]
+    content = add_surrogate(raw_post["message"])
+    segments = []
+    position = 0
 
-    for link in links:
-        offset = global_offset + link["offset"]
-        length = link["length"]
-        url = link["url"]
+    for link in raw_post["entities"]:
+        if link["_"] != "MessageEntityTextUrl":
+            continue
 
-        before_link = transformed_content[:offset]
-        inner_text = transformed_content[offset : offset + length]
+        offset = link["offset"]
+        end = offset + link["length"]
+
+        if offset < position:
+            continue
+
+        inner_text = content[offset:end]
 
         # skip creation of link if inner link text is only whitespace
         if inner_text.replace("\u200b", "").strip():
             processed_inner_text = inner_text.strip().replace("\n", "\\\n")
-            link_text = f"[{processed_inner_text}]"
-            trailing_whitespace = stripped(
-                transformed_content[offset : offset + length]
-            )
-            link_href = f"({url})"
-            after_link = transformed_content[offset + length :]
 
-            transformed_content = (
-                before_link + link_text + link_href + trailing_whitespace + after_link
-            )
-            global_offset += 4 + len(url) + inner_text.strip().count("\n")
+            segments.append(content[position:offset])
+            segments.append(f"[{processed_inner_text}]({link['url']})")
+            segments.append(stripped(inner_text))
+            position = end
+
+    segments.append(content[position:])
 
-    return del_surrogate(transformed_content)
+    return del_surrogate("".join(segments))
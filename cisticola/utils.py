@@ -1,11 +1,124 @@
+import json
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Callable, Iterable, List, Optional
+from urllib.parse import urlparse
 
+import lxml.html
 import requests
 from loguru import logger
+from lxml import etree
+from requests.adapters import HTTPAdapter
+
+# Optional fast JSON backends, the standard library is used if unavailable
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+#: Maximum number of connections kept alive per host by each pooled session
+HTTP_POOL_SIZE = 10
+
+# pooled sessions of each thread, by host, and all pooled sessions for metrics
+_local = threading.local()
+_all_sessions = []
+_all_sessions_lock = threading.Lock()
+
+
+def get_session(url: str) -> requests.Session:
+    """Return the pooled session used for requests to the host of ``url`` from the
+    current thread. Connections are kept alive and reused between requests,
+    so that only the first request to a host pays for the TCP and TLS
+    handshakes. Cookies are not kept, so requests stay independent of each
+    other, as with ``requests.get``.
+
+    Parameters
+    ----------
+    url : str
+        URL that is about to be requested
+
+    Returns
+    -------
+    requests.Session
+        Session with a connection pool of up to ``HTTP_POOL_SIZE`` connections.
+    """
+
+    if not hasattr(_local, "sessions"):
+        _local.sessions = {}
+
+    host = urlparse(url).netloc
+
+    if host not in _local.sessions:
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        _local.sessions[host] = session
+
+        with _all_sessions_lock:
+            _all_sessions.append((host, session))
+
+    return _local.sessions[host]
+
+
+def connection_stats() -> dict:
+    """Return the number of requests made and of connections opened by the
+    pooled sessions (see :py:func:`get_session`) of all threads, by host.
+    Requests in excess of connections reused an open connection.
+
+    Returns
+    -------
+    dict
+        Map of hosts to dicts with ``"requests"`` and ``"connections"`` keys.
+    """
+
+    stats = {}
+
+    with _all_sessions_lock:
+        sessions = list(_all_sessions)
+
+    for host, session in sessions:
+        host_stats = stats.setdefault(host, {"requests": 0, "connections": 0})
+
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    host_stats["requests"] += pool.num_requests
+                    host_stats["connections"] += pool.num_connections
+
+    return stats
+
+
+def log_connection_stats():
+    """Log the connection reuse of the pooled sessions, see :py:func:`connection_stats`."""
+
+    for host, stats in connection_stats().items():
+        if stats["requests"] > 0:
+            reused = stats["requests"] - stats["connections"]
+            logger.info(
+                f"Made {stats['requests']} requests to {host} over {stats['connections']} connections ({reused} reused)"
+            )
 
 
 def make_request(url, headers=None, max_retries=5, break_codes=None):
     """Retry request `max_retries` times, while catching arbitrary exceptions.
+    Connections are pooled per host, see :py:func:`get_session`.
 
     Parameters
     ----------
@@ -44,29 +157,478 @@ def make_request(url, headers=None, max_retries=5, break_codes=None):
 
 
 def request_until_200(url, headers=None, max_retries=5, break_codes=None):
-    """Retry request `max_retries` times, or until the request is successful."""
+    """Retry request `max_retries` times, or until the request is successful.
+    Retries follow the request policy of :py:func:`send_request`."""
 
     if break_codes is None:
         break_codes = [200]
     else:
         break_codes = break_codes + [200]
 
-    n_retries = 0
-    r = requests.get(url, headers=headers)
-
-    while r.status_code not in break_codes and n_retries < 5:
-        logger.warning(
-            f"Request for url: {url} returned status: {r.status_code} on attempt: {n_retries}/{max_retries}"
-        )
-        n_retries += 1
-
-        # back off subsequent requests
-        time.sleep(n_retries)
-        r = requests.get(url, headers=headers)
+    r = send_request(
+        "GET", url, max_retries=max_retries, break_codes=break_codes, headers=headers
+    )
 
     if r.status_code not in break_codes:
         raise ValueError(
-            f"Request for url: {url} failed with status: {r.status_code} after {max_retries} attempts"
+            f"Request for url: {url} failed with status: {r.status_code} after {max_retries} retries"
         )
 
     return r
+
+
+#: Requests per second allowed to each host, unless listed in ``RATE_LIMITS``
+DEFAULT_RATE_LIMIT = 10.0
+
+#: Requests per second allowed to specific hosts
+RATE_LIMITS = {
+    "www.bitchute.com": 4.0,
+}
+
+#: Status codes indicating that a host is overloaded or rate limiting requests
+SLOW_DOWN_CODES = (429, 503)
+
+#: Longest delay in seconds taken from a ``Retry-After`` header, so that a host
+#: asking for a long pause cannot stall the threads requesting it
+MAX_RETRY_AFTER = 60.0
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+class RateLimiter:
+    """Token bucket limiting the rate of requests to a host, shared by all
+    threads. When the host responds with a status in ``SLOW_DOWN_CODES``, the
+    rate is halved (down to ``min_rate``), and it then recovers gradually
+    with each successful request.
+
+    Parameters
+    ----------
+    rate : float
+        Maximum number of requests per second
+    burst : int
+        Number of requests that can be made at once after a pause
+    min_rate : float
+        Lowest rate the limiter slows down to
+    """
+
+    def __init__(self, rate: float, burst: int = 1, min_rate: float = 0.1):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min(min_rate, rate)
+
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a request can be made."""
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+            # a negative balance reserves tokens for requests that are waiting
+            self.tokens -= 1
+            wait = max(-self.tokens / self.rate, self.blocked_until - now)
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def slow_down(self, retry_after: Optional[float] = None):
+        """Halve the rate, and block requests for ``retry_after`` seconds if specified."""
+
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+            if retry_after is not None:
+                self.blocked_until = max(
+                    self.blocked_until, time.monotonic() + retry_after
+                )
+
+    def speed_up(self):
+        """Increase the rate after a successful request, up to the maximum rate."""
+
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def get_rate_limiter(url: str) -> RateLimiter:
+    """Return the RateLimiter of the host of ``url``, see ``RATE_LIMITS``."""
+
+    host = urlparse(url).netloc
+
+    with _rate_limiters_lock:
+        if host not in _rate_limiters:
+            _rate_limiters[host] = RateLimiter(
+                RATE_LIMITS.get(host, DEFAULT_RATE_LIMIT)
+            )
+
+        return _rate_limiters[host]
+
+
+def retry_after(
+    response: requests.Response, cap: float = MAX_RETRY_AFTER
+) -> Optional[float]:
+    """Return the number of seconds to wait before retrying, from the
+    ``Retry-After`` header of ``response`` (either seconds or a date) and at
+    most ``cap``, or None."""
+
+    value = response.headers.get("Retry-After")
+
+    if value is None:
+        return None
+
+    try:
+        delay = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=timezone.utc)
+
+        delay = (date - datetime.now(timezone.utc)).total_seconds()
+
+    return min(cap, max(0.0, delay))
+
+
+def backoff(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter: a random delay of up to
+    ``base * 2 ** attempt`` seconds, at most ``cap``."""
+
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def send_request(
+    method: str,
+    url: str,
+    session: Optional[requests.Session] = None,
+    max_retries: int = 5,
+    break_codes: Iterable[int] = (200,),
+    **kwargs,
+) -> requests.Response:
+    """Make an HTTP request following the request policy shared by all
+    scrapers: requests are rate limited per host (see :py:class:`RateLimiter`),
+    and retried with exponential backoff and jitter, honouring the
+    ``Retry-After`` header of the response up to ``MAX_RETRY_AFTER`` seconds.
+
+    Parameters
+    ----------
+    method : str
+        HTTP method, e.g. ``"GET"``
+    url : str
+        URL to request
+    session : requests.Session or None
+        Session to make the request with. If None, the pooled session of the
+        host is used (see :py:func:`get_session`).
+    max_retries : int
+        Maximum number of times to retry the request
+    break_codes : iterable of int
+        Status codes that are not retried. Statuses in ``SLOW_DOWN_CODES`` are
+        always retried.
+    kwargs
+        Keyword arguments passed to ``requests.Session.request``
+
+    Returns
+    -------
+    requests.Response
+        Response of the last attempt, whose status may not be in ``break_codes``.
+
+    Raises
+    ------
+    requests.RequestException
+        If the last attempt failed without a response, e.g. a connection error.
+    """
+
+    if session is None:
+        session = get_session(url)
+
+    limiter = get_rate_limiter(url)
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+
+        try:
+            r = session.request(method, url, **kwargs)
+        except requests.RequestException as e:
+            if attempt == max_retries:
+                raise
+
+            delay = backoff(attempt)
+            logger.warning(
+                f"Request for url: {url} raised exception: [{e}] on attempt: {attempt}/{max_retries}, retrying in {delay:.1f}s"
+            )
+            time.sleep(delay)
+            continue
+
+        if r.status_code in SLOW_DOWN_CODES:
+            limiter.slow_down(retry_after(r))
+        elif r.status_code < 400:
+            limiter.speed_up()
+
+        if attempt == max_retries or (
+            r.status_code in break_codes and r.status_code not in SLOW_DOWN_CODES
+        ):
+            return r
+
+        delay = retry_after(r)
+        if delay is None:
+            delay = backoff(attempt)
+
+        logger.warning(
+            f"Request for url: {url} returned status: {r.status_code} on attempt: {attempt}/{max_retries}, retrying in {delay:.1f}s"
+        )
+        time.sleep(delay)
+
+
+#: Maximum number of requests made at once by :py:func:`map_concurrently`
+HTTP_CONCURRENCY = 8
+
+_http_executor = None
+_http_executor_lock = threading.Lock()
+
+
+def _get_http_executor() -> ThreadPoolExecutor:
+    """Return the worker threads shared by all concurrent requests. The threads
+    are kept alive, so that their pooled sessions (see :py:func:`get_session`)
+    are reused from one call of :py:func:`map_concurrently` to the next."""
+
+    global _http_executor
+
+    with _http_executor_lock:
+        if _http_executor is None:
+            _http_executor = ThreadPoolExecutor(
+                max_workers=HTTP_CONCURRENCY, thread_name_prefix="http"
+            )
+
+        return _http_executor
+
+
+def map_concurrently(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    concurrency: int = HTTP_CONCURRENCY,
+) -> List[Any]:
+    """Call ``func`` on each of ``items`` with up to ``concurrency`` calls in
+    flight at once, for functions that mostly wait on HTTP requests, such as
+    fetching the detail page of each video of a channel listing.
+
+    The calls run on the worker threads of a shared executor. Requests made
+    with :py:func:`send_request` from ``func`` therefore still follow the rate
+    limit of their host, which is shared by all threads.
+
+    Parameters
+    ----------
+    func : callable
+        Function taking a single item
+    items : iterable
+        Items to call ``func`` on
+    concurrency : int
+        Maximum number of calls running at once, at most ``HTTP_CONCURRENCY``.
+        With ``1``, ``func`` is called sequentially on the current thread.
+
+    Returns
+    -------
+    list
+        Results of ``func``, in the order of ``items``.
+
+    Raises
+    ------
+    Exception
+        The exception raised by ``func`` for the first item (in order) that
+        failed.
+    """
+
+    items = list(items)
+
+    if concurrency <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    executor = _get_http_executor()
+
+    if concurrency >= HTTP_CONCURRENCY:
+        return list(executor.map(func, items))
+
+    # fewer calls at once than the executor has threads: every
+    # ``concurrency``-th item is handled sequentially by the same thread
+    slices = executor.map(
+        lambda start: [func(item) for item in items[start::concurrency]],
+        range(concurrency),
+    )
+
+    results = [None] * len(items)
+    for start, slice_results in enumerate(slices):
+        results[start::concurrency] = slice_results
+
+    return results
+
+
+@lru_cache(maxsize=None)
+def _partial_decoder(fields: tuple):
+    """Build (once per set of fields) a msgspec decoder that only materializes
+    the specified top-level keys of a JSON object."""
+
+    attributes = [f"field_{i}" for i in range(len(fields))]
+    struct = msgspec.defstruct(
+        "PartialJSON",
+        [(attribute, Any, msgspec.UNSET) for attribute in attributes],
+        rename=dict(zip(attributes, fields)),
+    )
+
+    return msgspec.json.Decoder(struct)
+
+
+def decode_json(data, fields: Optional[Iterable[str]] = None):
+    """Decode a JSON document (e.g. the ``raw_data`` of a ScraperResult) using
+    the fastest available backend.
+
+    Parameters
+    ----------
+    data : str or bytes
+        JSON document to decode
+    fields : iterable of str or None
+        If specified, only these top-level keys of the JSON object are
+        decoded and returned, and the rest of the document is skipped without
+        being materialized. Keys missing from the document are also missing
+        from the returned dict.
+
+    Returns
+    -------
+    Decoded JSON document.
+    """
+
+    if fields is not None and msgspec is not None:
+        fields = tuple(fields)
+        try:
+            decoded = _partial_decoder(fields).decode(data)
+        except msgspec.DecodeError:
+            # e.g. NaN values or a non-object document, handled below
+            pass
+        else:
+            return {
+                field: value
+                for field, value in zip(fields, msgspec.structs.astuple(decoded))
+                if value is not msgspec.UNSET
+            }
+
+    if orjson is not None:
+        try:
+            decoded = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the standard library (e.g. it rejects
+            # NaN values), so fall back for these documents
+            pass
+        else:
+            if fields is not None:
+                return {field: decoded[field] for field in fields if field in decoded}
+            return decoded
+
+    decoded = json.loads(data)
+
+    if fields is not None:
+        return {field: decoded[field] for field in fields if field in decoded}
+    return decoded
+
+
+#: Keys of Telethon objects holding binary data that is useless once stored:
+#: file references expire after a few hours, and inline thumbnails are
+#: previews of media that is archived separately
+REDUNDANT_TELETHON_KEYS = frozenset(("file_reference", "bytes", "stripped_thumb"))
+
+
+def strip_redundant_telethon_data(data):
+    """Remove binary file references and thumbnails (see
+    :py:data:`REDUNDANT_TELETHON_KEYS`) from a Telethon object converted with
+    ``to_dict()``. Serialized as JSON, these make up more than half of a
+    message with media.
+
+    Parameters
+    ----------
+    data : dict or list
+        Telethon object dump, possibly nested
+
+    Returns
+    -------
+    Copy of ``data`` without the redundant keys.
+    """
+
+    if isinstance(data, dict):
+        return {
+            key: strip_redundant_telethon_data(value)
+            for key, value in data.items()
+            if not (key in REDUNDANT_TELETHON_KEYS and isinstance(value, bytes))
+        }
+    elif isinstance(data, list):
+        return [strip_redundant_telethon_data(value) for value in data]
+    return data
+
+
+@lru_cache(maxsize=None)
+def _compile_xpath(expression: str) -> etree.XPath:
+    return etree.XPath(expression)
+
+
+def html_to_text(
+    html, remove: Iterable[str] = (), select: Optional[str] = None, separator=""
+) -> Optional[str]:
+    """Extract the text of an HTML document or fragment using lxml. This is
+    considerably faster than building a BeautifulSoup tree, and XPath
+    expressions are compiled once and reused.
+
+    Parameters
+    ----------
+    html : str or bytes
+        HTML document or fragment, bytes are decoded as UTF-8
+    remove : iterable of str
+        XPath expressions of elements that are removed, along with their
+        contents, before extracting the text, e.g. ``"//div[@class='teaser']"``.
+        If the document (or the selected element) itself is removed, its text
+        is empty.
+    select : str or None
+        XPath expression of the element to extract the text of. If None, the
+        text of the whole document is extracted.
+    separator : str
+        String inserted between the text nodes of the document
+
+    Returns
+    -------
+    str or None
+        Text of the document, or None if no element matches ``select``. A
+        document that cannot be parsed is logged and treated as empty.
+    """
+
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+
+    # lxml rejects empty or whitespace-only documents
+    if html is None or html.strip() == "":
+        return None if select is not None else ""
+
+    try:
+        root = lxml.html.fromstring(html)
+    except (etree.ParserError, ValueError) as e:
+        logger.warning(f"Could not parse HTML ({len(html)} characters): {e}")
+        return None if select is not None else ""
+
+    if select is not None:
+        selected = _compile_xpath(select)(root)
+        if len(selected) == 0:
+            return None
+        root = selected[0]
+
+    for expression in remove:
+        for element in _compile_xpath(expression)(root):
+            if element is root:
+                # drop_tree() does nothing for the root, whose text is all removed
+                return ""
+            element.drop_tree()
+
+    return separator.join(_compile_xpath(".//text()")(root))
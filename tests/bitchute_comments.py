@@ -0,0 +1,128 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert
+
+from cisticola.base import Channel, Post, ScraperResult, post_table
+from cisticola.transformer import BitchuteTransformer, ETLController
+from cisticola.transformer.base import Transformer
+
+DATE = datetime(2022, 6, 1)
+
+#: ``(id, category, parent_id, thread_id)`` of the raw posts of the channel, in
+#: the order they are transformed
+RAW_POSTS = [
+    ("video", "video", None, "video"),
+    ("comment", "comment", None, "video"),
+    ("reply", "comment", "comment", "video"),
+    # the parent comment was deleted, the reply is threaded to the video
+    ("orphan", "comment", "deleted", "video"),
+    # the video was not scraped
+    ("unthreaded", "comment", None, "missing"),
+    ("unthreaded_orphan", "comment", "deleted", "missing"),
+]
+
+#: Platform ID of the post each comment replies to, or -1
+EXPECTED_REPLY_TO = {
+    "video": -1,
+    "comment": "video",
+    "reply": "comment",
+    "orphan": "video",
+    "unthreaded": -1,
+    "unthreaded_orphan": -1,
+}
+
+
+def make_raw_data(platform_id, category, parent_id, thread_id):
+    return json.dumps(
+        {
+            "id": platform_id,
+            "category": category,
+            "parent_id": parent_id,
+            "thread_id": thread_id,
+            "body": f"<p>Text of {platform_id}</p>",
+            "url": f"https://www.bitchute.com/video/{thread_id}/",
+            "author_id": "author",
+            "author": "Author",
+            "hashtags": "#tag",
+            "likes": 1,
+            "views": "10" if category == "video" else None,
+            "subject": f"Subject of {thread_id}",
+            "length": "1:00" if category == "video" else None,
+        }
+    )
+
+
+def save_raw_posts(session):
+    channel = Channel(
+        name="channel (test)",
+        platform_id="channel",
+        category="test",
+        platform="Bitchute",
+        url="https://www.bitchute.com/channel/channel/",
+        screenname="channel",
+    )
+    session.add(channel)
+    # posts that reply to nothing refer to -1, which the foreign key of
+    # ``reply_to`` requires to exist
+    session.execute(insert(post_table).values(id=-1))
+    session.flush()
+
+    results = [
+        ScraperResult(
+            scraper="BitchuteScraper 0.0.1",
+            platform="Bitchute",
+            channel=channel.id,
+            platform_id=platform_id,
+            date=DATE + timedelta(minutes=i),
+            raw_data=make_raw_data(platform_id, *fields),
+            date_archived=DATE + timedelta(days=1),
+            archived_urls={},
+            media_archived=None,
+        )
+        for i, (platform_id, *fields) in enumerate(RAW_POSTS)
+    ]
+    session.add_all(results)
+    session.commit()
+
+    return results
+
+
+def reply_to_platform_ids(session):
+    posts = session.query(Post).filter(Post.id != -1).all()
+    platform_ids = {post.id: post.platform_id for post in posts}
+
+    return {
+        post.platform_id: platform_ids.get(post.reply_to, post.reply_to)
+        for post in posts
+    }
+
+
+@pytest.mark.parametrize("batched", [True, False])
+def test_transform_threads_comments(controller, engine, monkeypatch, batched):
+    controller.reset_db()
+
+    etl_controller = ETLController()
+    etl_controller.connect_to_db(engine)
+    transformer = BitchuteTransformer()
+    etl_controller.register_transformer(transformer)
+
+    if not batched:
+        # transform and thread each comment on its own
+        monkeypatch.setattr(
+            transformer,
+            "transform_batch",
+            Transformer.transform_batch.__get__(transformer),
+        )
+
+    session = etl_controller.session()
+    results = save_raw_posts(session)
+
+    etl_controller.transform_results(results, hydrate=False)
+
+    assert session.query(Post).filter(Post.id != -1).count() == len(RAW_POSTS)
+    # both paths thread the comments the same way
+    assert reply_to_platform_ids(session) == EXPECTED_REPLY_TO
+
+    session.close()
@@ -0,0 +1,277 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from cisticola.base import ScraperResult
+from cisticola.scraper import BitchuteScraper, bitchute
+from cisticola.scraper.bitchute import (
+    LISTING_DATE_MARGIN,
+    LISTING_OFFSET_SLACK,
+    get_videos_user,
+)
+
+#: Number of videos of each listing page
+PAGE_SIZE = 5
+
+#: Number of videos of the channel, newest first
+NUM_VIDEOS = 30
+
+CONTAINER = """<html><body><div class="details">
+<p class="name"><a href="/channel/user/">User</a></p>
+</div></body></html>"""
+
+
+def listing_day(i):
+    """Day shown on the listing for video ``i``, one video per day."""
+
+    return datetime(2022, 6, 30) - timedelta(days=i)
+
+
+def listing_timestamp(i):
+    return int(listing_day(i).timestamp())
+
+
+def listing_entry(i):
+    return f"""<div class="channel-videos-container">
+<div class="channel-videos-image"><img src="https://example.com/{i}.jpg"></div>
+<div class="channel-videos-title"><a href="/video/video{i}/">Video {i}</a></div>
+<div class="channel-videos-text"><p>Description of video {i}</p></div>
+<div class="channel-videos-details text-right hidden-xs">
+<span>{listing_day(i).strftime("%b %d, %Y")}</span></div>
+<span class="video-views">{i}</span><span class="video-duration">1:00</span>
+</div>"""
+
+
+class ListingClient:
+    """Serves the extend listing of a channel of ``NUM_VIDEOS`` videos, in
+    place of a BitchuteClient, and records the requested offsets."""
+
+    def __init__(self):
+        self.session = None
+        self.detail_session = None
+        self.offsets = []
+
+    def post(self, url, headers=None, data=None):
+        offset = int(data["offset"])
+        self.offsets.append(offset)
+
+        videos = range(offset, min(offset + PAGE_SIZE, NUM_VIDEOS))
+
+        return {"html": "".join(listing_entry(i) for i in videos)}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(
+        bitchute,
+        "send_request",
+        lambda method, url, **kwargs: SimpleNamespace(text=CONTAINER),
+    )
+
+    return ListingClient()
+
+
+def video_ids(videos):
+    return [int(video["id"][len("video") :]) for video in videos]
+
+
+def test_get_videos_user_all(client):
+    videos = list(get_videos_user(client, "user", "basic", max_items=100))
+
+    assert video_ids(videos) == list(range(NUM_VIDEOS))
+    assert videos[0]["timestamp"] == listing_timestamp(0)
+    assert videos[0]["author_id"] == "user"
+    assert client.offsets == [0, 5, 10, 15, 20, 25, 30]
+
+
+def test_get_videos_user_stops_at_since_id(client):
+    videos = get_videos_user(
+        client,
+        "user",
+        "basic",
+        since_id="video7",
+        since_timestamp=listing_timestamp(7) + 15 * 60 * 60,
+    )
+
+    assert video_ids(videos) == list(range(7))
+    assert client.offsets == [0, 5]
+
+
+def test_get_videos_user_stops_after_listing_date_margin(client):
+    # the video scraped last was deleted since, so only its date is known.
+    # Video 7 was listed on the same day, and is compared with its exact
+    # publication date after fetching it
+    videos = get_videos_user(
+        client,
+        "user",
+        "basic",
+        since_id="deleted",
+        since_timestamp=listing_timestamp(7) + 15 * 60 * 60,
+    )
+
+    assert video_ids(videos) == list(range(8))
+    assert client.offsets == [0, 5]
+
+
+def test_get_videos_user_listing_date_margin_boundary(client):
+    videos = get_videos_user(
+        client,
+        "user",
+        "basic",
+        since_timestamp=listing_timestamp(7) + LISTING_DATE_MARGIN,
+    )
+
+    assert video_ids(videos) == list(range(8))
+
+
+def test_get_videos_user_nothing_new(client):
+    videos = get_videos_user(
+        client,
+        "user",
+        "basic",
+        since_id="video0",
+        since_timestamp=listing_timestamp(0),
+    )
+
+    assert list(videos) == []
+    assert client.offsets == [0]
+
+
+def test_get_videos_user_max_items(client):
+    offsets = []
+
+    videos = get_videos_user(
+        client, "user", "basic", max_items=12, on_page=offsets.append
+    )
+
+    assert video_ids(videos) == list(range(12))
+    assert client.offsets == [0, 5, 10]
+    assert offsets == [5, 10, 12]
+
+
+def test_get_videos_user_resumes_from_offset(client):
+    offsets = []
+
+    videos = get_videos_user(
+        client, "user", "basic", offset=12, max_items=10, on_page=offsets.append
+    )
+
+    assert video_ids(videos) == list(range(12, 22))
+    assert client.offsets == [12, 17]
+    assert offsets == [17, 22]
+
+
+def test_get_videos_user_skips_until(client):
+    offsets = []
+
+    videos = get_videos_user(
+        client,
+        "user",
+        "basic",
+        until_id="video7",
+        until_timestamp=listing_timestamp(7) + 15 * 60 * 60,
+        max_items=5,
+        on_page=offsets.append,
+    )
+
+    # skipped listing entries do not count towards ``max_items``
+    assert video_ids(videos) == list(range(8, 13))
+    assert client.offsets == [0, 5, 10]
+    assert offsets == [5, 10, 13]
+
+
+def test_get_videos_user_skips_until_deleted(client):
+    # the oldest video scraped was deleted since, so only its date is known.
+    # Video 7 was listed on the same day, and is compared with its exact
+    # publication date after fetching it
+    videos = get_videos_user(
+        client,
+        "user",
+        "basic",
+        until_id="deleted",
+        until_timestamp=listing_timestamp(7) + 15 * 60 * 60,
+    )
+
+    assert video_ids(videos) == list(range(7, NUM_VIDEOS))
+
+
+def test_get_videos_user_filters_until_exact_date(client, monkeypatch):
+    # video 7 was published after ``until`` on the same day
+    def append_details(video, detail, session=None):
+        if video["id"] == "video7":
+            video = {**video, "timestamp": video["timestamp"] + 20 * 60 * 60}
+        return video, []
+
+    monkeypatch.setattr(bitchute, "append_details", append_details)
+
+    videos = get_videos_user(
+        client,
+        "user",
+        "comments",
+        until_id="deleted",
+        until_timestamp=listing_timestamp(7) + 15 * 60 * 60,
+    )
+
+    assert video_ids(videos) == list(range(8, NUM_VIDEOS))
+
+
+CHANNEL = SimpleNamespace(id=1, url="https://www.bitchute.com/channel/user/")
+
+
+def make_result(i, hours=15):
+    return ScraperResult(
+        scraper=BitchuteScraper.__version__,
+        platform="Bitchute",
+        channel=1,
+        platform_id=f"video{i}",
+        date=datetime.fromtimestamp(listing_timestamp(i) + hours * 60 * 60),
+        raw_data="{}",
+        date_archived=datetime(2022, 7, 1),
+        archived_urls={},
+        media_archived=None,
+    )
+
+
+@pytest.fixture
+def scraper(client, monkeypatch):
+    """BitchuteScraper with a saved listing offset of 40, whose saved offsets
+    are recorded in ``scraper.cursors``."""
+
+    monkeypatch.setattr(
+        bitchute,
+        "append_details",
+        lambda video, detail, session=None: (video, []),
+    )
+
+    scraper = BitchuteScraper()
+    scraper.client = client
+    scraper.cursors = []
+    monkeypatch.setattr(scraper, "get_cursor", lambda channel: {"offset": 40})
+    monkeypatch.setattr(
+        scraper, "save_cursor", lambda channel, cursor: scraper.cursors.append(cursor)
+    )
+
+    return scraper
+
+
+def test_get_posts_resumes_backfill_before_saved_offset(scraper):
+    scraper.max_backfill_videos = 3
+    posts = list(scraper.get_posts(CHANNEL, until=make_result(10)))
+
+    # the backfill starts LISTING_OFFSET_SLACK entries before the saved offset
+    assert scraper.client.offsets[0] == 40 - LISTING_OFFSET_SLACK
+    assert [post.platform_id for post in posts] == ["video15", "video16", "video17"]
+    assert scraper.cursors == [{"offset": 18}]
+
+
+def test_get_posts_since_exact_date(scraper):
+    # the video scraped last was deleted since. Video 7 is fetched because of
+    # the listing date margin, but was published before it
+    since = make_result(7, hours=12)
+    since.platform_id = "deleted"
+
+    posts = list(scraper.get_posts(CHANNEL, since=since))
+
+    assert [post.platform_id for post in posts] == [f"video{i}" for i in range(7)]
+    assert scraper.cursors == []
@@ -0,0 +1,370 @@
+import pytest
+from sqlalchemy import String, create_engine, func, insert, literal, select
+
+from cisticola.base import (
+    TELEGRAM_CHANNEL_LIST_URL,
+    Channel,
+    channel_identity_table,
+    channel_table,
+    normalize_url,
+    normalized_url_expression,
+)
+from cisticola.migrations import populate_channel_identities
+from cisticola.transformer import ETLController
+from cisticola.transformer.base import CHANNEL_INSERT_ATTEMPTS
+
+
+def make_channel(**kwargs):
+    channel_kwargs = dict(
+        name="channel (test)",
+        platform_id="1001",
+        category="test",
+        platform="Telegram",
+        url="https://t.me/channel",
+        screenname="Channel",
+        country="US",
+        influencer=None,
+        public=True,
+        chat=False,
+        notes="",
+        source="researcher",
+    )
+    channel_kwargs.update(kwargs)
+
+    return Channel(**channel_kwargs)
+
+
+def new_controller(engine):
+    """ETLController with an empty identity map, like another ETL process."""
+
+    etl_controller = ETLController()
+    etl_controller.connect_to_db(engine)
+
+    return etl_controller
+
+
+def count_channels(engine):
+    with engine.connect() as connection:
+        return connection.scalar(select(func.count()).select_from(channel_table))
+
+
+def identities(engine):
+    with engine.connect() as connection:
+        return set(
+            connection.execute(
+                select(
+                    channel_identity_table.c.kind,
+                    channel_identity_table.c.value,
+                    channel_identity_table.c.channel,
+                )
+            ).all()
+        )
+
+
+@pytest.fixture
+def etl(controller, engine):
+    """Fresh ETLController on an empty database."""
+
+    controller.reset_db()
+
+    return new_controller(engine)
+
+
+def test_upsert_channel_inserts_new_channel(etl, engine):
+    session = etl.session()
+
+    channel = etl.upsert_channel(make_channel(), session)
+
+    assert channel.id is not None
+    assert count_channels(engine) == 1
+    assert identities(engine) == {
+        ("url", "https://t.me/channel", channel.id),
+        ("platform_id", "1001", channel.id),
+        ("screenname", "channel", channel.id),
+    }
+    assert etl.channel_identities[("Telegram", "platform_id", "1001")] == channel.id
+
+    # the channel is committed, and found by other processes
+    other = new_controller(engine)
+    found = other.upsert_channel(make_channel(url=None), other.session())
+
+    assert found.id == channel.id
+    assert count_channels(engine) == 1
+
+    session.close()
+
+
+def test_upsert_channel_without_keys(etl, engine):
+    session = etl.session()
+
+    channel = etl.upsert_channel(
+        make_channel(url=None, platform_id=None, screenname=None), session
+    )
+    session.commit()
+
+    assert channel.id is not None
+    assert count_channels(engine) == 1
+    assert identities(engine) == set()
+
+    session.close()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        # only some of the keys were claimed by the other process
+        {"url": "https://t.me/other", "screenname": "other"},
+    ],
+)
+def test_upsert_channel_reselects_concurrently_claimed_channel(
+    etl, engine, monkeypatch, kwargs
+):
+    existing = etl.upsert_channel(make_channel(), etl.session())
+
+    # another process which did not see the channel when it looked it up
+    other = new_controller(engine)
+    select_channel = other.select_channel
+    lookups = []
+
+    def select_channel_after_claim(obj, session):
+        lookups.append(obj)
+        if len(lookups) == 1:
+            return None
+        return select_channel(obj, session)
+
+    monkeypatch.setattr(other, "select_channel", select_channel_after_claim)
+
+    session = other.session()
+    channel = other.upsert_channel(
+        make_channel(source="linked_channel", **kwargs), session
+    )
+
+    assert len(lookups) == 2
+    assert channel.id == existing.id
+    assert count_channels(engine) == 1
+    # the keys claimed by the rolled back statement are not kept
+    assert {channel_id for _, _, channel_id in identities(engine)} == {existing.id}
+
+    session.close()
+
+
+def test_upsert_channel_gives_up_after_attempts(etl, engine, monkeypatch):
+    etl.upsert_channel(make_channel(), etl.session())
+
+    other = new_controller(engine)
+    lookups = []
+    monkeypatch.setattr(
+        other, "select_channel", lambda obj, session: lookups.append(obj)
+    )
+
+    with pytest.raises(RuntimeError):
+        other.upsert_channel(make_channel(), other.session())
+
+    assert len(lookups) == CHANNEL_INSERT_ATTEMPTS
+    assert count_channels(engine) == 1
+
+
+@pytest.mark.parametrize(
+    "existing_source, updated",
+    [
+        ("researcher", False),
+        ("linked_channel", False),
+        ("snowball_2022", False),
+        ("channel_import", True),
+        ("", True),
+        (None, True),
+    ],
+)
+def test_upsert_channel_linked_channel_precedence(
+    etl, engine, existing_source, updated
+):
+    existing = etl.upsert_channel(
+        make_channel(source=existing_source, notes="original", category="original"),
+        etl.session(),
+    )
+
+    other = new_controller(engine)
+    session = other.session()
+    linked = make_channel(
+        source="linked_channel", notes="linked", category="linked", country="CA"
+    )
+
+    channel = other.upsert_channel(linked, session)
+
+    assert channel.id == existing.id
+    if updated:
+        assert (channel.source, channel.notes, channel.category, channel.country) == (
+            "linked_channel",
+            "linked",
+            "linked",
+            "CA",
+        )
+    else:
+        assert (channel.source, channel.notes, channel.category, channel.country) == (
+            existing_source,
+            "original",
+            "original",
+            "US",
+        )
+
+    session.close()
+
+
+def test_upsert_channel_fills_missing_platform_id(etl, engine):
+    existing = etl.upsert_channel(make_channel(platform_id=None), etl.session())
+
+    other = new_controller(engine)
+    session = other.session()
+
+    # researcher channels are never overwritten by linked channels, but their
+    # missing platform ID is filled in
+    channel = other.upsert_channel(
+        make_channel(source="linked_channel", notes="linked"), session
+    )
+
+    assert channel.id == existing.id
+    assert channel.platform_id == "1001"
+    assert channel.notes == ""
+    assert ("platform_id", "1001", existing.id) in identities(engine)
+
+    session.close()
+
+
+def test_upsert_channel_in_crossing_transactions(controller):
+    # processes whose batches upsert the same channels in opposite orders
+    # would wait for each other if the channels stayed locked until the end
+    # of the batch, which fails here rather than hangs
+    controller.reset_db()
+    engine = create_engine(
+        controller.engine.url,
+        connect_args={"options": "-c lock_timeout=2000"},
+    )
+
+    first, second = new_controller(engine), new_controller(engine)
+    first_session, second_session = first.session(), second.session()
+
+    def make_numbered_channel(i, source):
+        return make_channel(
+            url=f"https://t.me/channel{i}",
+            platform_id=str(i),
+            screenname=f"channel{i}",
+            source=source,
+        )
+
+    a = first.upsert_channel(make_numbered_channel(1, "import"), first_session)
+    b = second.upsert_channel(make_numbered_channel(2, "import"), second_session)
+
+    # both channels are updated by the process that did not insert them
+    linked_b = first.upsert_channel(
+        make_numbered_channel(2, "linked_channel"), first_session
+    )
+    linked_a = second.upsert_channel(
+        make_numbered_channel(1, "linked_channel"), second_session
+    )
+    assert (linked_a.id, linked_b.id) == (a.id, b.id)
+    assert linked_a.source == linked_b.source == "linked_channel"
+
+    first_session.commit()
+    second_session.commit()
+
+    assert count_channels(engine) == 2
+
+    first_session.close()
+    second_session.close()
+    engine.dispose()
+
+
+URLS = [
+    "https://t.me/channel",
+    "http://www.T.ME/channel/",
+    "HTTPS://WWW.t.me/channel//",
+    "t.me/channel",
+    "www.t.me/channel#top",
+    "https://www.youtube.com/channel/UCP6exBqGoxGLv_pM9Dxk2pA/",
+    "https://gab.com/groups/10001?page=2",
+    "https://wwwx.example.com/",
+    "https://t.me/s/",
+    "https://",
+    "/",
+    "https://пример.рф/Канал/",
+]
+
+
+@pytest.mark.parametrize(
+    "url, normalized",
+    [
+        ("https://t.me/channel", "https://t.me/channel"),
+        ("http://www.T.ME/channel/", "https://t.me/channel"),
+        ("HTTPS://WWW.t.me/channel//", "https://t.me/channel"),
+        ("t.me/channel", "https://t.me/channel"),
+        ("www.t.me/channel#top", "https://t.me/channel"),
+        ("https://gab.com/Groups/10001?page=2", "https://gab.com/Groups/10001?page=2"),
+        ("https://wwwx.example.com/", "https://wwwx.example.com"),
+        ("https://t.me/s/", TELEGRAM_CHANNEL_LIST_URL),
+    ],
+)
+def test_normalize_url(url, normalized):
+    assert normalize_url(url) == normalized
+
+
+def test_normalized_url_expression_matches_normalize_url(engine):
+    with engine.connect() as connection:
+        normalized = [
+            connection.scalar(select(normalized_url_expression(literal(url, String))))
+            for url in URLS
+        ]
+
+    assert normalized == [normalize_url(url) for url in URLS]
+
+
+def test_identity_keys_normalize_url():
+    assert make_channel(url="http://www.T.me/channel/").identity_keys()[0] == (
+        "url",
+        "https://t.me/channel",
+    )
+    assert make_channel(url="https://t.me/s/").identity_keys()[0][0] != "url"
+
+
+def test_upsert_channel_matches_differently_written_url(etl, engine):
+    existing = etl.upsert_channel(make_channel(), etl.session())
+
+    other = new_controller(engine)
+    channel = other.upsert_channel(
+        make_channel(url="http://www.T.me/channel/", platform_id=None, screenname=None),
+        other.session(),
+    )
+
+    assert channel.id == existing.id
+    assert count_channels(engine) == 1
+
+
+def test_populate_channel_identities_normalizes_urls(etl, engine):
+    with engine.begin() as connection:
+        first, _, _ = connection.scalars(
+            insert(channel_table).returning(
+                channel_table.c.id, sort_by_parameter_order=True
+            ),
+            [
+                dict(platform="Telegram", url="http://www.T.me/channel/"),
+                dict(platform="Telegram", url="https://t.me/channel"),
+                dict(platform="Telegram", url="https://t.me/s/"),
+            ],
+        ).all()
+        # registered before URLs were normalized
+        connection.execute(
+            insert(channel_identity_table).values(
+                platform="Telegram",
+                kind="url",
+                value="http://www.T.me/channel/",
+                channel=first,
+            )
+        )
+
+        populate_channel_identities(connection)
+
+    assert identities(engine) == {("url", "https://t.me/channel", first)}
+
+    # channels added outside of the ETL are found by their normalized URL
+    channel = etl.select_channel(make_channel(url="t.me/channel/"), etl.session())
+    assert channel.id == first
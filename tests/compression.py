@@ -0,0 +1,203 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+import zstandard
+from sqlalchemy import create_engine, insert
+
+from cisticola.base import (
+    ScraperResult,
+    mapper_registry,
+    raw_data_dictionary_table,
+    raw_data_projection,
+)
+from cisticola.compression import RawDataCodec, get_codec
+
+RAW_DATA = json.dumps(
+    {"id": "v1", "title": "Видео 🕊", "description": "<p>text</p>", "views": 12}
+)
+
+
+def make_samples(n=2000):
+    return [
+        json.dumps(
+            {
+                "id": f"v{i}",
+                "title": f"Video number {i}",
+                "description": f"<p>Description of video {i} &amp; more</p>",
+                "views": i * 7,
+                "channel": {"name": "channel", "url": "https://example.com/c"},
+            }
+        ).encode("utf-8")
+        for i in range(n)
+    ]
+
+
+def save_dictionary(engine, platform, dictionary):
+    with engine.begin() as connection:
+        connection.execute(
+            insert(raw_data_dictionary_table).values(
+                id=dictionary.dict_id(),
+                platform=platform,
+                dictionary=dictionary.as_bytes(),
+                date_created=datetime.now(timezone.utc),
+            )
+        )
+
+
+@pytest.fixture
+def dictionary_engine():
+    """In-memory database with only the dictionaries table."""
+
+    engine = create_engine("sqlite://")
+    mapper_registry.metadata.create_all(engine, tables=[raw_data_dictionary_table])
+
+    return engine
+
+
+@pytest.fixture
+def dictionary():
+    return zstandard.train_dictionary(4096, make_samples())
+
+
+def test_codec_round_trip_with_dictionary(dictionary_engine, dictionary):
+    save_dictionary(dictionary_engine, "Rumble", dictionary)
+    codec = RawDataCodec(dictionary_engine)
+
+    compressed = codec.compress("Rumble", RAW_DATA)
+
+    assert zstandard.get_frame_parameters(compressed).dict_id == dictionary.dict_id()
+    assert codec.decompress(compressed) == RAW_DATA
+
+
+def test_codec_round_trip_without_dictionary(dictionary_engine, dictionary):
+    save_dictionary(dictionary_engine, "Rumble", dictionary)
+    codec = RawDataCodec(dictionary_engine)
+
+    compressed = codec.compress("Gettr", RAW_DATA)
+
+    assert zstandard.get_frame_parameters(compressed).dict_id == 0
+    assert codec.decompress(compressed) == RAW_DATA
+
+
+def test_codec_looks_up_dictionary_by_id(dictionary_engine, dictionary):
+    # the codec decompressing is created before the dictionary is trained
+    codec = RawDataCodec(dictionary_engine)
+    save_dictionary(dictionary_engine, "Rumble", dictionary)
+
+    compressed = RawDataCodec(dictionary_engine).compress("Rumble", RAW_DATA)
+
+    assert dictionary.dict_id() not in codec.dictionaries
+    assert codec.decompress(compressed) == RAW_DATA
+    assert dictionary.dict_id() in codec.dictionaries
+
+
+def test_codec_uses_latest_dictionary(dictionary_engine, dictionary):
+    save_dictionary(dictionary_engine, "Rumble", dictionary)
+    old_compressed = RawDataCodec(dictionary_engine).compress("Rumble", RAW_DATA)
+
+    new_dictionary = zstandard.train_dictionary(4096, make_samples(3000))
+    save_dictionary(dictionary_engine, "Rumble", new_dictionary)
+    codec = RawDataCodec(dictionary_engine)
+
+    new_compressed = codec.compress("Rumble", RAW_DATA)
+
+    assert (
+        zstandard.get_frame_parameters(new_compressed).dict_id
+        == new_dictionary.dict_id()
+    )
+    assert codec.decompress(old_compressed) == RAW_DATA
+    assert codec.decompress(new_compressed) == RAW_DATA
+
+
+def test_compress_result_passes_through_uncompressed(dictionary_engine):
+    codec = RawDataCodec(dictionary_engine)
+    result = ScraperResult(
+        scraper="test",
+        platform="Rumble",
+        channel=None,
+        platform_id="v1",
+        date=datetime(2022, 1, 1),
+        raw_data=None,
+        date_archived=datetime(2022, 1, 2),
+        archived_urls={},
+        media_archived=None,
+    )
+
+    codec.compress_result(result)
+
+    assert result.raw_data is None
+    assert result.raw_data_compressed is None
+
+    result.raw_data = RAW_DATA
+    codec.compress_result(result)
+
+    assert result.raw_data is None
+    assert codec.decompress(result.raw_data_compressed) == RAW_DATA
+
+
+def test_compressed_raw_data_reloaded_after_commit(controller, session, engine):
+    controller.reset_db()
+
+    result = ScraperResult(
+        scraper="test",
+        platform="Rumble",
+        channel=None,
+        platform_id="v1",
+        date=datetime(2022, 1, 1),
+        raw_data=RAW_DATA,
+        date_archived=datetime(2022, 1, 2),
+        archived_urls={},
+        media_archived=None,
+    )
+    get_codec(engine).compress_result(result)
+
+    session.add(result)
+    session.commit()
+
+    # the commit expired the result, which is refreshed on access
+    assert result.raw_data == RAW_DATA
+
+    session.expire(result)
+    session.refresh(result)
+    assert result.raw_data == RAW_DATA
+
+    session.expunge_all()
+    loaded = session.query(ScraperResult).filter_by(platform_id="v1").one()
+    assert loaded.raw_data == RAW_DATA
+    assert loaded.raw_data_compressed is not None
+
+
+def test_raw_data_projection(controller, session, engine):
+    controller.reset_db()
+
+    def make_result(platform_id):
+        return ScraperResult(
+            scraper="test",
+            platform="Rumble",
+            channel=None,
+            platform_id=platform_id,
+            date=datetime(2022, 1, 1),
+            raw_data=RAW_DATA,
+            date_archived=datetime(2022, 1, 2),
+            archived_urls={},
+            media_archived=None,
+        )
+
+    compressed = make_result("compressed")
+    get_codec(engine).compress_result(compressed)
+    session.add_all([make_result("plain"), compressed])
+    session.commit()
+
+    rows = dict(
+        session.query(
+            ScraperResult.platform_id,
+            raw_data_projection(ScraperResult, ["id", "views", "missing"]),
+        ).all()
+    )
+
+    assert json.loads(rows["plain"]) == {"id": "v1", "views": 12, "missing": None}
+    # compressed raw data is only decompressed in Python
+    assert rows["compressed"] is None
+
+    assert session.query(raw_data_projection(ScraperResult, [])).first() == (None,)
@@ -173,6 +173,27 @@ YOUTUBE_CHANNEL_KWARGS = {
 }
 
 
+def pytest_addoption(parser):
+    parser.addoption(
+        "--benchmark",
+        action="store_true",
+        default=False,
+        help="run the benchmarks, which are skipped by default",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the tests marked as benchmarks unless ``--benchmark`` is given."""
+
+    if config.getoption("--benchmark"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="benchmark, run with --benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
 @pytest.fixture(scope="package")
 def engine(tmpdir_factory):
     """Initialize a SQLite database and SQLAlchemy engine to be used for all
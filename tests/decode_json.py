@@ -0,0 +1,101 @@
+import json
+import math
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from cisticola import utils
+from cisticola.utils import decode_json
+
+BACKENDS = ["msgspec", "orjson", "json"]
+
+KEYS = ["id", "text", "user", "media", "missing"]
+
+JSON_VALUES = st.recursive(
+    st.none()
+    | st.booleans()
+    | st.integers(min_value=-(2**63), max_value=2**63 - 1)
+    | st.floats(allow_nan=False, allow_infinity=False)
+    | st.text(),
+    lambda children: st.lists(children, max_size=4)
+    | st.dictionaries(st.text(max_size=5), children, max_size=4),
+    max_leaves=10,
+)
+
+DOCUMENTS = st.dictionaries(
+    st.sampled_from(KEYS[:-1]) | st.text(max_size=5), JSON_VALUES, max_size=6
+)
+
+FIELDS = st.lists(st.sampled_from(KEYS), unique=True, max_size=len(KEYS))
+
+POST = json.dumps(
+    {
+        "id": 12,
+        "text": "Привет 🕊",
+        "user": {"name": "user", "followers": [1, 2, {"id": None}]},
+        "media": None,
+        "views": 1.5,
+    }
+)
+
+
+def use_backend(monkeypatch, backend):
+    """Make decode_json use only ``backend`` and the fallbacks after it."""
+
+    if backend != "msgspec":
+        monkeypatch.setattr(utils, "msgspec", None)
+    if backend == "json":
+        monkeypatch.setattr(utils, "orjson", None)
+
+
+def project(document, fields):
+    decoded = json.loads(document)
+    return {field: decoded[field] for field in fields if field in decoded}
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@given(document=DOCUMENTS, fields=FIELDS)
+def test_decode_json_fields_match_full_decode(backend, document, fields):
+    data = json.dumps(document)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        use_backend(monkeypatch, backend)
+
+        assert decode_json(data) == json.loads(data)
+        assert decode_json(data, fields=fields) == project(data, fields)
+        assert decode_json(data.encode("utf-8"), fields=fields) == project(data, fields)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_decode_json_nested_and_missing_fields(monkeypatch, backend):
+    use_backend(monkeypatch, backend)
+
+    assert decode_json(POST, fields=("user", "missing", "media")) == {
+        "user": {"name": "user", "followers": [1, 2, {"id": None}]},
+        "media": None,
+    }
+    assert decode_json(POST, fields=("missing",)) == {}
+    assert decode_json(POST, fields=()) == {}
+    assert decode_json(POST) == json.loads(POST)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_decode_json_nan_falls_back_to_json(monkeypatch, backend):
+    use_backend(monkeypatch, backend)
+    data = '{"id": 1, "score": NaN, "rank": Infinity, "text": "a"}'
+
+    decoded = decode_json(data)
+    assert decoded["id"] == 1
+    assert math.isnan(decoded["score"])
+    assert decoded["rank"] == math.inf
+
+    projected = decode_json(data, fields=("score", "text"))
+    assert list(projected) == ["score", "text"]
+    assert math.isnan(projected["score"])
+    assert projected["text"] == "a"
+
+
+def test_decode_json_invalid():
+    with pytest.raises(ValueError):
+        decode_json('{"id": ', fields=("id",))
@@ -0,0 +1,200 @@
+import json
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, select
+
+from cisticola.base import Channel, Post, ScraperResult, post_table
+from cisticola.transformer import BitchuteTransformer, ETLController
+
+DATE = datetime(2022, 6, 1)
+
+NUM_VIDEOS = 50
+
+
+def make_raw_data(i):
+    return json.dumps(
+        {
+            "id": f"video{i}",
+            "category": "video",
+            "parent_id": None,
+            "thread_id": f"video{i}",
+            "body": f"<p>Description of video {i}</p>",
+            "url": f"https://www.bitchute.com/video/video{i}/",
+            "author_id": "author",
+            "author": "Author",
+            "hashtags": "",
+            "likes": i,
+            "views": str(i),
+            "subject": f"Video {i}",
+            "length": "1:00",
+        }
+    )
+
+
+@pytest.fixture
+def etl(controller, engine):
+    """ETLController saving posts in small batches, with ``NUM_VIDEOS``
+    untransformed Bitchute videos in an empty database."""
+
+    controller.reset_db()
+
+    etl_controller = ETLController(max_buffered_posts=7)
+    etl_controller.connect_to_db(engine)
+    etl_controller.register_transformer(BitchuteTransformer())
+
+    session = etl_controller.session()
+    channel = Channel(
+        name="channel (test)",
+        platform_id="channel",
+        category="test",
+        platform="Bitchute",
+        url="https://www.bitchute.com/channel/channel/",
+        screenname="channel",
+    )
+    session.add(channel)
+    # posts that reply to nothing refer to -1, which the foreign key of
+    # ``reply_to`` requires to exist
+    session.execute(insert(post_table).values(id=-1))
+    session.flush()
+    session.add_all(
+        ScraperResult(
+            scraper="BitchuteScraper 0.0.1",
+            platform="Bitchute",
+            channel=channel.id,
+            platform_id=f"video{i}",
+            date=DATE + timedelta(minutes=i),
+            raw_data=make_raw_data(i),
+            date_archived=DATE + timedelta(days=1),
+            archived_urls={},
+            media_archived=None,
+        )
+        for i in range(NUM_VIDEOS)
+    )
+    session.commit()
+    session.close()
+
+    return etl_controller
+
+
+def saved_raw_ids(etl_controller):
+    with etl_controller.session() as session:
+        return session.scalars(
+            select(Post.raw_id).where(Post.id != -1).order_by(Post.raw_id)
+        ).all()
+
+
+def test_flush_posts_from_threads_saves_posts_once(etl):
+    with etl.session() as session:
+        results = session.query(ScraperResult).all()
+        session.expunge_all()
+
+    transformer = BitchuteTransformer()
+
+    def transform_and_flush(results):
+        # each thread fills the shared buffer, and flushes it, with its own session
+        with etl.session() as session:
+            for result in results:
+                transformer.transform(
+                    result,
+                    lambda obj: etl.insert_or_select(obj, session, hydrate=False),
+                    session,
+                    lambda: etl.flush_posts(session),
+                )
+            etl.flush_posts(session)
+            session.commit()
+
+    threads = [
+        threading.Thread(target=transform_and_flush, args=(results[i::4],))
+        for i in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert etl.posts_to_insert == []
+    assert saved_raw_ids(etl) == sorted(result.id for result in results)
+
+
+def test_transform_all_untransformed_writes_posts_once(etl):
+    etl.transform_all_untransformed(hydrate=False)
+
+    raw_ids = saved_raw_ids(etl)
+    assert len(raw_ids) == NUM_VIDEOS
+    assert len(set(raw_ids)) == NUM_VIDEOS
+    assert etl.post_writer is None
+    assert etl.posts_to_insert == []
+
+    # nothing is left to transform
+    etl.transform_all_untransformed(hydrate=False)
+    assert len(saved_raw_ids(etl)) == NUM_VIDEOS
+
+
+def test_transform_all_untransformed_raises_post_writer_error(etl, monkeypatch):
+    save_posts = etl.save_posts
+    calls = []
+
+    def fail_on_second_batch(posts, session):
+        calls.append(posts)
+        if len(calls) == 2:
+            raise ValueError("failed to save posts")
+        save_posts(posts, session)
+
+    monkeypatch.setattr(etl, "save_posts", fail_on_second_batch)
+
+    with pytest.raises(ValueError, match="failed to save posts"):
+        etl.transform_all_untransformed(hydrate=False)
+
+    assert etl.post_writer is None
+    # the batches after the failed one are discarded
+    assert len(saved_raw_ids(etl)) == len(calls[0])
+
+
+def test_transform_results_with_and_without_post_writer(etl):
+    with etl.session() as session:
+        results = session.query(ScraperResult).order_by(ScraperResult.id).all()
+
+        etl.start_post_writer()
+        try:
+            # the posts are left to the post writer
+            etl.transform_results(results[:20], hydrate=False)
+        finally:
+            etl.stop_post_writer()
+
+        assert len(saved_raw_ids(etl)) == 20
+
+        # without a post writer, posts are saved in the session
+        etl.transform_results(results[20:], hydrate=False)
+        assert saved_raw_ids(etl) == [result.id for result in results]
+
+
+def test_flush_posts_raises_post_writer_error(etl, monkeypatch):
+    def fail(posts, session):
+        raise ValueError("failed to save posts")
+
+    monkeypatch.setattr(etl, "save_posts", fail)
+
+    with etl.session() as session:
+        results = session.query(ScraperResult).limit(3).all()
+
+        etl.start_post_writer()
+        transformer = BitchuteTransformer()
+        for result in results:
+            transformer.transform(
+                result,
+                lambda obj: etl.insert_or_select(obj, session, hydrate=False),
+                session,
+                lambda: etl.flush_posts(session),
+            )
+
+        with pytest.raises(ValueError, match="failed to save posts"):
+            etl.flush_posts(session)
+
+        # the error is raised again when the writer is stopped
+        with pytest.raises(ValueError, match="failed to save posts"):
+            etl.stop_post_writer()
+
+    assert etl.post_writer is None
+    assert saved_raw_ids(etl) == []
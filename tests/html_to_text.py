@@ -0,0 +1,233 @@
+import re
+import timeit
+from html.parser import HTMLParser
+
+import pytest
+from bs4 import BeautifulSoup
+
+from cisticola.base import ScraperResult
+from cisticola.scraper.bitchute import strip_tags
+from cisticola.transformer.bitchute import DESCRIPTION_TOGGLES
+from cisticola.utils import decode_json, html_to_text
+
+DESCRIPTION = """<div class="teaser"><p>Short &amp; sweet</p></div>
+<div class="full hidden"><p>Long text &amp; more <a href="https://example.com">link</a></p>
+<p>Привет 🕊<br>#tag</p></div>
+<span class="more">show more</span>
+<span class="less hidden">show less</span>"""
+
+PAGE = """<!DOCTYPE html>
+<html><head><title>Video</title></head><body>
+<div class="container content media-description">First line<br>Второй <b>bold</b>
+<p>Paragraph</p></div>
+</body></html>"""
+
+
+def test_html_to_text_matches_beautifulsoup_description():
+    soup = BeautifulSoup(DESCRIPTION, features="html.parser")
+    soup.find("div", {"class": "teaser"}).decompose()
+    soup.find("span", {"class": "more"}).decompose()
+    soup.find("span", {"class": "less hidden"}).decompose()
+
+    assert html_to_text(DESCRIPTION, remove=DESCRIPTION_TOGGLES).strip() == (
+        soup.text.strip()
+    )
+
+
+def test_html_to_text_matches_beautifulsoup_selected_element():
+    soup = BeautifulSoup(PAGE.encode(), features="html.parser")
+    content_div = soup.find("div", {"class": "container content media-description"})
+
+    text = html_to_text(
+        PAGE.encode(),
+        select="//div[@class='container content media-description']",
+        separator="\n",
+    )
+
+    assert text == content_div.get_text("\n")
+
+
+def test_html_to_text_removed_root():
+    teaser = '<div class="teaser"><p>Short &amp; sweet</p></div>'
+
+    assert html_to_text(teaser, remove=DESCRIPTION_TOGGLES) == ""
+    assert html_to_text(PAGE, select="//p", remove=["//p"]) == ""
+
+
+def test_html_to_text_empty():
+    assert html_to_text("") == ""
+    assert html_to_text("  ") == ""
+    assert html_to_text("", select="//div") is None
+    assert html_to_text("<p>text</p>", select="//div") is None
+
+
+def reference_strip_tags(html):
+    """Previous ``HTMLParser`` implementation of ``strip_tags``, kept as an
+    oracle and a baseline for the benchmarks below."""
+
+    html = html.replace("<br>", "\n").replace("</p>", "</p>\n")
+    html = re.sub(r"\n+", "\n", html)
+
+    class HTMLStripper(HTMLParser):
+        def __init__(self):
+            super().__init__()
+            self.reset()
+            self.convert_charrefs = True
+            self.fed = []
+
+        def handle_data(self, data):
+            self.fed.append(data)
+
+    stripper = HTMLStripper()
+    stripper.feed(html)
+    return "".join(stripper.fed)
+
+
+def reference_description_text(html):
+    """Previous BeautifulSoup extraction of the text of a Bitchute description."""
+
+    soup = BeautifulSoup(html, features="html.parser")
+    for name, attrs in (
+        ("div", {"class": "teaser"}),
+        ("span", {"class": "more"}),
+        ("span", {"class": "less hidden"}),
+    ):
+        # descriptions scraped from channel listings have no toggles
+        element = soup.find(name, attrs)
+        if element is not None:
+            element.decompose()
+    return soup.text.strip()
+
+
+def reference_page_text(content):
+    """Previous BeautifulSoup extraction of the description of a Rumble page."""
+
+    soup = BeautifulSoup(content, features="html.parser")
+    content_div = soup.find("div", {"class": "container content media-description"})
+    return content_div.get_text("\n")
+
+
+def best_time(func, *args, number=100, repeat=5):
+    """Best time in seconds of ``repeat`` runs of ``number`` calls of ``func``."""
+
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=repeat))
+
+
+def print_timings(name, current, reference, number):
+    print(
+        f"{name}: {current / number * 1000:.3f} ms, previous version "
+        f"{reference / number * 1000:.3f} ms ({reference / current:.1f}x)"
+    )
+
+
+#: Video page with a few hundred elements around its description, like a
+#: Rumble video page with its recommended videos
+LARGE_PAGE = (
+    "<!DOCTYPE html><html><head><title>Video</title>"
+    + "<script>var player = {};</script>" * 20
+    + "</head><body>"
+    + "".join(
+        f'<div class="item"><a href="/v{i}.html">Video {i}</a><span>{i} views</span></div>'
+        for i in range(300)
+    )
+    + '<div class="container content media-description">First line<br>Второй '
+    + "<b>bold</b><p>Paragraph</p></div></body></html>"
+).encode()
+
+LISTING_TEXTS = [
+    "Short plain description of a video",
+    "Plain text with a link https://example.com, and some more words. " * 8,
+    "<p>Paragraph &amp; text <a href='https://example.com'>link</a></p><br>" * 20,
+]
+
+
+@pytest.mark.parametrize("text", LISTING_TEXTS + ["\n\nnewlines\n\n", "", "&lt;p&gt;"])
+def test_strip_tags_matches_reference(text):
+    assert strip_tags(text).strip() == reference_strip_tags(text).strip()
+
+
+def test_html_to_text_matches_beautifulsoup_page():
+    select = "//div[@class='container content media-description']"
+
+    assert html_to_text(LARGE_PAGE, select=select, separator="\n") == (
+        reference_page_text(LARGE_PAGE)
+    )
+
+
+@pytest.mark.benchmark
+def test_html_to_text_benchmark_description():
+    html = DESCRIPTION
+
+    reference = best_time(reference_description_text, html)
+    lxml = best_time(lambda: html_to_text(html, remove=DESCRIPTION_TOGGLES).strip())
+
+    print_timings("html_to_text, description", lxml, reference, number=100)
+
+
+@pytest.mark.benchmark
+def test_html_to_text_benchmark_page():
+    select = "//div[@class='container content media-description']"
+
+    reference = best_time(reference_page_text, LARGE_PAGE, number=10)
+    lxml = best_time(
+        lambda: html_to_text(LARGE_PAGE, select=select, separator="\n"), number=10
+    )
+
+    print_timings("html_to_text, video page", lxml, reference, number=10)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("text", LISTING_TEXTS)
+def test_strip_tags_benchmark(text):
+    reference = best_time(reference_strip_tags, text)
+    current = best_time(strip_tags, text)
+
+    print_timings(f"strip_tags, {len(text)} characters", current, reference, 100)
+
+
+@pytest.mark.benchmark
+def test_benchmark_stored_bitchute_posts(session):
+    """Compare the current and previous text extraction on the Bitchute posts
+    stored in the test database, e.g. by the scraper tests."""
+
+    results = (
+        session.query(ScraperResult)
+        .filter(ScraperResult.platform == "Bitchute")
+        .limit(1000)
+        .all()
+    )
+    raws = [
+        decode_json(result.raw_data, fields=("category", "body")) for result in results
+    ]
+    descriptions = [raw["body"] for raw in raws if raw["category"] != "comment"]
+
+    if len(descriptions) == 0:
+        pytest.skip("no Bitchute videos stored in the test database")
+
+    def current_descriptions():
+        for html in descriptions:
+            html_to_text(html, remove=DESCRIPTION_TOGGLES).strip()
+
+    def reference_descriptions():
+        for html in descriptions:
+            reference_description_text(html)
+
+    reference = best_time(reference_descriptions, number=1)
+    current = best_time(current_descriptions, number=1)
+    print_timings(
+        f"html_to_text, {len(descriptions)} stored descriptions",
+        current,
+        reference,
+        number=1,
+    )
+
+    reference = best_time(
+        lambda: [reference_strip_tags(d) for d in descriptions], number=1
+    )
+    current = best_time(lambda: [strip_tags(d) for d in descriptions], number=1)
+    print_timings(
+        f"strip_tags, {len(descriptions)} stored descriptions",
+        current,
+        reference,
+        number=1,
+    )
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import pytest
+
+from cisticola.utils import HTTP_CONCURRENCY, map_concurrently
+
+
+def slow_square(item):
+    # later items finish first
+    time.sleep(0.001 * (20 - item % 20))
+    return item * item
+
+
+@pytest.mark.parametrize("concurrency", [2, 3, HTTP_CONCURRENCY, 100])
+def test_map_concurrently_keeps_order(concurrency):
+    items = list(range(50))
+
+    assert map_concurrently(slow_square, items, concurrency=concurrency) == [
+        item * item for item in items
+    ]
+
+
+@pytest.mark.parametrize("concurrency", [1, 3, HTTP_CONCURRENCY])
+def test_map_concurrently_raises_worker_exception(concurrency):
+    def fail_on_seven(item):
+        if item == 7:
+            raise ValueError(f"failed on {item}")
+        return item
+
+    with pytest.raises(ValueError, match="failed on 7"):
+        map_concurrently(fail_on_seven, range(20), concurrency=concurrency)
+
+
+def test_map_concurrently_sequential():
+    calls = []
+
+    def record(item):
+        calls.append((item, threading.current_thread()))
+        return item
+
+    assert map_concurrently(record, range(10), concurrency=1) == list(range(10))
+    assert [item for item, _ in calls] == list(range(10))
+    assert all(thread is threading.current_thread() for _, thread in calls)
+
+
+def test_map_concurrently_limits_calls_in_flight():
+    lock = threading.Lock()
+    in_flight = [0]
+    most_in_flight = [0]
+
+    def track(item):
+        with lock:
+            in_flight[0] += 1
+            most_in_flight[0] = max(most_in_flight[0], in_flight[0])
+
+        time.sleep(0.005)
+
+        with lock:
+            in_flight[0] -= 1
+
+        return item
+
+    assert map_concurrently(track, range(30), concurrency=3) == list(range(30))
+    assert 1 < most_in_flight[0] <= 3
+
+
+def test_map_concurrently_empty():
+    assert map_concurrently(slow_square, []) == []
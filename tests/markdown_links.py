@@ -0,0 +1,188 @@
+import timeit
+from itertools import takewhile
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+from telethon.helpers import add_surrogate, del_surrogate
+
+from cisticola.transformer.telegram_telethon import add_markdown_links
+
+TEXT_ALPHABET = st.sampled_from(["a", "b", " ", "\n", "\t", "\u200b", "é", "🕊"])
+
+
+def reference_add_markdown_links(raw_post):
+    """Previous (quadratic) implementation of ``add_markdown_links``, kept as
+    an oracle for the property tests below."""
+
+    def stripped(s):
+        lstripped = "".join(takewhile(str.isspace, s))
+        rstripped = "".join(reversed(tuple(takewhile(str.isspace, reversed(s)))))
+
+        return lstripped + rstripped
+
+    global_offset = 0
+    transformed_content = add_surrogate(raw_post["message"])
+    links = [
+        entity
+        for entity in raw_post["entities"]
+        if entity["_"] == "MessageEntityTextUrl"
+    ]
+
+    for link in links:
+        offset = global_offset + link["offset"]
+        length = link["length"]
+        url = link["url"]
+
+        before_link = transformed_content[:offset]
+        inner_text = transformed_content[offset : offset + length]
+
+        if inner_text.replace("\u200b", "").strip():
+            processed_inner_text = inner_text.strip().replace("\n", "\\\n")
+            link_text = f"[{processed_inner_text}]"
+            trailing_whitespace = stripped(
+                transformed_content[offset : offset + length]
+            )
+            link_href = f"({url})"
+            after_link = transformed_content[offset + length :]
+
+            transformed_content = (
+                before_link + link_text + link_href + trailing_whitespace + after_link
+            )
+            global_offset += 4 + len(url) + inner_text.strip().count("\n")
+
+    return del_surrogate(transformed_content)
+
+
+@st.composite
+def raw_posts(draw):
+    """Generate Telethon message dicts with sorted, non-overlapping entities,
+    mixing ``MessageEntityTextUrl`` with other entity types."""
+
+    message = draw(st.text(alphabet=TEXT_ALPHABET, max_size=200))
+
+    # entity offsets are in UTF-16 code units and never split a surrogate pair
+    boundaries = [0]
+    for character in message:
+        boundaries.append(boundaries[-1] + len(add_surrogate(character)))
+
+    cuts = sorted(draw(st.lists(st.sampled_from(boundaries), max_size=20)))
+
+    entities = []
+    for start, end in zip(cuts[::2], cuts[1::2]):
+        entity_type = draw(
+            st.sampled_from(["MessageEntityTextUrl", "MessageEntityBold"])
+        )
+        entity = {"_": entity_type, "offset": start, "length": end - start}
+        if entity_type == "MessageEntityTextUrl":
+            entity["url"] = draw(st.text(alphabet="abc:/.", min_size=1, max_size=20))
+        entities.append(entity)
+
+    return {"message": message, "entities": entities}
+
+
+@given(raw_posts())
+def test_add_markdown_links_matches_reference(raw_post):
+    assert add_markdown_links(raw_post) == reference_add_markdown_links(raw_post)
+
+
+def test_add_markdown_links_whitespace():
+    raw_post = {
+        "message": "see  this link\nplease ",
+        "entities": [
+            {
+                "_": "MessageEntityTextUrl",
+                "offset": 4,
+                "length": 11,
+                "url": "https://example.com",
+            }
+        ],
+    }
+
+    assert (
+        add_markdown_links(raw_post) == "see [this link](https://example.com) \nplease "
+    )
+
+
+def test_add_markdown_links_many_links():
+    words = ["word"] * 5000
+    message = " ".join(words)
+    entities = [
+        {
+            "_": "MessageEntityTextUrl",
+            "offset": i * 5,
+            "length": 4,
+            "url": f"https://example.com/{i}",
+        }
+        for i in range(len(words))
+    ]
+    raw_post = {"message": message, "entities": entities}
+
+    content = add_markdown_links(raw_post)
+
+    assert content.count("](https://example.com/") == len(words)
+    assert content == reference_add_markdown_links(raw_post)
+
+
+def best_time(func, *args, number=10, repeat=5):
+    """Best time in seconds of ``repeat`` runs of ``number`` calls of ``func``."""
+
+    return min(timeit.repeat(lambda: func(*args), number=number, repeat=repeat))
+
+
+def print_timings(name, current, reference, number):
+    print(
+        f"{name}: {current / number * 1000:.3f} ms, quadratic version "
+        f"{reference / number * 1000:.3f} ms ({reference / current:.1f}x)"
+    )
+
+
+def many_links_post(n):
+    return {
+        "message": " ".join(["word"] * n),
+        "entities": [
+            {
+                "_": "MessageEntityTextUrl",
+                "offset": i * 5,
+                "length": 4,
+                "url": f"https://example.com/{i}",
+            }
+            for i in range(n)
+        ],
+    }
+
+
+def typical_post(n=20):
+    sentence = "Read more here and there, please. "
+    return {
+        "message": sentence * n + "🕊",
+        "entities": [
+            {
+                "_": "MessageEntityTextUrl",
+                "offset": i * len(sentence) + 5,
+                "length": 9,
+                "url": f"https://example.com/{i}",
+            }
+            for i in range(n)
+        ],
+    }
+
+
+@pytest.mark.benchmark
+def test_add_markdown_links_benchmark_many_links():
+    raw_post = many_links_post(5000)
+
+    reference = best_time(reference_add_markdown_links, raw_post, number=2)
+    linear = best_time(add_markdown_links, raw_post, number=2)
+
+    print_timings("add_markdown_links, 5000 links", linear, reference, number=2)
+
+
+@pytest.mark.benchmark
+def test_add_markdown_links_benchmark_typical():
+    raw_post = typical_post()
+
+    reference = best_time(reference_add_markdown_links, raw_post, number=200)
+    linear = best_time(add_markdown_links, raw_post, number=200)
+
+    print_timings("add_markdown_links, 20 links", linear, reference, number=200)
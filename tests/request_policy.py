@@ -0,0 +1,187 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+import requests
+
+from cisticola import utils
+from cisticola.utils import MAX_RETRY_AFTER, RateLimiter, retry_after, send_request
+
+URL = "https://example.com/video"
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+
+    return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record the delays slept for instead of sleeping, and start from fresh
+    rate limiters."""
+
+    delays = []
+    monkeypatch.setattr(utils.time, "sleep", delays.append)
+    monkeypatch.setattr(utils, "_rate_limiters", {})
+
+    return delays
+
+
+def stub_session(monkeypatch, responses):
+    """Return a session whose requests return (or raise) ``responses`` in
+    order, and the list of the requested URLs."""
+
+    session = requests.Session()
+    responses = iter(responses)
+    calls = []
+
+    def request(method, url, **kwargs):
+        calls.append(url)
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(session, "request", request)
+
+    return session, calls
+
+
+def test_send_request_respects_max_retries(monkeypatch, sleeps):
+    session, calls = stub_session(monkeypatch, [make_response(500)] * 10)
+
+    r = send_request("GET", URL, session=session, max_retries=3)
+
+    assert r.status_code == 500
+    assert len(calls) == 4
+
+
+def test_send_request_returns_first_success(monkeypatch, sleeps):
+    session, calls = stub_session(
+        monkeypatch, [make_response(500), make_response(200), make_response(200)]
+    )
+
+    r = send_request("GET", URL, session=session)
+
+    assert r.status_code == 200
+    assert len(calls) == 2
+
+
+def test_send_request_retries_slow_down_codes(monkeypatch, sleeps):
+    session, calls = stub_session(
+        monkeypatch, [make_response(429), make_response(503), make_response(200)]
+    )
+
+    r = send_request("GET", URL, session=session, break_codes=(200, 429, 503))
+
+    assert r.status_code == 200
+    assert len(calls) == 3
+
+
+def test_send_request_stops_on_break_codes(monkeypatch, sleeps):
+    session, calls = stub_session(monkeypatch, [make_response(404)] * 3)
+
+    r = send_request("GET", URL, session=session, break_codes=(200, 404))
+
+    assert r.status_code == 404
+    assert len(calls) == 1
+    assert sleeps == []
+
+
+def test_send_request_raises_last_exception(monkeypatch, sleeps):
+    session, calls = stub_session(
+        monkeypatch, [requests.ConnectionError("refused")] * 3
+    )
+
+    with pytest.raises(requests.ConnectionError):
+        send_request("GET", URL, session=session, max_retries=2)
+
+    assert len(calls) == 3
+
+
+def test_send_request_caps_retry_after(monkeypatch, sleeps):
+    session, calls = stub_session(
+        monkeypatch,
+        [make_response(429, {"Retry-After": "86400"}), make_response(200)],
+    )
+
+    r = send_request("GET", URL, session=session)
+
+    assert r.status_code == 200
+    assert sleeps[0] == MAX_RETRY_AFTER
+    assert all(delay <= MAX_RETRY_AFTER for delay in sleeps)
+
+    limiter = utils.get_rate_limiter(URL)
+    assert limiter.blocked_until <= utils.time.monotonic() + MAX_RETRY_AFTER
+
+
+def test_retry_after_seconds():
+    assert retry_after(make_response(429, {"Retry-After": "5"})) == 5.0
+    assert retry_after(make_response(429, {"Retry-After": "-5"})) == 0.0
+    assert retry_after(make_response(429, {"Retry-After": "86400"})) == (
+        MAX_RETRY_AFTER
+    )
+    assert retry_after(make_response(429, {"Retry-After": "86400"}), cap=1000) == (1000)
+
+
+def test_retry_after_date():
+    now = datetime.now(timezone.utc)
+
+    soon = format_datetime(now + timedelta(seconds=30), usegmt=True)
+    assert 25 <= retry_after(make_response(503, {"Retry-After": soon})) <= 30
+
+    past = format_datetime(now - timedelta(days=1), usegmt=True)
+    assert retry_after(make_response(503, {"Retry-After": past})) == 0.0
+
+    far = format_datetime(now + timedelta(days=7), usegmt=True)
+    assert retry_after(make_response(503, {"Retry-After": far})) == MAX_RETRY_AFTER
+
+
+def test_retry_after_missing_or_invalid():
+    assert retry_after(make_response(429)) is None
+    assert retry_after(make_response(429, {"Retry-After": "soon"})) is None
+
+
+def test_rate_limiter_slows_down_and_recovers():
+    limiter = RateLimiter(8.0, min_rate=1.0)
+
+    limiter.slow_down()
+    assert limiter.rate == 4.0
+    limiter.slow_down()
+    assert limiter.rate == 2.0
+
+    for _ in range(3):
+        limiter.slow_down()
+    assert limiter.rate == 1.0
+
+    for _ in range(19):
+        limiter.speed_up()
+    assert limiter.rate == 8.0
+
+    limiter.speed_up()
+    assert limiter.rate == 8.0
+
+
+def test_rate_limiter_blocks_after_retry_after(sleeps):
+    limiter = RateLimiter(10.0, burst=5)
+
+    limiter.acquire()
+    assert sleeps == []
+
+    limiter.slow_down(retry_after=30)
+    limiter.acquire()
+
+    assert len(sleeps) == 1
+    assert 29 <= sleeps[0] <= 30
+
+
+def test_send_request_slows_down_rate_limiter(monkeypatch, sleeps):
+    session, calls = stub_session(monkeypatch, [make_response(429), make_response(200)])
+
+    send_request("GET", URL, session=session)
+
+    limiter = utils.get_rate_limiter(URL)
+    assert limiter.rate == limiter.max_rate / 2 + limiter.max_rate / 20
@@ -0,0 +1,210 @@
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from cisticola.base import ScraperResult
+from cisticola.scraper import RumbleScraper, rumble
+from cisticola.scraper.rumble import get_channel_videos
+
+CHANNEL_URL = "https://rumble.com/c/channel"
+
+CHANNEL = SimpleNamespace(id=1, url=CHANNEL_URL)
+
+#: Number of videos of each listing page
+PAGE_SIZE = 5
+
+#: Number of videos of the channel, newest first
+NUM_VIDEOS = 15
+
+NEWEST = datetime(2022, 6, 30, 12, tzinfo=timezone.utc)
+
+
+def video_date(i):
+    return NEWEST - timedelta(days=i)
+
+
+def listing_entry(i):
+    return f"""<li class="video-listing-entry"><article class="video-item">
+<h3 class="video-item--title">Video {i}</h3>
+<a class="video-item--a" href="/v{i}-video.html">
+<img class="video-item--img" src="https://example.com/{i}.jpg"></a>
+<span class="video-item--duration" data-value="1:00"></span>
+<time class="video-item--time" datetime="{video_date(i).isoformat()}">date</time>
+</article></li>"""
+
+
+def video_page(i):
+    return f"""<html><body>
+<div class="container content media-description">Description of video {i}</div>
+<script type="application/ld+json">[{{"embedUrl": "https://rumble.com/embed/v{i}/"}}]</script>
+</body></html>"""
+
+
+@pytest.fixture
+def requests_made(monkeypatch):
+    """Serve the listing and video pages of a channel of ``NUM_VIDEOS``
+    videos instead of requesting Rumble, and return the requested URLs."""
+
+    urls = []
+
+    def make_request(url, break_codes=None, **kwargs):
+        urls.append(url)
+
+        if "?page=" in url:
+            page = int(url.split("?page=")[1])
+            videos = range((page - 1) * PAGE_SIZE, min(page * PAGE_SIZE, NUM_VIDEOS))
+            if len(videos) == 0:
+                return SimpleNamespace(status_code=404, content=b"")
+
+            html = "<ul>" + "".join(listing_entry(i) for i in videos) + "</ul>"
+        else:
+            html = video_page(int(url.split("/v")[1].split("-")[0]))
+
+        return SimpleNamespace(status_code=200, content=html.encode())
+
+    monkeypatch.setattr(rumble, "make_request", make_request)
+
+    return urls
+
+
+def listing_pages(urls):
+    return [int(url.split("?page=")[1]) for url in urls if "?page=" in url]
+
+
+def video_pages(urls):
+    return [
+        int(url.split("/v")[1].split("-")[0]) for url in urls if "?page=" not in url
+    ]
+
+
+def video_ids(videos):
+    return [int(video["media_url"].split("/")[-2][1:]) for video in videos]
+
+
+def test_get_channel_videos_all(requests_made):
+    videos = list(get_channel_videos(CHANNEL_URL))
+
+    assert video_ids(videos) == list(range(NUM_VIDEOS))
+    assert videos[0]["content"] == "Description of video 0"
+    assert listing_pages(requests_made) == [1, 2, 3, 4]
+
+
+@pytest.mark.parametrize(
+    "since",
+    [
+        video_date(7),
+        video_date(7) + timedelta(seconds=1),
+        video_date(6) - timedelta(seconds=1),
+    ],
+)
+def test_get_channel_videos_stops_at_since(requests_made, since):
+    videos = list(get_channel_videos(CHANNEL_URL, since=since))
+
+    assert video_ids(videos) == list(range(7))
+    assert listing_pages(requests_made) == [1, 2]
+    assert sorted(video_pages(requests_made)) == list(range(7))
+
+
+def test_get_channel_videos_nothing_new(requests_made):
+    videos = list(get_channel_videos(CHANNEL_URL, since=video_date(0)))
+
+    assert videos == []
+    assert listing_pages(requests_made) == [1]
+    assert video_pages(requests_made) == []
+
+
+def test_get_channel_videos_naive_since(requests_made):
+    since = video_date(7).replace(tzinfo=None)
+
+    assert video_ids(get_channel_videos(CHANNEL_URL, since=since)) == list(range(7))
+
+
+@pytest.mark.parametrize(
+    "until, oldest_skipped",
+    [
+        (video_date(7), 7),
+        (video_date(7) + timedelta(seconds=1), 6),
+        (video_date(6) - timedelta(seconds=1), 6),
+    ],
+)
+def test_get_channel_videos_skips_until(requests_made, until, oldest_skipped):
+    videos = list(get_channel_videos(CHANNEL_URL, until=until))
+
+    assert video_ids(videos) == list(range(oldest_skipped + 1, NUM_VIDEOS))
+    # video pages are only fetched for the videos older than ``until``
+    assert sorted(video_pages(requests_made)) == video_ids(videos)
+
+
+def test_get_channel_videos_max_videos(requests_made):
+    pages = []
+
+    videos = list(
+        get_channel_videos(
+            CHANNEL_URL, until=video_date(2), max_videos=4, on_page=pages.append
+        )
+    )
+
+    # the remaining videos of the last listing page are scraped too
+    assert video_ids(videos) == list(range(3, 10))
+    assert listing_pages(requests_made) == [1, 2]
+    assert pages == [2, 3]
+
+
+def test_get_channel_videos_resumes_from_page(requests_made):
+    pages = []
+
+    videos = list(get_channel_videos(CHANNEL_URL, page=2, on_page=pages.append))
+
+    assert video_ids(videos) == list(range(5, NUM_VIDEOS))
+    assert listing_pages(requests_made) == [2, 3, 4]
+    assert pages == [3, 4]
+
+
+@pytest.fixture
+def scraper(requests_made, monkeypatch):
+    """RumbleScraper with a saved listing page of 3, whose saved pages are
+    recorded in ``scraper.cursors``."""
+
+    scraper = RumbleScraper()
+    scraper.cursors = []
+    monkeypatch.setattr(scraper, "get_cursor", lambda channel: {"page": 3})
+    monkeypatch.setattr(
+        scraper, "save_cursor", lambda channel, cursor: scraper.cursors.append(cursor)
+    )
+
+    return scraper
+
+
+def make_result(i):
+    return ScraperResult(
+        scraper=RumbleScraper.__version__,
+        platform="Rumble",
+        channel=1,
+        platform_id=f"v{i}",
+        date=video_date(i).replace(tzinfo=None),
+        raw_data="{}",
+        date_archived=datetime(2022, 7, 1),
+        archived_urls={},
+        media_archived=None,
+    )
+
+
+def test_get_posts_resumes_backfill_before_saved_page(scraper, requests_made):
+    scraper.max_backfill_videos = 2
+
+    posts = list(scraper.get_posts(CHANNEL, until=make_result(3)))
+
+    # the backfill starts one page before the saved page
+    assert listing_pages(requests_made) == [2]
+    assert [post.platform_id for post in posts] == [f"v{i}" for i in range(5, 10)]
+    assert scraper.cursors == [{"page": 3}]
+
+
+def test_get_posts_since(scraper, requests_made):
+    posts = list(scraper.get_posts(CHANNEL, since=make_result(7)))
+
+    assert [post.platform_id for post in posts] == [f"v{i}" for i in range(7)]
+    assert posts[0].date == video_date(0)
+    assert scraper.cursors == []